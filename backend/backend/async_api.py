@@ -0,0 +1,69 @@
+"""
+Async function views with the API's authentication.
+
+DRF 3.14 views are synchronous only, so the async endpoints are plain
+Django async views wrapped in async_api_view, which stands in for
+@api_view(methods) + @permission_classes([IsAuthenticated]): it runs the
+configured DRF authenticators (one thread hop, as JWT authentication reads
+the user row), answers 401/405 the way DRF would and hands the view a DRF
+Request. Views return Django responses; json_response renders data with
+the same JSON renderer as the rest of the API.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def _authenticate(drf_request):
+    """The request's user (AnonymousUser when no credentials were sent)"""
+    return drf_request.user
+
+
+def async_api_view(methods):
+    """Decorate an async view taking a DRF Request; only authenticated users get through"""
+    allowed = [method.upper() for method in methods]
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == 'OPTIONS':
+                response = HttpResponse()
+                response['Allow'] = ', '.join(allowed + ['OPTIONS'])
+                return response
+            if request.method not in allowed:
+                error = exceptions.MethodNotAllowed(request.method)
+                response = json_response({'detail': error.detail}, error.status_code)
+                response['Allow'] = ', '.join(allowed + ['OPTIONS'])
+                return response
+
+            authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+            drf_request = Request(request, authenticators=authenticators)
+            try:
+                user = await sync_to_async(_authenticate)(drf_request)
+                if not user or not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+            except (exceptions.AuthenticationFailed, exceptions.NotAuthenticated) as error:
+                data = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+                response = json_response(data, error.status_code)
+                header = authenticators[0].authenticate_header(request) if authenticators else None
+                if header:
+                    response['WWW-Authenticate'] = header
+                else:
+                    response.status_code = status.HTTP_403_FORBIDDEN
+                return response
+            return await view(drf_request, *args, **kwargs)
+
+        # django.views.decorators.csrf.csrf_exempt would hide the coroutine in Django 4.2
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
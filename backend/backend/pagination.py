@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+Pages are ordered newest first on (created_at, id) and the cursor holds
+the (created_at, id) of the row the page starts after, so every page is
+one index range scan of page_size + 1 rows: no COUNT(*) and no OFFSET,
+and a deep page costs the same as the first. The position is compared as
+
+    created_at <= t AND (created_at < t OR id < pk)
+
+where the first term bounds the index scan and the second only settles
+ties at the boundary timestamp.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on (created_at, id), newest first"""
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        if position is None:
+            queryset = queryset.order_by('-created_at', '-pk')
+        elif reverse:
+            # Previous page: the rows just newer than the position, nearest first
+            created_at, pk = position
+            queryset = queryset.filter(created_at__gte=created_at).filter(
+                Q(created_at__gt=created_at) | Q(pk__gt=pk)
+            ).order_by('created_at', 'pk')
+        else:
+            created_at, pk = position
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(pk__lt=pk)
+            ).order_by('-created_at', '-pk')
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving in one direction proves a page exists in the other
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        self.first = (rows[0].created_at, rows[0].pk) if rows else position
+        self.last = (rows[-1].created_at, rows[-1].pk) if rows else position
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def decode_cursor(self, request):
+        """Return ((created_at, id), reverse) for the request's cursor, or (None, False)"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            created_at, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(created_at)
+            if created_at is None or not isinstance(pk, int):
+                raise ValueError(encoded)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return (created_at, pk), bool(reverse)
+
+    def encode_cursor(self, position, reverse):
+        created_at, pk = position
+        token = json.dumps([created_at.isoformat(), pk, int(reverse)], separators=(',', ':'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            base64.urlsafe_b64encode(token.encode()).decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -66,6 +67,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Database
 # PostgreSQL configuration
@@ -80,6 +82,32 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory per process by default. Set REDIS_URL to share the cache
+# (occupancy index, map tiles, stats and response cache versions) and the
+# live feed's event stream between processes; any Redis-compatible server
+# that supports streams works. Extra options go to the
+# redis-py connection pool, so tests can swap in an in-process fake with
+# OPTIONS={'connection_class': fakeredis.FakeConnection}.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'park-savvy',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'park-savvy',
+            # The occupancy index keeps one entry per slot
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -124,7 +152,7 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
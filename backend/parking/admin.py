@@ -1,19 +1,19 @@
 from django.contrib import admin
-from .models import ParkingSpace, ParkingSlot, Booking
+from .models import ParkingSpace, ParkingSlot, Booking, DailySpaceStats
 
 @admin.register(ParkingSpace)
 class ParkingSpaceAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner', 'address', 'hourly_rate', 'is_active', 'created_at']
     list_filter = ['is_active', 'has_security', 'has_covered_parking', 'has_ev_charging', 'created_at']
     search_fields = ['name', 'address', 'owner__username']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['geohash', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'description', 'address', 'owner')
         }),
         ('Location', {
-            'fields': ('latitude', 'longitude')
+            'fields': ('latitude', 'longitude', 'geohash')
         }),
         ('Pricing', {
             'fields': ('hourly_rate', 'daily_rate')
@@ -87,3 +87,11 @@ class BookingAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+
+@admin.register(DailySpaceStats)
+class DailySpaceStatsAdmin(admin.ModelAdmin):
+    list_display = ['parking_space', 'day', 'bookings', 'completed_revenue', 'occupied_slot_hours', 'is_stale']
+    list_filter = ['is_stale', 'day']
+    search_fields = ['parking_space__name']
+    date_hierarchy = 'day'
+    readonly_fields = ['updated_at']
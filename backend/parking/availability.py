@@ -0,0 +1,293 @@
+"""
+availability.py
+
+Per-space, per-day availability bitmaps for window searches.
+
+For every (space, local day) the cache holds the space's available slots,
+each with its slot type and a bitmap of the day's BUCKET_MINUTES buckets:
+bit i is set when a confirmed/active booking overlaps bucket i. A window
+is answered for each day it touches with one AND against the window's
+bucket mask:
+
+- no set bit under the mask: the slot is free
+- a set bit in a bucket the window covers completely: the slot is taken
+  (that booking overlaps the bucket, so it overlaps the window)
+- set bits only in the window's partly covered first or last bucket:
+  undecided at bucket resolution, so those slots are checked exactly
+  against the occupancy index
+
+Windows on quarter-hour boundaries, as bookings are billed (see
+tariffs.py), never need the exact check.
+
+Bitmaps are built on demand from the occupancy index, for many spaces and
+days at once, and kept current by two kinds of version counters:
+
+- slot writes (availability, type, added or removed slots) change which
+  slots an entry lists, so they move the space to a new generation
+  (invalidate_spaces), retiring all of its cached days; entries are
+  stored under the generation read before they were built
+- booking writes only change the bits of the booked slots. apply_changes()
+  compares each slot's refreshed occupancy intervals with the previous
+  ones and, for slots whose intervals changed, bumps the slot's version
+  and then its space's booking version. Every entry records the booking
+  version it was last checked against and the slot version each slot's
+  bits were computed from. A read that finds an entry behind its space's
+  booking version compares the slot versions and recomputes only the
+  slots that moved, from their occupancy intervals, then writes the
+  entry back.
+
+Versions are read before the data they guard and writers bump a slot
+before its space, so bits computed from intervals older than a booking
+write are tagged with a version that write replaced: they are
+recomputed on the next read instead of served. Readers patching the same
+entry may overwrite each other's work, which only costs a later
+recompute. Entries expire with the occupancy index
+(occupancy.cache_timeout()), which bounds how long a per-process cache
+serves spaces changed by another process.
+
+Only searches around a location use the bitmaps; window searches without
+one could touch every active space and are answered in SQL
+(ParkingSpaceQuerySet.with_free_slot_count), and single-slot checks use
+the slot's occupancy intervals directly.
+"""
+
+import math
+import time as time_module
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import occupancy
+
+BUCKET_MINUTES = 15
+BUCKET_SECONDS = BUCKET_MINUTES * 60
+# space id, generation, day
+CACHE_KEY = 'availability:{}:{}:{}'
+GENERATION_KEY = 'availability:generation:{}'
+BOOKINGS_KEY = 'availability:bookings:{}'
+SLOT_KEY = 'availability:slot:{}'
+
+def _day_bounds(day):
+    """(start, end) timestamps of a local day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start.timestamp(), end.timestamp()
+
+
+def _days(start_time, end_time):
+    """Local days overlapping [start_time, end_time)"""
+    day = timezone.localtime(start_time).date()
+    last = timezone.localtime(end_time - timedelta(microseconds=1)).date()
+    days = []
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _buckets(start_ts, end_ts, day_start, day_end):
+    """(first, last) buckets of a day overlapped by [start_ts, end_ts), or None"""
+    start_ts, end_ts = max(start_ts, day_start), min(end_ts, day_end)
+    if start_ts >= end_ts:
+        return None
+    return (
+        int((start_ts - day_start) // BUCKET_SECONDS),
+        math.ceil((end_ts - day_start) / BUCKET_SECONDS) - 1,
+    )
+
+
+def _span(first, last):
+    return ((1 << (last - first + 1)) - 1) << first if last >= first else 0
+
+
+def _bits(intervals, day):
+    """Bitmap of the buckets of a day overlapped by (start_ts, end_ts, booking_id) intervals"""
+    day_start, day_end = _day_bounds(day)
+    bits = 0
+    for start_ts, end_ts, _ in intervals:
+        buckets = _buckets(start_ts, end_ts, day_start, day_end)
+        if buckets:
+            bits |= _span(*buckets)
+    return bits
+
+
+def _masks(start_ts, end_ts, day):
+    """
+    (mask, covered) for a window on a day: the buckets it overlaps, and
+    the buckets it overlaps completely
+    """
+    day_start, day_end = _day_bounds(day)
+    first, last = _buckets(start_ts, end_ts, day_start, day_end)
+    mask = _span(first, last)
+    if max(start_ts, day_start) > day_start + first * BUCKET_SECONDS:
+        first += 1
+    if min(end_ts, day_end) < min(day_start + (last + 1) * BUCKET_SECONDS, day_end):
+        last -= 1
+    return mask, _span(first, last)
+
+
+def _versions(keys):
+    """
+    {key: version} of version counters, starting missing ones from the
+    current time: never from a value that an evicted counter could have held
+    """
+    stored = cache.get_many(keys)
+    missing = [key for key in keys if key not in stored]
+    if missing:
+        for key in missing:
+            cache.add(key, time_module.time_ns(), timeout=None)
+        # Another process may have won the add, so read back what was stored
+        stored.update(cache.get_many(missing))
+    return stored
+
+
+def get_bitmaps(space_ids, days):
+    """
+    {(space_id, day): {slot_id: (slot_type, bits)}} for every combination,
+    building missing entries and bringing entries behind on bookings up to
+    date from the occupancy index
+    """
+    from .models import ParkingSlot
+
+    # Space versions first: a write after this point moves past what is read below
+    versions = _versions([
+        key.format(space_id) for space_id in space_ids for key in (GENERATION_KEY, BOOKINGS_KEY)
+    ])
+    bookings = {space_id: versions.get(BOOKINGS_KEY.format(space_id)) for space_id in space_ids}
+    keys = {
+        (space_id, day): CACHE_KEY.format(space_id, versions.get(GENERATION_KEY.format(space_id)), day)
+        for space_id in space_ids for day in days
+    }
+    cached = cache.get_many(keys.values())
+    entries = {pair: cached[key] for pair, key in keys.items() if key in cached}
+
+    behind = [pair for pair, entry in entries.items() if entry['bookings'] != bookings[pair[0]]]
+    missing = {space_id for space_id, day in keys if (space_id, day) not in entries}
+    if not behind and not missing:
+        return {pair: entry['slots'] for pair, entry in entries.items()}
+
+    slots = []
+    if missing:
+        slots = list(ParkingSlot.objects.filter(
+            parking_space_id__in=missing, is_available=True
+        ).order_by().values_list('pk', 'parking_space_id', 'slot_type'))
+    # Slot versions before the intervals they guard; only moved and new slots are loaded
+    slot_ids = {slot_id for pair in behind for slot_id in entries[pair]['versions']}
+    slot_ids.update(slot_id for slot_id, _, _ in slots)
+    stored = _versions([SLOT_KEY.format(slot_id) for slot_id in slot_ids]) if slot_ids else {}
+    slot_versions = {slot_id: stored.get(SLOT_KEY.format(slot_id)) for slot_id in slot_ids}
+    moved = {
+        slot_id for pair in behind
+        for slot_id, version in entries[pair]['versions'].items() if version != slot_versions[slot_id]
+    }
+    moved.update(slot_id for slot_id, _, _ in slots)
+    booked = occupancy.get_occupancy(list(moved)) if moved else {}
+
+    # Entries behind on bookings: recompute only the slots whose version moved
+    updated = {}
+    for space_id, day in behind:
+        entry = entries[(space_id, day)]
+        patched = {'bookings': bookings[space_id], 'slots': dict(entry['slots']), 'versions': {}}
+        for slot_id, version in entry['versions'].items():
+            if version != slot_versions[slot_id]:
+                slot_type, _ = entry['slots'][slot_id]
+                patched['slots'][slot_id] = (slot_type, _bits(booked[slot_id].intervals, day))
+            patched['versions'][slot_id] = slot_versions[slot_id]
+        updated[(space_id, day)] = patched
+
+    # Missing entries: build every available slot of the space
+    built = {
+        pair: {'bookings': bookings[pair[0]], 'slots': {}, 'versions': {}}
+        for pair in keys if pair not in entries
+    }
+    for slot_id, space_id, slot_type in slots:
+        for day in days:
+            entry = built.get((space_id, day))
+            if entry is not None:
+                entry['slots'][slot_id] = (slot_type, _bits(booked[slot_id].intervals, day))
+                entry['versions'][slot_id] = slot_versions[slot_id]
+    updated.update(built)
+
+    cache.set_many(
+        {keys[pair]: entry for pair, entry in updated.items()}, timeout=occupancy.cache_timeout()
+    )
+    entries.update(updated)
+    return {pair: entry['slots'] for pair, entry in entries.items()}
+
+
+def free_slots(space_ids, start_time, end_time, slot_type=None):
+    """{space_id: [free slot ids]}: available slots (of slot_type) with no blocking booking in the window"""
+    space_ids = list(space_ids)
+    days = _days(start_time, end_time)
+    start_ts, end_ts = start_time.timestamp(), end_time.timestamp()
+    masks = [_masks(start_ts, end_ts, day) for day in days]
+    bitmaps = get_bitmaps(space_ids, days)
+
+    result = {space_id: [] for space_id in space_ids}
+    undecided = []
+    for space_id in space_ids:
+        for slot_id, (kind, _) in bitmaps[(space_id, days[0])].items():
+            if slot_type and kind != slot_type:
+                continue
+            clear = True
+            for day, (mask, covered) in zip(days, masks):
+                _, bits = bitmaps[(space_id, day)].get(slot_id, (kind, None))
+                if bits is None:
+                    # Entries built across a slot change; settle it exactly
+                    clear = False
+                elif bits & covered:
+                    break
+                elif bits & mask:
+                    clear = False
+            else:
+                if clear:
+                    result[space_id].append(slot_id)
+                else:
+                    undecided.append((space_id, slot_id))
+
+    if undecided:
+        booked = occupancy.get_occupancy(slot_id for _, slot_id in undecided)
+        for space_id, slot_id in undecided:
+            if booked[slot_id].is_free(start_ts, end_ts):
+                result[space_id].append(slot_id)
+    return result
+
+
+def free_slot_counts(space_ids, start_time, end_time, slot_type=None):
+    """{space_id: number of free slots in the window}"""
+    return {
+        space_id: len(slot_ids)
+        for space_id, slot_ids in free_slots(space_ids, start_time, end_time, slot_type).items()
+    }
+
+
+def apply_changes(changes):
+    """
+    Move the slots whose occupancy changed, then their spaces, to new
+    versions so their cached bits are recomputed on the next read; changes
+    maps slot_id to (previous intervals or None when unknown, current
+    intervals).
+    """
+    from .models import ParkingSlot
+
+    changed = [
+        slot_id for slot_id, (previous, current) in changes.items()
+        if previous is None or sorted(map(tuple, previous)) != sorted(map(tuple, current))
+    ]
+    if changed:
+        space_ids = set(ParkingSlot.objects.filter(
+            pk__in=changed
+        ).order_by().values_list('parking_space_id', flat=True))
+        version = time_module.time_ns()
+        cache.set_many({SLOT_KEY.format(slot_id): version for slot_id in changed}, timeout=None)
+        version = time_module.time_ns()
+        cache.set_many({BOOKINGS_KEY.format(space_id): version for space_id in space_ids}, timeout=None)
+
+
+def invalidate_spaces(space_ids):
+    """Retire every cached day of the given spaces"""
+    # A fresh value rather than incr(), which would restart from an old
+    # generation (and revive its cached days) if the counter were evicted
+    generation = time_module.time_ns()
+    cache.set_many({GENERATION_KEY.format(space_id): generation for space_id in space_ids}, timeout=None)
@@ -0,0 +1,126 @@
+"""
+clustering.py
+
+Zoom-aware marker clustering for the map endpoint.
+
+Zoomed-out map views group active parking spaces into geohash tiles. Each
+tile carries aggregate space/slot counts, a price range and a centroid, and
+is cached on its own so panning only computes tiles not seen before.
+
+Tiles are versioned like cached responses: each tile has a ``tile:<geohash>``
+counter in response_cache, read before the tile is computed and part of its
+cache key, and the signal receivers in models.py bump the counters of every
+tile containing a changed space or slot. A tile computed from data older
+than a write is stored under the version the write replaced, so it is never
+read. With a per-process cache a bump only reaches the process that made
+the write, so tiles then expire after occupancy.LOCAL_CACHE_TIMEOUT.
+"""
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import Substr
+
+from . import geo, occupancy, response_cache
+from .models import ParkingSpace
+
+# Map zoom levels above this return individual markers instead of clusters
+CLUSTER_MAX_ZOOM = 15
+# tile geohash, version
+TILE_CACHE_KEY = 'map:tile:{}:{}'
+TILE_CACHE_TIMEOUT = 60 * 60
+MAX_TILES = 256
+
+
+def precision_for_zoom(zoom):
+    """Geohash precision whose cells are roughly a quarter of a map tile wide"""
+    # A web map tile spans 360 / 2**zoom degrees; a geohash of precision p
+    # spans 360 / 2**ceil(5p / 2) degrees of longitude.
+    precision = round((zoom + 2) * 2 / 5)
+    return max(1, min(precision, geo.GEOHASH_PRECISION - 1))
+
+
+def tile_scope(tile):
+    return f'tile:{tile}'
+
+
+def tile_cache_timeout():
+    """TILE_CACHE_TIMEOUT, or the short local timeout when bumps do not reach other processes"""
+    return TILE_CACHE_TIMEOUT if occupancy.is_shared_cache() else occupancy.LOCAL_CACHE_TIMEOUT
+
+
+def _compute_tiles(tiles, precision):
+    """Aggregate the given tiles (all of one precision) with one grouped query"""
+    rows = ParkingSpace.objects.filter(is_active=True)._in_cells(tiles).order_by().annotate(
+        tile=Substr('geohash', 1, precision)
+    ).values('tile').annotate(
+        space_count=Count('id'),
+        latitude=Avg('latitude'),
+        longitude=Avg('longitude'),
+        slot_total=Sum('total_slots'),
+        slot_available=Sum('available_slots'),
+        min_hourly_rate=Min('hourly_rate'),
+        max_hourly_rate=Max('hourly_rate'),
+    )
+
+    results = {tile: None for tile in tiles}
+    for row in rows:
+        south, west, north, east = geo.decode_bounds(row['tile'])
+        results[row['tile']] = {
+            'tile': row['tile'],
+            'latitude': float(row['latitude']),
+            'longitude': float(row['longitude']),
+            'bounds': [south, west, north, east],
+            'space_count': row['space_count'],
+            'total_slots': row['slot_total'],
+            'available_slots': row['slot_available'],
+            'min_hourly_rate': float(row['min_hourly_rate']),
+            'max_hourly_rate': float(row['max_hourly_rate']),
+        }
+    return results
+
+
+def get_clusters(south, west, north, east, zoom):
+    """Return cluster dicts for every non-empty tile in the bounding box"""
+    precision = precision_for_zoom(zoom)
+    tiles = None
+    while precision >= 1:
+        tiles = geo.cells_at_precision(south, west, north, east, precision, max_cells=MAX_TILES)
+        if tiles is not None:
+            break
+        precision -= 1
+    if not tiles:
+        return []
+
+    # Versions first: a write after this point moves past the keys used below
+    current = response_cache.versions([tile_scope(tile) for tile in tiles])
+    keys = {tile: TILE_CACHE_KEY.format(tile, version) for tile, version in zip(tiles, current)}
+    cached = cache.get_many(keys.values())
+
+    results = {}
+    missing = []
+    for tile, key in keys.items():
+        if key in cached:
+            results[tile] = cached[key]
+        else:
+            missing.append(tile)
+
+    if missing:
+        computed = _compute_tiles(missing, precision)
+        cache.set_many(
+            {keys[tile]: value for tile, value in computed.items()},
+            timeout=tile_cache_timeout()
+        )
+        results.update(computed)
+
+    return [results[tile] for tile in tiles if results.get(tile)]
+
+
+def invalidate_tiles(*geohashes):
+    """Move every tile that contains one of the given geohashes to a new version"""
+    scopes = {
+        tile_scope(geohash[:precision])
+        for geohash in geohashes if geohash
+        for precision in range(1, len(geohash) + 1)
+    }
+    if scopes:
+        response_cache.bump(scopes)
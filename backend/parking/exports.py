@@ -0,0 +1,151 @@
+"""
+exports.py
+
+Streaming booking exports for owners.
+
+Rows are read with values_list() through a server-side cursor
+(.iterator(chunk_size=...)) and written out as CSV or NDJSON a chunk at a
+time, so neither model instances nor the whole export are ever held in
+memory: the footprint stays flat however many bookings an owner has.
+
+Under ASGI, Django reads a synchronous streaming body into a list before
+sending any of it, so the export view wraps the chunks in aiter_chunks(),
+which produces them one thread hop at a time.
+"""
+
+import csv
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Booking
+
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (column name, Booking lookup) in export order
+COLUMNS = [
+    ('booking_reference', 'booking_reference'),
+    ('status', 'status'),
+    ('parking_space_id', 'parking_slot__parking_space_id'),
+    ('parking_space_name', 'parking_slot__parking_space__name'),
+    ('slot_number', 'parking_slot__slot_number'),
+    ('user_name', 'user__username'),
+    ('vehicle_number', 'vehicle_number'),
+    ('vehicle_type', 'vehicle_type'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('actual_start_time', 'actual_start_time'),
+    ('actual_end_time', 'actual_end_time'),
+    ('hourly_rate', 'hourly_rate'),
+    ('total_amount', 'total_amount'),
+    ('paid_amount', 'paid_amount'),
+    ('created_at', 'created_at'),
+]
+
+
+def owner_bookings(owner, start_date=None, end_date=None, statuses=None):
+    """
+    Booking rows (tuples in COLUMNS order) on the owner's spaces, oldest
+    first, optionally limited to bookings starting within [start_date,
+    end_date] and to the given statuses.
+    """
+    bookings = Booking.objects.filter(parking_slot__parking_space__owner=owner)
+    # Half-open local-day bounds rather than __date lookups so the time indexes apply
+    if start_date:
+        bookings = bookings.filter(
+            start_time__gte=timezone.make_aware(datetime.combine(start_date, time.min))
+        )
+    if end_date:
+        bookings = bookings.filter(
+            start_time__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+        )
+    if statuses:
+        bookings = bookings.filter(status__in=statuses)
+    return bookings.order_by('start_time', 'id').values_list(
+        *[lookup for _, lookup in COLUMNS]
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Lines:
+    """File-like sink for csv.writer that keeps what was written until taken"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def take(self):
+        text = ''.join(self.lines)
+        self.lines = []
+        return text
+
+
+# Positions of the datetime columns, written as ISO 8601
+_DATETIMES = [
+    index for index, (_, lookup) in enumerate(COLUMNS)
+    if lookup in ('start_time', 'end_time', 'actual_start_time', 'actual_end_time', 'created_at')
+]
+
+
+def _chunks(rows):
+    """Lists of up to CHUNK_SIZE rows, with datetimes in ISO 8601"""
+    rows = iter(rows)
+    while True:
+        chunk = [list(row) for row in islice(rows, CHUNK_SIZE)]
+        if not chunk:
+            return
+        for row in chunk:
+            for index in _DATETIMES:
+                if row[index] is not None:
+                    row[index] = row[index].isoformat()
+        yield chunk
+
+
+def stream_csv(rows):
+    """CSV text chunks: a header line, then one line per row"""
+    sink = _Lines()
+    writer = csv.writer(sink)
+    writer.writerow([name for name, _ in COLUMNS])
+    yield sink.take()
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield sink.take()
+
+
+def stream_ndjson(rows):
+    """Newline-delimited JSON chunks, one object per row"""
+    names = [name for name, _ in COLUMNS]
+    encode = DjangoJSONEncoder(separators=(',', ':')).encode
+    for chunk in _chunks(rows):
+        yield ''.join([encode(dict(zip(names, row))) + '\n' for row in chunk])
+
+
+async def aiter_chunks(chunks):
+    """
+    Async iterator over a chunk generator. Each chunk is produced in a
+    thread-sensitive thread hop, so the server-side cursor stays on the
+    request's one connection.
+    """
+    produce = sync_to_async(next)
+    try:
+        while True:
+            chunk = await produce(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,172 @@
+"""
+geo.py
+
+Geohash helpers for distance-based parking search without PostGIS.
+
+ParkingSpace stores the geohash of its coordinates in an indexed column.
+A radius or bounding-box search first narrows rows to a handful of geohash
+prefixes (an index range scan on a single column), then filters and orders
+the survivors by exact haversine distance computed in SQL.
+"""
+
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+MAX_BOUNDS_CELLS = 32
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    """Return (south, west, north, east) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bounds = lng_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if (value >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a geohash cell"""
+    bits = precision * 5
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _wrap_longitude(longitude):
+    return ((longitude + 180.0) % 360.0) - 180.0
+
+
+def neighbours(geohash):
+    """Return the cell and its eight neighbours"""
+    precision = len(geohash)
+    south, west, north, east = decode_bounds(geohash)
+    height, width = north - south, east - west
+    center_lat, center_lng = (south + north) / 2, (west + east) / 2
+
+    cells = set()
+    for dlat in (-1, 0, 1):
+        lat = center_lat + dlat * height
+        if not -90.0 <= lat <= 90.0:
+            continue
+        for dlng in (-1, 0, 1):
+            lng = _wrap_longitude(center_lng + dlng * width)
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def cells_for_radius(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose union covers a circle around a point.
+
+    Uses the finest precision whose cells are at least radius_km across, so
+    the point's cell plus its neighbours contain the whole circle. Returns
+    None when the radius is too large for any precision to cover.
+    """
+    lat_scale = math.cos(math.radians(min(abs(latitude) + radius_km / KM_PER_DEGREE, 90.0)))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE >= radius_km and width * KM_PER_DEGREE * lat_scale >= radius_km:
+            return neighbours(encode(latitude, longitude, precision))
+    return None
+
+
+def cells_at_precision(south, west, north, east, precision, max_cells=MAX_BOUNDS_CELLS):
+    """
+    Geohash cells of one precision covering a bounding box, or None if more
+    than max_cells are needed (or the box crosses the antimeridian).
+    """
+    if west > east or south > north:
+        return None
+    height, width = cell_size(precision)
+    rows = math.floor((north + 90.0) / height) - math.floor((south + 90.0) / height) + 1
+    cols = math.floor((east + 180.0) / width) - math.floor((west + 180.0) / width) + 1
+    if rows * cols > max_cells:
+        return None
+
+    first_south, first_west, _, _ = decode_bounds(encode(south, west, precision))
+    cells = set()
+    for row in range(rows):
+        lat = min(first_south + (row + 0.5) * height, 90.0)
+        for col in range(cols):
+            lng = _wrap_longitude(first_west + (col + 0.5) * width)
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def cells_for_bounds(south, west, north, east, max_cells=MAX_BOUNDS_CELLS):
+    """
+    Geohash prefixes covering a bounding box, at the finest precision that
+    needs no more than max_cells cells. Returns None if no precision fits.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cells = cells_at_precision(south, west, north, east, precision, max_cells)
+        if cells is not None:
+            return cells
+    return None
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two coordinates in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_expression(latitude, longitude):
+    """SQL expression for the haversine distance (km) from a point to each row"""
+    row_lat = Radians(Cast(F('latitude'), FloatField()))
+    row_lng = Radians(Cast(F('longitude'), FloatField()))
+    phi = math.radians(latitude)
+    lam = math.radians(longitude)
+
+    a = (
+        Power(Sin((row_lat - phi) / 2), 2) +
+        math.cos(phi) * Cos(row_lat) * Power(Sin((row_lng - lam) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), Value(1.0)))
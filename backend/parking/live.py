@@ -0,0 +1,412 @@
+"""
+live.py
+
+Server-sent events feed of slot availability changes.
+
+Clients subscribe to topics: single parking spaces (``space:<id>``) or map
+regions (``region:<geohash prefix>``, as in response_cache). Every event
+is published to its space and to each prefix of the space's geohash, so a
+subscription to any cell of a map view sees the changes beneath it.
+
+Events are published by the signal receivers in models.py once the
+writing transaction commits:
+
+- ``slot``     a slot's is_available changed; carries the space's
+               available/total slot counters after the change
+- ``booking``  a booking was confirmed, cancelled, completed or marked a
+               no-show; carries the slot and window it blocks (or no
+               longer blocks)
+
+With REDIS_URL set, events go through a Redis stream (RedisBroker), so
+every process streams the writes of every other process, including the
+advance_bookings command. Without it the broker is in-process (Broker):
+each process only streams the writes it commits itself, which is enough
+for a single process and for tests.
+
+Either way the last EVENT_BACKLOG events are kept so a reconnecting client
+can resume from its Last-Event-ID. A client whose id cannot be resumed
+(too far behind, or from another process of an in-process broker) is sent
+a ``reset`` event and should refetch the map or space. Publishing returns
+before touching the database when nobody is subscribed.
+"""
+
+import asyncio
+import json
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import geo
+
+EVENT_BACKLOG = 1000
+STREAM_KEY = 'park-savvy:live:events'
+# Processes with subscribers, scored by when their registration expires
+LISTENERS_KEY = 'park-savvy:live:listeners'
+# Events are still published this long after the last subscriber left, so
+# clients reconnecting after a stream ends can resume without a gap
+RESUME_GRACE_SECONDS = 30
+LISTEN_BLOCK_MILLISECONDS = 5000
+QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+# Django 4.2 does not notice an ASGI client going away mid-stream, so
+# streams end on their own and EventSource reconnects (and resumes)
+STREAM_SECONDS = 5 * 60
+RETRY_MILLISECONDS = 3000
+
+
+def space_topic(space_id):
+    return f'space:{space_id}'
+
+
+def region_topic(prefix):
+    return f'region:{prefix}'
+
+
+def topics_for_bounds(south, west, north, east):
+    """Region topics covering a bounding box (the root region when it spans too many cells)"""
+    cells = geo.cells_for_bounds(south, west, north, east)
+    if cells is None:
+        return {region_topic('')}
+    return {region_topic(cell) for cell in cells}
+
+
+def _event_topics(space_id, geohash):
+    topics = {space_topic(space_id)}
+    topics.update(region_topic(geohash[:length]) for length in range(len(geohash or '') + 1))
+    return topics
+
+
+def encode_data(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def format_event(event_id, event_type, data=None, payload=None):
+    """One SSE message, from data or its already encoded payload"""
+    if payload is None:
+        payload = encode_data(data)
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+class Subscription:
+    """One client's queue of formatted events, fed from any thread"""
+
+    def __init__(self, broker, topics, loop=None):
+        self.broker = broker
+        self.topics = topics
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+        # Events up to this one came in the backlog (RedisBroker)
+        self.resume_after = None
+
+    def deliver(self, message):
+        """Queue a message (runs on the subscriber's event loop)"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind has to refetch anyway
+            self.overflowed = True
+
+    async def stream(self, backlog, heartbeat=HEARTBEAT_SECONDS, duration=STREAM_SECONDS):
+        """SSE text: the backlog, then live events with heartbeat comments in between"""
+        try:
+            yield f'retry: {RETRY_MILLISECONDS}\n\n'
+            for message in backlog:
+                yield message
+            deadline = time.monotonic() + duration
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    message = await asyncio.wait_for(self.queue.get(), min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                if self.overflowed:
+                    self.overflowed = False
+                    while not self.queue.empty():
+                        self.queue.get_nowait()
+                    message = self.broker.reset_message()
+                yield message
+        finally:
+            self.broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process publish/subscribe with a bounded backlog for resumption"""
+
+    def __init__(self, backlog=EVENT_BACKLOG):
+        self.epoch = secrets.token_hex(4)
+        self.sequence = 0
+        self.recent = deque(maxlen=backlog)
+        self.subscribers = defaultdict(set)
+        self.idle_since = float('-inf')
+        self.lock = threading.Lock()
+
+    def _event_id(self, sequence):
+        return f'{self.epoch}-{sequence}'
+
+    def reset_message(self):
+        with self.lock:
+            return format_event(self._event_id(self.sequence), 'reset', {})
+
+    def has_subscribers(self):
+        """Whether anyone is subscribed, or was recently enough to resume from the backlog"""
+        with self.lock:
+            return bool(self.subscribers) or time.monotonic() < self.idle_since + RESUME_GRACE_SECONDS
+
+    def _subscribers_of(self, topics):
+        """Local subscribers of any of the topics (call with the lock held)"""
+        subscribers = set()
+        for topic in topics:
+            subscribers.update(self.subscribers.get(topic, ()))
+        return subscribers
+
+    def _deliver(self, subscribers, message):
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, message)
+            except RuntimeError:
+                # Its event loop is gone without the stream being closed
+                self.unsubscribe(subscriber)
+
+    def publish(self, topics, event_type, data):
+        """Send an event to every subscriber of any of the topics"""
+        with self.lock:
+            self.sequence += 1
+            message = format_event(self._event_id(self.sequence), event_type, data)
+            self.recent.append((self.sequence, topics, message))
+            subscribers = self._subscribers_of(topics)
+        self._deliver(subscribers, message)
+
+    def publish_many(self, events):
+        """publish() each of a list of (topics, event_type, data) events"""
+        for topics, event_type, data in events:
+            self.publish(topics, event_type, data)
+
+    def subscribe(self, topics, last_event_id=None, loop=None):
+        """
+        Register a subscription whose events are read on loop (by default
+        the running one).
+
+        Returns (subscription, backlog): the messages after last_event_id
+        on the subscription's topics, or a single reset message when
+        last_event_id cannot be resumed from.
+        """
+        subscription = Subscription(self, set(topics), loop)
+        with self.lock:
+            for topic in subscription.topics:
+                self.subscribers[topic].add(subscription)
+            backlog = []
+            if last_event_id:
+                epoch, _, sequence = last_event_id.rpartition('-')
+                oldest = self.recent[0][0] if self.recent else self.sequence + 1
+                if epoch == self.epoch and sequence.isdigit() and int(sequence) >= oldest - 1:
+                    backlog = [
+                        message for event_sequence, event_topics, message in self.recent
+                        if event_sequence > int(sequence) and not subscription.topics.isdisjoint(event_topics)
+                    ]
+                else:
+                    backlog = [format_event(self._event_id(self.sequence), 'reset', {})]
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[topic]
+            if not self.subscribers:
+                self.idle_since = time.monotonic()
+
+
+def _stream_id(value):
+    """A Redis stream entry id as a comparable (milliseconds, sequence) pair, or None"""
+    milliseconds, _, sequence = (value or '').partition('-')
+    if not (milliseconds.isdigit() and sequence.isdigit()):
+        return None
+    return int(milliseconds), int(sequence)
+
+
+class RedisBroker(Broker):
+    """
+    Broker shared by every process through a Redis stream.
+
+    publish() appends to the stream, trimmed to about EVENT_BACKLOG
+    entries, and the entry ids are the event ids, so a client can resume on
+    any process. Each process that has subscribers runs one listener thread
+    that reads the stream and hands new entries to its local subscribers,
+    and registers the process in LISTENERS_KEY so that publishers anywhere
+    can tell whether anyone is listening.
+    """
+
+    def __init__(self, client, backlog=EVENT_BACKLOG):
+        super().__init__(backlog)
+        self.client = client
+        self.backlog = backlog
+        self.token = secrets.token_hex(8)
+        self.listener = None
+        self.listener_lock = threading.Lock()
+        # Id of the last stream entry the listener has read
+        self.position = '0-0'
+
+    def reset_message(self):
+        return format_event(self.position, 'reset', {})
+
+    def has_subscribers(self):
+        if super().has_subscribers():
+            return True
+        return self.client.zcount(LISTENERS_KEY, time.time(), '+inf') > 0
+
+    def publish(self, topics, event_type, data):
+        self.publish_many([(topics, event_type, data)])
+
+    def publish_many(self, events):
+        if not events:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for topics, event_type, data in events:
+            pipeline.xadd(STREAM_KEY, {
+                'topics': json.dumps(sorted(topics)), 'type': event_type, 'data': encode_data(data),
+            }, maxlen=self.backlog, approximate=True)
+        pipeline.execute()
+
+    def _register(self):
+        """Register (or extend) this process as a listener; it lapses RESUME_GRACE_SECONDS later"""
+        self.client.zadd(LISTENERS_KEY, {self.token: time.time() + RESUME_GRACE_SECONDS})
+
+    def _start_listener(self):
+        with self.listener_lock:
+            if self.listener is None:
+                latest = self.client.xrevrange(STREAM_KEY, count=1)
+                self.position = latest[0][0] if latest else '0-0'
+                self.listener = threading.Thread(target=self._listen, name='live-listener', daemon=True)
+                self.listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                with self.lock:
+                    active = bool(self.subscribers)
+                if active:
+                    self._register()
+                self.client.zremrangebyscore(LISTENERS_KEY, '-inf', time.time())
+                entries = self.client.xread(
+                    {STREAM_KEY: self.position}, count=self.backlog, block=LISTEN_BLOCK_MILLISECONDS
+                )
+            except Exception:
+                # Redis is unavailable; keep trying, subscribers reset when they resume
+                time.sleep(1)
+                continue
+            for _, stream_entries in entries or ():
+                for entry_id, fields in stream_entries:
+                    self.position = entry_id
+                    topics = json.loads(fields['topics'])
+                    message = format_event(entry_id, fields['type'], payload=fields['data'])
+                    with self.lock:
+                        subscribers = self._subscribers_of(topics)
+                    sequence = _stream_id(entry_id)
+                    self._deliver([
+                        subscriber for subscriber in subscribers
+                        if subscriber.resume_after is None or sequence > subscriber.resume_after
+                    ], message)
+
+    def subscribe(self, topics, last_event_id=None, loop=None):
+        """
+        Register a subscription; returns (subscription, backlog) as
+        Broker.subscribe does, with the backlog read from the stream.
+        Makes blocking Redis calls, so async callers run it in a thread.
+        """
+        self._start_listener()
+        self._register()
+        subscription = Subscription(self, set(topics), loop)
+        # Registered before the backlog is read, so every event is in the
+        # backlog or delivered live; resume_after drops those that are both
+        with self.lock:
+            for topic in subscription.topics:
+                self.subscribers[topic].add(subscription)
+        if not last_event_id:
+            return subscription, []
+
+        resume = _stream_id(last_event_id)
+        oldest = self.client.xrange(STREAM_KEY, count=1)
+        if resume is None or not oldest or resume < _stream_id(oldest[0][0]):
+            return subscription, [self.reset_message()]
+        backlog = []
+        subscription.resume_after = resume
+        for entry_id, fields in self.client.xrange(STREAM_KEY, min=last_event_id):
+            subscription.resume_after = max(subscription.resume_after, _stream_id(entry_id))
+            if entry_id != last_event_id and not subscription.topics.isdisjoint(json.loads(fields['topics'])):
+                backlog.append(format_event(entry_id, fields['type'], payload=fields['data']))
+        return subscription, backlog
+
+
+def _create_broker():
+    if settings.REDIS_URL:
+        import redis
+        # The cache's connection pool options apply here too (see settings)
+        options = settings.CACHES['default'].get('OPTIONS', {})
+        return RedisBroker(redis.Redis.from_url(settings.REDIS_URL, decode_responses=True, **options))
+    return Broker()
+
+
+broker = _create_broker()
+
+
+def publish_slot_changes(slot_ids):
+    """Publish the current availability of the given slots with their spaces' counters"""
+    from .models import ParkingSlot
+
+    if not broker.has_subscribers():
+        return
+    rows = ParkingSlot.objects.filter(pk__in=slot_ids).values_list(
+        'pk', 'slot_number', 'is_available', 'parking_space_id', 'parking_space__geohash',
+        'parking_space__available_slots', 'parking_space__total_slots'
+    )
+    broker.publish_many([
+        (_event_topics(space_id, geohash), 'slot', {
+            'space_id': space_id,
+            'slot_id': slot_id,
+            'slot_number': slot_number,
+            'is_available': is_available,
+            'available_slots': available_slots,
+            'total_slots': total_slots,
+        })
+        for slot_id, slot_number, is_available, space_id, geohash, available_slots, total_slots in rows
+    ])
+
+
+def publish_booking_changes(events):
+    """
+    Publish booking status changes; events are (booking_id, slot_id, status,
+    start_time, end_time, blocking) tuples.
+    """
+    from .models import ParkingSlot
+
+    if not broker.has_subscribers():
+        return
+    spaces = {
+        slot_id: (space_id, geohash)
+        for slot_id, space_id, geohash in ParkingSlot.objects.filter(
+            pk__in={event[1] for event in events}
+        ).values_list('pk', 'parking_space_id', 'parking_space__geohash')
+    }
+    published = []
+    for booking_id, slot_id, status, start_time, end_time, blocking in events:
+        if slot_id not in spaces:
+            continue
+        space_id, geohash = spaces[slot_id]
+        published.append((_event_topics(space_id, geohash), 'booking', {
+            'space_id': space_id,
+            'slot_id': slot_id,
+            'booking_id': booking_id,
+            'status': status,
+            'start_time': start_time,
+            'end_time': end_time,
+            'blocking': blocking,
+        }))
+    broker.publish_many(published)
@@ -0,0 +1,37 @@
+"""Move bookings on to active, completed or no-show as their windows pass."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from parking import lifecycle
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply due booking status transitions in bounded batches. '
+        'Schedule every minute or run with --interval; concurrent runs are safe.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=lifecycle.BATCH_SIZE,
+            help='Bookings moved per UPDATE (and per transaction)'
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running, starting a pass every this many seconds'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        while True:
+            started = time.monotonic()
+            moved = lifecycle.run(batch_size=options['batch_size'])
+            summary = ', '.join(
+                f'{count} {from_status} -> {to_status}' for (from_status, to_status), count in moved.items()
+            )
+            self.stdout.write(self.style.SUCCESS(f'Moved {sum(moved.values())} bookings ({summary})'))
+            if options['interval'] is None:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,36 @@
+"""Populate ParkingSpace.geohash for rows saved before the column existed."""
+from django.core.management.base import BaseCommand
+
+from parking import geo
+from parking.models import ParkingSpace
+
+
+class Command(BaseCommand):
+    help = 'Compute the geohash spatial index column for parking spaces missing it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute every row, not only those with an empty geohash'
+        )
+
+    def handle(self, *args, **options):
+        queryset = ParkingSpace.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(geohash='')
+
+        batch = []
+        updated = 0
+        for space in queryset.only('pk', 'latitude', 'longitude').iterator(chunk_size=options['batch_size']):
+            space.geohash = geo.encode(float(space.latitude), float(space.longitude))
+            batch.append(space)
+            if len(batch) >= options['batch_size']:
+                ParkingSpace.objects.bulk_update(batch, ['geohash'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            ParkingSpace.objects.bulk_update(batch, ['geohash'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated geohash for {updated} parking spaces'))
@@ -0,0 +1,114 @@
+"""
+Concurrency benchmark for the booking_no_overlap exclusion constraint.
+
+Runs against the configured PostgreSQL database. For each round, a group
+of threads races to book the same slot for the same window through
+BookingSerializer.create (skipping the pre-insert availability check so
+every request reaches the database). Exactly one booking per round must
+succeed; the rest must come back as the usual validation error.
+"""
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework import serializers
+
+from parking.models import Booking, ParkingSlot, ParkingSpace
+from parking.serializers import BookingSerializer
+
+User = get_user_model()
+
+
+class _Request:
+    def __init__(self, user):
+        self.user = user
+
+
+class Command(BaseCommand):
+    help = 'Race concurrent bookings for the same slot and window against PostgreSQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def setup_fixtures(self):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            username=f'bench-{tag}', email=f'bench-{tag}@example.com', password=uuid.uuid4().hex
+        )
+        space = ParkingSpace.objects.create(
+            name=f'Bench {tag}', address='Benchmark', latitude=0, longitude=0,
+            owner=user, hourly_rate=1
+        )
+        slot = ParkingSlot.objects.create(parking_space=space, slot_number='1')
+        return user, slot
+
+    def book(self, user, slot, start_time, results, barrier):
+        serializer = BookingSerializer(context={'request': _Request(user)})
+        data = {
+            'parking_slot': slot,
+            'vehicle_number': 'BENCH',
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours=1),
+            'status': 'confirmed',
+        }
+        barrier.wait()
+        try:
+            serializer.create(data)
+            results.append('booked')
+        except serializers.ValidationError:
+            results.append('conflict')
+        except Exception as exc:
+            results.append(f'error: {exc}')
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark needs PostgreSQL (the exclusion constraint is Postgres-only)')
+
+        user, slot = self.setup_fixtures()
+        threads_per_round = options['threads']
+        base = timezone.now() + timedelta(days=1)
+        failures = 0
+        attempts = 0
+        started = time.perf_counter()
+
+        try:
+            for round_number in range(options['rounds']):
+                results = []
+                barrier = threading.Barrier(threads_per_round)
+                start_time = base + timedelta(hours=2 * round_number)
+                threads = [
+                    threading.Thread(target=self.book, args=(user, slot, start_time, results, barrier))
+                    for _ in range(threads_per_round)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                attempts += len(results)
+                booked = results.count('booked')
+                errors = [result for result in results if result.startswith('error')]
+                if booked != 1 or errors:
+                    failures += 1
+                    self.stderr.write(f'Round {round_number}: {booked} bookings succeeded, errors: {errors[:3]}')
+            elapsed = time.perf_counter() - started
+        finally:
+            stored = Booking.objects.filter(parking_slot=slot).count()
+            user.delete()
+
+        self.stdout.write(
+            f'{attempts} booking attempts in {elapsed:.2f}s '
+            f'({attempts / elapsed:.0f} attempts/s, {threads_per_round} concurrent per round)'
+        )
+        self.stdout.write(f'{stored} bookings stored for {options["rounds"]} rounds')
+        if failures or stored != options['rounds']:
+            raise CommandError(f'{failures} rounds violated the one-booking-per-window rule')
+        self.stdout.write(self.style.SUCCESS('Exclusion constraint held under concurrent load'))
@@ -0,0 +1,256 @@
+"""
+Concurrent load benchmark of the WSGI and ASGI entry points.
+
+Replays one mix of search, map and slot availability requests through
+backend.wsgi.application on a pool of worker threads (a threaded WSGI
+server) and through backend.asgi.application as concurrent tasks on one
+event loop (an ASGI server), and reports requests/second and latency
+percentiles for each at every concurrency level.
+
+Requests are made in process, without a network server, against the data
+already in the database (see seed_parking), authenticated with a JWT for
+an existing user. The response cache is cleared before each run and the
+request parameters are drawn at random from the seeded spaces and slots,
+so most requests reach the database.
+"""
+import asyncio
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from parking.models import ParkingSlot, ParkingSpace
+
+User = get_user_model()
+
+HOST = 'localhost'
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _request_mix(count, seed):
+    """(label, path, query string) for count requests spread over the three endpoints"""
+    rng = random.Random(seed)
+    points = list(ParkingSpace.objects.filter(is_active=True).values_list('latitude', 'longitude')[:5000])
+    slot_ids = list(ParkingSlot.objects.values_list('pk', flat=True)[:5000])
+    if not points or not slot_ids:
+        raise CommandError('No parking data to query; run seed_parking first')
+
+    start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    requests = []
+    for index in range(count):
+        latitude, longitude = (float(value) for value in rng.choice(points))
+        window_start = start + timedelta(hours=rng.randint(0, 72))
+        window = {
+            'start_time': window_start.isoformat(),
+            'end_time': (window_start + timedelta(hours=2)).isoformat(),
+        }
+        kind = index % 3
+        if kind == 0:
+            requests.append(('search', reverse('parking:space-search'), urlencode({
+                'latitude': f'{latitude:.6f}', 'longitude': f'{longitude:.6f}',
+                'radius': rng.choice([1, 2, 5]), **window,
+            })))
+        elif kind == 1:
+            half = rng.choice([0.01, 0.02, 0.05])
+            requests.append(('map', reverse('parking:map-data'), urlencode({
+                'bounds': f'{latitude - half:.5f},{longitude - half:.5f},{latitude + half:.5f},{longitude + half:.5f}',
+                'zoom': 16,
+            })))
+        else:
+            slot_id = rng.choice(slot_ids)
+            requests.append((
+                'availability',
+                reverse('parking:parkingslot-availability', kwargs={'pk': slot_id}),
+                urlencode(window),
+            ))
+    return requests
+
+
+def _wsgi_call(application, path, query, token):
+    """Run one request through the WSGI application and return its status code"""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return statuses[0]
+
+
+async def _asgi_call(application, path, query, token):
+    """Run one request through the ASGI application and return its status code"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(b'host', HOST.encode()), (b'authorization', f'Bearer {token}'.encode())],
+        'server': (HOST, 80),
+        'client': ('127.0.0.1', 0),
+    }
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+def run_wsgi(requests, concurrency, token):
+    from backend.wsgi import application
+
+    def timed(request):
+        label, path, query = request
+        started = time.perf_counter()
+        status = _wsgi_call(application, path, query, token)
+        return label, status, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, requests))
+    return results, time.perf_counter() - started
+
+
+def run_asgi(requests, concurrency, token):
+    from backend.asgi import application
+
+    async def main():
+        queue = asyncio.Queue()
+        for request in requests:
+            queue.put_nowait(request)
+        results = []
+
+        async def worker():
+            while not queue.empty():
+                label, path, query = queue.get_nowait()
+                started = time.perf_counter()
+                status = await _asgi_call(application, path, query, token)
+                results.append((label, status, (time.perf_counter() - started) * 1000))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def summarize(results, elapsed):
+    """requests/second and latency percentiles, overall and per endpoint"""
+    def stats(timings):
+        return {
+            'requests': len(timings),
+            'ms_p50': round(statistics.median(timings), 2),
+            'ms_p99': round(_percentile(timings, 0.99), 2),
+        }
+
+    labels = sorted({label for label, _, _ in results})
+    return {
+        'rps': round(len(results) / elapsed, 1),
+        'errors': sum(1 for _, status, _ in results if status != 200),
+        **stats([ms for _, _, ms in results]),
+        'endpoints': {
+            label: stats([ms for name, _, ms in results if name == label]) for label in labels
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/second and p99 latency of the WSGI and ASGI entry points under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', default='1,8,32',
+            help='Comma-separated numbers of concurrent requests, one run per level and entry point'
+        )
+        parser.add_argument('--requests', type=int, default=300, help='Requests per run')
+        parser.add_argument('--user', help='Username to authenticate as (default: the first active user)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the request mix')
+        parser.add_argument('--report', help='Where to write a JSON report')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to authenticate as')
+        token = str(AccessToken.for_user(user))
+
+        requests = _request_mix(options['requests'], options['seed'])
+        # The command's own connection is not used by the workers
+        connections.close_all()
+
+        runs = []
+        for concurrency in [int(level) for level in options['concurrency'].split(',') if level]:
+            for handler, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+                cache.clear()
+                results, elapsed = run(requests, concurrency, token)
+                summary = {'handler': handler, 'concurrency': concurrency, **summarize(results, elapsed)}
+                runs.append(summary)
+                line = (
+                    f'{handler} x{concurrency:<3} {summary["rps"]:>8.1f} req/s  '
+                    f'p50 {summary["ms_p50"]:>7.1f}ms  p99 {summary["ms_p99"]:>7.1f}ms'
+                )
+                if summary['errors']:
+                    self.stdout.write(self.style.ERROR(f'{line}  {summary["errors"]} non-200 responses'))
+                else:
+                    self.stdout.write(line)
+                for label, endpoint in summary['endpoints'].items():
+                    self.stdout.write(
+                        f'    {label:<13} p50 {endpoint["ms_p50"]:>7.1f}ms  p99 {endpoint["ms_p99"]:>7.1f}ms'
+                    )
+
+        if options['report']:
+            with open(options['report'], 'w') as handle:
+                json.dump({
+                    'generated_at': timezone.now().isoformat(),
+                    'requests': options['requests'],
+                    'runs': runs,
+                }, handle, indent=2)
+            self.stdout.write(f'Report written to {options["report"]}')
@@ -0,0 +1,463 @@
+"""
+Endpoint benchmark with per-route query and latency budgets.
+
+Drives every named route in parking.urls and users.urls through the DRF
+test client against seeded datasets of several sizes, inside transactions
+that are rolled back afterwards. For each scenario it records the SQL
+query count (cold cache) and wall time, checks them against the budget
+declared in SCENARIOS and writes a JSON report that can be diffed against
+the report from another commit (--baseline).
+
+Query budgets are the same at every dataset size, so a query count that
+grows with the data (an N+1) fails at the larger sizes. A route with no
+scenario fails the run as well, so new endpoints have to declare one.
+"""
+import json
+import random
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from parking import geo, rollups
+from parking.models import Booking, ParkingSlot, ParkingSpace
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'Bench-pass-0'
+URLCONFS = {'parking': 'parking.urls', 'users': 'users.urls'}
+
+
+class Scenario:
+    """One request against one route, with its query and latency budget"""
+
+    def __init__(self, label, route, max_queries, max_ms, method='get', user='driver',
+                 kwargs=None, params=None, data=None, prepare=None, expect=200):
+        self.label = label
+        self.route = route
+        self.max_queries = max_queries
+        self.max_ms = max_ms
+        self.method = method
+        self.user = user
+        self.kwargs = kwargs
+        self.params = params
+        self.data = data
+        self.prepare = prepare
+        self.expect = expect
+
+    def request(self, client, fixtures, iteration):
+        """Send the request and return the response, with any streamed body read in full"""
+        resolve = lambda value: value(fixtures, iteration) if callable(value) else value
+        url = reverse(self.route, kwargs=resolve(self.kwargs))
+        if self.method == 'get':
+            response = client.get(url, resolve(self.params) or {})
+        else:
+            response = getattr(client, self.method)(url, resolve(self.data) or {}, format='json')
+        if response.streaming:
+            # The queries and time of a streamed response are spent producing its content
+            for _ in response.streaming_content:
+                pass
+        return response
+
+
+def _window(fixtures, iteration, hours=2):
+    start = fixtures['now'] + timedelta(days=2, hours=3 * iteration)
+    return start, start + timedelta(hours=hours)
+
+
+def _window_params(fixtures, iteration):
+    start, end = _window(fixtures, iteration)
+    return {'start_time': start.isoformat(), 'end_time': end.isoformat()}
+
+
+def _reset_password(fixtures, iteration):
+    fixtures['driver'].set_password(BENCH_PASSWORD)
+    fixtures['driver'].save(update_fields=['password'])
+
+
+SPACE = lambda fixtures, iteration: {'pk': fixtures['space'].pk}
+SLOT = lambda fixtures, iteration: {'pk': fixtures['slot'].pk}
+BOOKING = lambda fixtures, iteration: {'pk': fixtures['booking'].pk}
+
+SCENARIOS = [
+    # parking.urls
+    Scenario('parking api root', 'parking:api-root', 0, 50),
+    Scenario('space list', 'parking:parkingspace-list', 2, 100),
+    Scenario('space detail', 'parking:parkingspace-detail', 2, 100, kwargs=SPACE),
+    # Stats: the rollup watermark and the days touched since it, then the
+    # rollups of the other days and one live aggregate for the touched ones
+    Scenario('space stats', 'parking:parkingspace-stats', 5, 150, user='owner', kwargs=SPACE),
+    Scenario(
+        'add slots', 'parking:parkingspace-add-slots', 9, 150, method='post', user='owner',
+        kwargs=SPACE, expect=201,
+        data=lambda fixtures, iteration: {'slots': [{'slot_number': f'BENCH-{iteration}-{n}'} for n in range(5)]},
+    ),
+    Scenario(
+        'slot list', 'parking:parkingslot-list', 2, 50,
+        params=lambda fixtures, iteration: {'parking_space': fixtures['space'].pk},
+    ),
+    Scenario('slot detail', 'parking:parkingslot-detail', 1, 50, kwargs=SLOT),
+    # Cold runs load the slot's occupancy intervals (slot + occupancy index load)
+    Scenario(
+        'slot availability', 'parking:parkingslot-availability', 2, 50,
+        kwargs=SLOT, params=_window_params,
+    ),
+    Scenario('booking list', 'parking:booking-list', 2, 150),
+    # The owner sees every booking on their spaces: the large-result case
+    Scenario('owner booking list', 'parking:booking-list', 2, 400, user='owner'),
+    Scenario('booking detail', 'parking:booking-detail', 1, 50, kwargs=BOOKING),
+    # Every booking on the owner's spaces (30k rows at 1000 spaces) streamed from
+    # one server-side cursor; time grows with the export, queries must not
+    Scenario('booking export', 'parking:booking-export', 1, 2000, user='owner'),
+    # The overlap check confirms the occupancy index in the database; one create
+    # in every references.BLOCK_SIZE also reserves a block of booking references
+    Scenario(
+        'booking create', 'parking:booking-list', 9, 100, method='post', expect=201,
+        data=lambda fixtures, iteration: {
+            'parking_slot': fixtures['slot'].pk,
+            'vehicle_number': 'BENCH',
+            'start_time': _window(fixtures, iteration)[0].isoformat(),
+            'end_time': _window(fixtures, iteration)[1].isoformat(),
+        },
+    ),
+    # Allocates the first free slot of the last space (booking batch books the first spaces)
+    Scenario(
+        'booking allocate', 'parking:booking-allocate', 8, 100, method='post', expect=201,
+        data=lambda fixtures, iteration: {
+            'parking_space': fixtures['slot'].parking_space_id,
+            'vehicle_number': 'BENCH',
+            'start_time': _window(fixtures, iteration)[0].isoformat(),
+            'end_time': _window(fixtures, iteration)[1].isoformat(),
+        },
+    ),
+    # 50 slots in one window: the query count must not grow with the batch
+    # (one query confirms the index against the database, and 50 references
+    # can span two sequence blocks, hence up to two nextval())
+    Scenario(
+        'booking batch', 'parking:booking-batch', 9, 400, method='post', expect=201,
+        data=lambda fixtures, iteration: {
+            'start_time': _window(fixtures, iteration)[0].isoformat(),
+            'end_time': _window(fixtures, iteration)[1].isoformat(),
+            'bookings': [
+                {'parking_slot': slot.pk, 'vehicle_number': f'FLEET-{index}'}
+                for index, slot in enumerate(fixtures['slots'][:50])
+            ],
+        },
+    ),
+    Scenario(
+        'search radius', 'parking:space-search', 1, 150,
+        params=lambda fixtures, iteration: {'latitude': '12.900000', 'longitude': '77.600000', 'radius': 5},
+    ),
+    # Cold runs build the availability bitmaps of the spaces found: two queries
+    # for all of them, none once they are cached
+    Scenario(
+        'search window', 'parking:space-search', 3, 200,
+        params=lambda fixtures, iteration: {
+            'latitude': '12.900000', 'longitude': '77.600000', 'radius': 5,
+            **_window_params(fixtures, iteration),
+        },
+    ),
+    Scenario(
+        'search window quoted', 'parking:space-search', 3, 200,
+        params=lambda fixtures, iteration: {
+            'latitude': '12.900000', 'longitude': '77.600000', 'radius': 5, 'quote': 'true',
+            **_window_params(fixtures, iteration),
+        },
+    ),
+    # One window per space of the first 50 (and a 3-day stay on the first): one rates query
+    Scenario(
+        'quotes', 'parking:quotes', 1, 100, method='post',
+        data=lambda fixtures, iteration: {
+            'start_time': _window(fixtures, iteration)[0].isoformat(),
+            'end_time': _window(fixtures, iteration)[1].isoformat(),
+            'windows': [
+                {'parking_space': slot.parking_space_id} for slot in fixtures['slots'][:50]
+            ] + [{
+                'parking_space': fixtures['space'].pk, 'slot_type': 'ev',
+                'end_time': _window(fixtures, iteration, hours=72)[1].isoformat(),
+            }],
+        },
+    ),
+    Scenario(
+        'map markers', 'parking:map-data', 1, 150,
+        params={'bounds': '12.85,77.55,12.95,77.65', 'zoom': 17},
+    ),
+    Scenario(
+        'map clusters', 'parking:map-data', 1, 150,
+        params={'bounds': '12.40,77.10,13.40,78.10', 'zoom': 10},
+    ),
+    # The event stream is only served over ASGI; the WSGI test client gets the refusal
+    Scenario('live feed', 'parking:live-feed', 0, 50, params=lambda fixtures, iteration: {
+        'space': fixtures['space'].pk,
+    }, expect=503),
+    Scenario('owner dashboard', 'parking:dashboard-stats', 5, 200, user='owner'),
+    # users.urls
+    Scenario(
+        'register', 'users:register', 6, 1500, method='post', user=None, expect=201,
+        data=lambda fixtures, iteration: {
+            'username': f'bench-new-{iteration}', 'email': f'bench-new-{iteration}@example.com',
+            'password': BENCH_PASSWORD, 'password_confirm': BENCH_PASSWORD,
+            'first_name': 'Bench', 'last_name': 'User',
+        },
+    ),
+    Scenario(
+        'login', 'users:login', 3, 1500, method='post', user=None, prepare=_reset_password,
+        data=lambda fixtures, iteration: {'email': fixtures['driver'].email, 'password': BENCH_PASSWORD},
+    ),
+    Scenario('logout', 'users:logout', 0, 50, method='post', expect=205),
+    Scenario('profile', 'users:profile', 0, 50),
+    Scenario('profile detail', 'users:update_profile', 1, 50),
+    Scenario('user list', 'users:user_list', 3, 100),
+    Scenario('current user', 'users:current_user', 0, 50),
+    Scenario('user dashboard', 'users:dashboard', 0, 50),
+    Scenario(
+        'change password', 'users:change_password', 2, 2000, method='post', prepare=_reset_password,
+        data=lambda fixtures, iteration: {
+            'old_password': BENCH_PASSWORD, 'new_password': f'Bench-pass-{iteration + 1}',
+            'new_password_confirm': f'Bench-pass-{iteration + 1}',
+        },
+    ),
+]
+
+
+def _route_names(patterns, namespace):
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= _route_names(pattern.url_patterns, namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(f'{namespace}:{pattern.name}')
+    return names
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API route for query count and latency against declared budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10,100,1000',
+            help='Comma-separated numbers of parking spaces to seed, one run per size'
+        )
+        parser.add_argument('--slots-per-space', type=int, default=10)
+        parser.add_argument('--bookings-per-slot', type=int, default=3)
+        parser.add_argument('--drivers', type=int, default=50, help='Users the seeded bookings are spread over')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per scenario')
+        parser.add_argument('--only', help='Run only scenarios whose label contains this text')
+        parser.add_argument('--report', default='bench_endpoints.json', help='Where to write the JSON report')
+        parser.add_argument('--baseline', help='Earlier JSON report to print deltas against')
+
+    def seed(self, spaces_count, options):
+        """Deterministic dataset: one owner's spaces around a point, booked by a pool of drivers"""
+        rng = random.Random(spaces_count)
+        now = timezone.now()
+        owner = User.objects.create_user(
+            username='bench-owner', email='bench-owner@example.com',
+            password=BENCH_PASSWORD, user_type='owner'
+        )
+        driver = User.objects.create_user(
+            username='bench-driver', email='bench-driver@example.com', password=BENCH_PASSWORD
+        )
+        # Other drivers share the bookings; they never log in, so skip hashing
+        drivers = [driver] + User.objects.bulk_create([
+            User(username=f'bench-driver-{index}', email=f'bench-driver-{index}@example.com', password='!')
+            for index in range(options['drivers'] - 1)
+        ])
+
+        spaces = []
+        for index in range(spaces_count):
+            latitude = round(12.9 + rng.uniform(-0.3, 0.3), 6)
+            longitude = round(77.6 + rng.uniform(-0.3, 0.3), 6)
+            spaces.append(ParkingSpace(
+                name=f'Bench space {index}', address=f'{index} Bench Road', owner=owner,
+                latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude)),
+                geohash=geo.encode(latitude, longitude),
+                hourly_rate=Decimal(rng.randint(20, 120)) / 2,
+            ))
+        spaces = ParkingSpace.objects.bulk_create(spaces)
+        slots = ParkingSlot.objects.bulk_create([
+            ParkingSlot(parking_space=space, slot_number=str(number))
+            for space in spaces for number in range(options['slots_per_space'])
+        ])
+
+        statuses = ['confirmed', 'completed', 'completed', 'cancelled']
+        bookings = []
+        for slot in slots:
+            for index in range(options['bookings_per_slot']):
+                start = now - timedelta(days=index + 1, hours=rng.randint(0, 12))
+                bookings.append(Booking(
+                    user=rng.choice(drivers), parking_slot=slot, vehicle_number='BENCH',
+                    start_time=start, end_time=start + timedelta(hours=2),
+                    hourly_rate=slot.parking_space.hourly_rate,
+                    total_amount=slot.parking_space.hourly_rate * 2,
+                    paid_amount=slot.parking_space.hourly_rate * 2,
+                    status=rng.choice(statuses),
+                    booking_reference=f'B{slot.pk}-{index}',
+                ))
+        bookings = Booking.objects.bulk_create(bookings, batch_size=2000)
+        own_booking = next(booking for booking in bookings if booking.user_id == driver.pk)
+
+        # Rows inserted in this transaction are invisible to autovacuum, and
+        # without statistics the planner treats the tables as empty
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE custom_user, parking_parkingspace, parking_parkingslot, parking_booking')
+
+        # Stats read past days from the rollups in steady state (rollup_stats
+        # runs on a schedule), not from a full live aggregate
+        rollups.run()
+
+        return {
+            'now': now, 'owner': owner, 'driver': driver,
+            'space': spaces[0], 'slot': slots[-1], 'slots': slots, 'booking': own_booking,
+            'counts': {'spaces': len(spaces), 'slots': len(slots), 'bookings': len(bookings)},
+        }
+
+    def measure(self, scenario, fixtures, repeat):
+        client = APIClient()
+        if scenario.user:
+            client.force_authenticate(user=fixtures[scenario.user])
+
+        timings = []
+        queries = []
+        statuses = set()
+        for iteration in range(repeat + 1):
+            if scenario.prepare:
+                scenario.prepare(fixtures, iteration)
+            cold = iteration < repeat
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = scenario.request(client, fixtures, iteration)
+                elapsed = (time.perf_counter() - started) * 1000
+            statuses.add(response.status_code)
+            if cold:
+                timings.append(elapsed)
+                queries.append(len(captured))
+            else:
+                warm_queries = len(captured)
+
+        result = {
+            'label': scenario.label,
+            'route': scenario.route,
+            'method': scenario.method.upper(),
+            'status': sorted(statuses),
+            'queries': max(queries),
+            'warm_queries': warm_queries,
+            'ms_median': round(statistics.median(timings), 2),
+            'ms_max': round(max(timings), 2),
+            'budget': {'queries': scenario.max_queries, 'ms': scenario.max_ms},
+        }
+        problems = []
+        if statuses != {scenario.expect}:
+            problems.append(f'status {sorted(statuses)} (expected {scenario.expect})')
+        if result['queries'] > scenario.max_queries:
+            problems.append(f'{result["queries"]} queries > budget {scenario.max_queries}')
+        if result['ms_median'] > scenario.max_ms:
+            problems.append(f'{result["ms_median"]}ms > budget {scenario.max_ms}ms')
+        result['problems'] = problems
+        return result
+
+    def run_size(self, spaces_count, scenarios, options):
+        with transaction.atomic():
+            fixtures = self.seed(spaces_count, options)
+            results = [self.measure(scenario, fixtures, options['repeat']) for scenario in scenarios]
+            transaction.set_rollback(True)
+        return {'size': spaces_count, 'dataset': fixtures['counts'], 'results': results}
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        scenarios = SCENARIOS
+        if options['only']:
+            scenarios = [scenario for scenario in SCENARIOS if options['only'] in scenario.label]
+
+        routes = set()
+        for namespace, urlconf in URLCONFS.items():
+            routes |= _route_names(import_module(urlconf).urlpatterns, namespace)
+        uncovered = sorted(routes - {scenario.route for scenario in SCENARIOS})
+
+        # A private in-memory cache so clearing it between requests is safe,
+        # sized like the default one so warm runs are not culled
+        bench_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'bench-endpoints', 'OPTIONS': {'MAX_ENTRIES': 100000}}},
+            ALLOWED_HOSTS=['testserver'],
+        )
+        with bench_settings:
+            runs = []
+            for size in sizes:
+                self.stdout.write(f'-- {size} spaces')
+                run = self.run_size(size, scenarios, options)
+                for result in run['results']:
+                    line = (
+                        f'{result["label"]:<20} {result["queries"]:>3}q (warm {result["warm_queries"]:>2}) '
+                        f'{result["ms_median"]:>8.1f}ms'
+                    )
+                    if result['problems']:
+                        self.stdout.write(self.style.ERROR(f'{line}  FAIL: {"; ".join(result["problems"])}'))
+                    else:
+                        self.stdout.write(line)
+                runs.append(run)
+
+        report = {
+            'commit': _git_commit(),
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'uncovered_routes': uncovered,
+            'runs': runs,
+        }
+        with open(options['report'], 'w') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(f'Report written to {options["report"]}')
+
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+
+        failures = sum(1 for run in runs for result in run['results'] if result['problems'])
+        if uncovered:
+            self.stderr.write(f'Routes without a benchmark budget: {", ".join(uncovered)}')
+        if failures or uncovered:
+            raise CommandError(f'{failures} scenario runs over budget, {len(uncovered)} routes uncovered')
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget'))
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path) as handle:
+            baseline = json.load(handle)
+        previous = {
+            (run['size'], result['label']): result
+            for run in baseline['runs'] for result in run['results']
+        }
+        self.stdout.write(f'-- compared with {baseline.get("commit") or baseline_path}')
+        for run in report['runs']:
+            for result in run['results']:
+                before = previous.get((run['size'], result['label']))
+                if before is None:
+                    continue
+                query_delta = result['queries'] - before['queries']
+                ms_delta = result['ms_median'] - before['ms_median']
+                if query_delta or abs(ms_delta) > max(1.0, before['ms_median'] * 0.2):
+                    self.stdout.write(
+                        f'{run["size"]:>6} {result["label"]:<20} queries {query_delta:+d}, '
+                        f'median {ms_delta:+.1f}ms'
+                    )
@@ -0,0 +1,179 @@
+"""
+Throughput benchmark for "any free slot" booking under contention.
+
+Runs against the configured PostgreSQL database. For each round, a group
+of threads fills every slot of one space for the same window, each
+thread booking until the space is full, with one of two strategies:
+
+- choose:   what clients do without allocation: look up the free slots,
+            book the first one through BookingSerializer and, when someone
+            else got it first, look again and retry
+- allocate: BookingAllocateSerializer, which picks the slot server-side
+            with SELECT ... FOR UPDATE SKIP LOCKED
+
+Each round must end with every slot booked exactly once. The command
+reports bookings/second and booking attempts per booking for each strategy.
+"""
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework import serializers
+
+from parking import occupancy
+from parking.models import Booking, ParkingSlot, ParkingSpace
+from parking.serializers import BookingAllocateSerializer, BookingSerializer
+
+User = get_user_model()
+
+
+class _Request:
+    def __init__(self, user):
+        self.user = user
+
+
+def _choose(user, space, slot_ids, start_time, end_time):
+    """Book the first slot that looks free; returns (booked, attempts)"""
+    attempts = 0
+    while True:
+        free = sorted(occupancy.free_slot_ids(slot_ids, start_time, end_time))
+        if not free:
+            return False, attempts
+        attempts += 1
+        serializer = BookingSerializer(data={
+            'parking_slot': free[0], 'vehicle_number': 'BENCH', 'status': 'confirmed',
+            'start_time': start_time, 'end_time': end_time,
+        }, context={'request': _Request(user)})
+        try:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return True, attempts
+        except serializers.ValidationError as exc:
+            # Someone else booked it since the lookup; anything else is a real failure
+            if BookingSerializer.OVERLAP_ERROR not in str(exc.detail):
+                raise
+
+
+def _allocate(user, space, slot_ids, start_time, end_time):
+    """Book whichever slot the server allocates; returns (booked, attempts)"""
+    serializer = BookingAllocateSerializer(data={
+        'parking_space': space.pk, 'vehicle_number': 'BENCH',
+        'start_time': start_time, 'end_time': end_time,
+    }, context={'request': _Request(user)})
+    serializer.is_valid(raise_exception=True)
+    try:
+        serializer.save()
+    except serializers.ValidationError:
+        # The space is full
+        return False, 0
+    return True, 1
+
+
+STRATEGIES = {'choose': _choose, 'allocate': _allocate}
+
+
+class Command(BaseCommand):
+    help = 'Compare client-chosen and server-allocated slots when many threads book one space'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--slots', type=int, default=50, help='Slots in the benchmark space')
+        parser.add_argument('--rounds', type=int, default=5, help='Windows to fill per strategy')
+
+    def setup_fixtures(self, slot_count):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            username=f'bench-{tag}', email=f'bench-{tag}@example.com', password=uuid.uuid4().hex
+        )
+        space = ParkingSpace.objects.create(
+            name=f'Bench {tag}', address='Benchmark', latitude=0, longitude=0,
+            owner=user, hourly_rate=1
+        )
+        ParkingSlot.objects.bulk_create([
+            ParkingSlot(parking_space=space, slot_number=str(number)) for number in range(slot_count)
+        ])
+        return user, space
+
+    def book(self, strategy, user, space, slot_ids, start_time, results, barrier):
+        end_time = start_time + timedelta(hours=1)
+        barrier.wait()
+        try:
+            while True:
+                booked, attempts = STRATEGIES[strategy](user, space, slot_ids, start_time, end_time)
+                results.append(('booked' if booked else 'full', attempts))
+                if not booked:
+                    return
+        except Exception as exc:
+            results.append((f'error: {exc}', 0))
+        finally:
+            connections.close_all()
+
+    def run_round(self, strategy, user, space, slot_ids, start_time, threads_count):
+        results = []
+        barrier = threading.Barrier(threads_count)
+        threads = [
+            threading.Thread(
+                target=self.book, args=(strategy, user, space, slot_ids, start_time, results, barrier)
+            )
+            for _ in range(threads_count)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark needs PostgreSQL (SKIP LOCKED and the exclusion constraint)')
+        if min(options['threads'], options['slots'], options['rounds']) < 1:
+            raise CommandError('--threads, --slots and --rounds must be positive')
+
+        user, space = self.setup_fixtures(options['slots'])
+        slot_ids = list(space.parking_slots.values_list('pk', flat=True))
+        base = timezone.now() + timedelta(days=1)
+        failures = 0
+
+        try:
+            for offset, strategy in enumerate(STRATEGIES):
+                booked = attempts = 0
+                elapsed = 0.0
+                for round_number in range(options['rounds']):
+                    start_time = base + timedelta(hours=2 * (offset * options['rounds'] + round_number))
+                    results, seconds = self.run_round(
+                        strategy, user, space, slot_ids, start_time, options['threads']
+                    )
+                    elapsed += seconds
+                    booked += sum(1 for result, _ in results if result == 'booked')
+                    attempts += sum(count for _, count in results)
+
+                    errors = [result for result, _ in results if result.startswith('error')]
+                    slots_booked = Booking.objects.filter(
+                        parking_slot__parking_space=space, start_time=start_time
+                    ).order_by().values('parking_slot').distinct().count()
+                    if errors or slots_booked != len(slot_ids):
+                        failures += 1
+                        self.stderr.write(
+                            f'{strategy} round {round_number}: {slots_booked} of {len(slot_ids)} '
+                            f'slots booked, errors: {errors[:3]}'
+                        )
+
+                self.stdout.write(
+                    f'{strategy:<9} {booked} bookings in {elapsed:.2f}s '
+                    f'({booked / elapsed:.0f} bookings/s, {attempts / max(booked, 1):.2f} attempts per booking, '
+                    f'{options["threads"]} threads)'
+                )
+        finally:
+            stored = Booking.objects.filter(parking_slot__parking_space=space).count()
+            user.delete()
+
+        expected = len(STRATEGIES) * options['rounds'] * len(slot_ids)
+        if failures or stored != expected:
+            raise CommandError(f'{stored} bookings stored, expected {expected}; {failures} rounds failed')
+        self.stdout.write(self.style.SUCCESS('Every slot was booked exactly once per window'))
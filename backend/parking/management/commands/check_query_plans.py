@@ -0,0 +1,65 @@
+"""
+Plan regression check for the hot Booking and ParkingSpace queries.
+
+Runs the checks of parking.query_plans (also run by QueryPlanTests in
+parking/tests.py) on a larger seeded dataset: seeds it inside a
+transaction, ANALYZEs it, runs EXPLAIN on the key ORM queries and fails if
+any of them falls back to a sequential scan over the parking tables.
+Everything is rolled back afterwards.
+
+By default sequential scans are disabled for the check (SET LOCAL
+enable_seqscan = off), so a Seq Scan in the plan means no index can serve
+the query at all, independent of how much data was seeded. Pass
+--natural to keep the planner's own cost choices instead; scans are then
+reported but do not fail the command, since on unselective seed data a
+sequential scan can be the right plan.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from parking import query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot parking queries on seeded data and fail on sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spaces', type=int, default=500)
+        parser.add_argument('--slots-per-space', type=int, default=10)
+        parser.add_argument('--bookings', type=int, default=50000)
+        parser.add_argument(
+            '--natural', action='store_true',
+            help='Leave enable_seqscan on and let the planner pick by cost'
+        )
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plan checks need PostgreSQL')
+
+        failures = []
+        with transaction.atomic():
+            owner, slots = query_plans.seed(
+                options['spaces'], options['slots_per_space'], options['bookings']
+            )
+            query_plans.analyze(disable_seqscan=not options['natural'])
+
+            for name, queryset in query_plans.checks(owner, slots):
+                plan = queryset.explain()
+                if options['verbose_plans']:
+                    self.stdout.write(f'-- {name}\n{plan}\n')
+                scan = query_plans.sequential_scan(plan)
+                if scan:
+                    failures.append((name, plan))
+                    self.stdout.write(self.style.ERROR(f'FAIL {name}: {scan}'))
+                else:
+                    self.stdout.write(f'ok   {name}')
+
+            transaction.set_rollback(True)
+
+        if failures and not options['natural']:
+            for name, plan in failures:
+                self.stderr.write(f'\n-- {name}\n{plan}')
+            raise CommandError(f'{len(failures)} queries fell back to sequential scans')
+        if not failures:
+            self.stdout.write(self.style.SUCCESS('All checked queries use indexes'))
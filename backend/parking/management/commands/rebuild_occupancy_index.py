@@ -0,0 +1,32 @@
+"""
+Fill the slot occupancy index from the database.
+
+Only useful with a shared cache (REDIS_URL): with the default per-process
+local-memory cache the command would fill its own memory and exit, so it
+refuses to run there. Web processes fill their own entries on demand.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from parking import occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the per-slot occupancy index from confirmed/active bookings. '
+        'Run on startup after deploys or cache flushes; needs a shared cache (REDIS_URL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=occupancy.REBUILD_BATCH_SIZE,
+            help='Number of slots loaded per query'
+        )
+
+    def handle(self, *args, **options):
+        if not occupancy.is_shared_cache():
+            raise CommandError(
+                'The default cache is local to each process, so an index built here would '
+                'not reach the web processes. Set REDIS_URL to share the cache.'
+            )
+        total = occupancy.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} parking slots'))
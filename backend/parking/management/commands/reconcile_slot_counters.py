@@ -0,0 +1,77 @@
+"""Detect and repair drift in the denormalized ParkingSpace slot counters."""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from parking.models import ParkingSlot, ParkingSpace
+
+
+class Command(BaseCommand):
+    help = 'Compare ParkingSpace slot counters with actual slot rows and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted spaces without updating them'
+        )
+
+    def actual_counters(self, space_ids):
+        counters = {space_id: defaultdict(int) for space_id in space_ids}
+        rows = ParkingSlot.objects.filter(parking_space_id__in=space_ids).order_by().values(
+            'parking_space_id', 'slot_type', 'is_available'
+        ).annotate(count=Count('id'))
+
+        for row in rows:
+            counts = counters[row['parking_space_id']]
+            counts['total_slots'] += row['count']
+            counts[ParkingSlot.counter_field(row['slot_type'])] += row['count']
+            if row['is_available']:
+                counts['available_slots'] += row['count']
+        return counters
+
+    def reconcile_batch(self, space_ids, fields, dry_run):
+        """Lock a batch of spaces, recount their slots and fix drifted rows"""
+        with transaction.atomic():
+            spaces = list(
+                ParkingSpace.objects.select_for_update().filter(pk__in=space_ids).only('pk', *fields)
+            )
+            actual = self.actual_counters(space_ids)
+
+            drifted = []
+            for space in spaces:
+                counts = actual[space.pk]
+                if any(getattr(space, field) != counts[field] for field in fields):
+                    for field in fields:
+                        setattr(space, field, counts[field])
+                    drifted.append(space)
+
+            if drifted and not dry_run:
+                ParkingSpace.objects.bulk_update(drifted, fields)
+        return len(spaces), len(drifted)
+
+    def handle(self, *args, **options):
+        fields = ParkingSpace.SLOT_COUNTER_FIELDS
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_pk = 0
+
+        # Walk the table in primary-key order so each batch is an index range scan
+        while True:
+            space_ids = list(
+                ParkingSpace.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not space_ids:
+                break
+            batch_checked, batch_drifted = self.reconcile_batch(space_ids, fields, options['dry_run'])
+            checked += batch_checked
+            drifted += batch_drifted
+            last_pk = space_ids[-1]
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} parking spaces. {action} {drifted} with drifted slot counters.'
+        ))
@@ -0,0 +1,21 @@
+"""Incrementally refresh the DailySpaceStats rollup table."""
+from django.core.management.base import BaseCommand
+
+from parking import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute daily per-space booking rollups for days touched since the last run. '
+        'Schedule frequently (e.g. every few minutes); use --full for the initial backfill.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Ignore the watermark and rebuild every day with bookings'
+        )
+
+    def handle(self, *args, **options):
+        touched = rollups.run(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {touched} space-day rollups'))
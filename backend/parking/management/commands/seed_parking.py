@@ -0,0 +1,377 @@
+"""
+Deterministic synthetic data generator for production-scale local testing.
+
+Creates owners and drivers, parking spaces scattered around several cities,
+slots of mixed types and a booking history spanning several years, all
+derived from --seed and --anchor so the same arguments always produce the
+same rows. Users, spaces and slots are written with chunked bulk_create
+(ParkingSlotQuerySet.bulk_create keeps the slot counters); bookings are
+streamed with COPY on PostgreSQL and bulk_create elsewhere. The occupancy
+index and daily rollups are rebuilt at the end (skip with --skip-derived).
+
+Each slot's timeline is cut into equal segments with one booking inside
+each, so bookings on a slot never overlap and booking_no_overlap holds
+without any checks while inserting.
+"""
+import io
+import math
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from parking import geo, occupancy, rollups
+from parking.models import Booking, ParkingSlot, ParkingSpace
+from users.models import UserProfile
+
+User = get_user_model()
+
+SEED_PASSWORD = 'seed-password'
+
+# name, latitude, longitude, share of spaces, vehicle registration prefix
+CITIES = [
+    ('Bengaluru', 12.9716, 77.5946, 0.22, 'KA'),
+    ('Mumbai', 19.0760, 72.8777, 0.20, 'MH'),
+    ('Delhi', 28.6139, 77.2090, 0.20, 'DL'),
+    ('Hyderabad', 17.3850, 78.4867, 0.12, 'TS'),
+    ('Chennai', 13.0827, 80.2707, 0.12, 'TN'),
+    ('Pune', 18.5204, 73.8567, 0.08, 'MH'),
+    ('Kolkata', 22.5726, 88.3639, 0.06, 'WB'),
+]
+# Spaces cluster around the centre: ~6km standard deviation
+CITY_SPREAD_DEGREES = 0.055
+STREETS = ['MG Road', 'Station Road', 'Market Street', 'Ring Road', 'Lake View', 'Tech Park', 'Mall Road']
+
+SLOT_TYPE_WEIGHTS = {
+    'standard': 60, 'compact': 15, 'large': 10, 'motorcycle': 8, 'disabled': 4, 'ev': 3,
+}
+VEHICLE_TYPES = {'motorcycle': 'motorcycle', 'large': 'suv', 'ev': 'ev'}
+# Booking lengths in minutes, weighted towards short stays
+DURATIONS = [60, 120, 120, 180, 180, 240, 360, 480, 600, 1440]
+COPY_BUFFER_SIZE = 1 << 20
+BOOKING_COLUMNS = [
+    'user_id', 'parking_slot_id', 'vehicle_number', 'vehicle_type', 'start_time', 'end_time',
+    'actual_start_time', 'actual_end_time', 'hourly_rate', 'total_amount', 'paid_amount',
+    'status', 'booking_reference', 'special_instructions', 'created_at', 'updated_at',
+]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values set on the instances"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible, production-sized dataset of users, spaces, slots and bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; also tags the generated rows')
+        parser.add_argument(
+            '--anchor', help="ISO date treated as 'now' (default: today), so reruns match exactly"
+        )
+        parser.add_argument('--owners', type=int, default=200)
+        parser.add_argument('--drivers', type=int, default=5000)
+        parser.add_argument('--spaces', type=int, default=1000)
+        parser.add_argument('--slots-per-space', type=int, default=20, help='Average; actual counts vary by half')
+        parser.add_argument('--bookings', type=int, default=100000)
+        parser.add_argument('--years', type=float, default=2.0, help='Length of the booking history')
+        parser.add_argument('--future-days', type=int, default=30, help='How far ahead bookings are made')
+        parser.add_argument('--chunk-size', type=int, default=20000)
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Do not rebuild the occupancy index and daily rollups afterwards'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.tag = f'seed{options["seed"]}'
+        self.chunk_size = options['chunk_size']
+
+        if options['anchor']:
+            anchor = datetime.fromisoformat(options['anchor'])
+        else:
+            anchor = datetime.combine(timezone.localdate(), datetime.min.time())
+        self.now = timezone.make_aware(anchor) if timezone.is_naive(anchor) else anchor
+        self.history_start = self.now - timedelta(days=365 * options['years'])
+
+        if User.objects.filter(username__startswith=f'{self.tag}-').exists():
+            raise CommandError(
+                f'Data for --seed {options["seed"]} already exists; use another seed or a fresh database'
+            )
+        if min(options['owners'], options['drivers'], options['spaces'], options['slots_per_space']) < 1:
+            raise CommandError('--owners, --drivers, --spaces and --slots-per-space must be positive')
+
+        started = time.perf_counter()
+        with explicit_timestamps(User, UserProfile, ParkingSpace, ParkingSlot, Booking):
+            owners, drivers = self.create_users()
+            spaces = self.create_spaces(owners)
+            slots = self.create_slots(spaces)
+            bookings = self.create_bookings(slots, drivers)
+
+        self.stdout.write(
+            f'Seeded {len(owners) + sum(map(len, drivers.values()))} users, {len(spaces)} spaces, '
+            f'{len(slots)} slots and {bookings} bookings in {time.perf_counter() - started:.0f}s'
+        )
+
+        if not options['skip_derived']:
+            self.stdout.write('Rebuilding occupancy index and daily rollups...')
+            # A local-memory index would only fill this process
+            if occupancy.is_shared_cache():
+                occupancy.rebuild()
+            rollups.run(full=True)
+        self.stdout.write(self.style.SUCCESS(f'Done; every seeded user has password "{SEED_PASSWORD}"'))
+
+    def _timestamp_between(self, start, end):
+        return start + (end - start) * self.rng.random()
+
+    def _bulk(self, model, rows):
+        """bulk_create in chunks, each in its own transaction; returns the created objects"""
+        created = []
+        for index in range(0, len(rows), self.chunk_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(rows[index:index + self.chunk_size]))
+        return created
+
+    def create_users(self):
+        """Owners, plus drivers grouped by home city; one shared password hash keeps this fast"""
+        password = make_password(SEED_PASSWORD)
+        users = []
+        for role, count in (('owner', self.options['owners']), ('driver', self.options['drivers'])):
+            for index in range(count):
+                joined = self._timestamp_between(self.history_start - timedelta(days=180), self.now)
+                users.append(User(
+                    username=f'{self.tag}-{role}-{index}',
+                    email=f'{self.tag}-{role}-{index}@example.com',
+                    first_name=role.title(), last_name=str(index), password=password,
+                    user_type='owner' if role == 'owner' else 'regular',
+                    is_verified=self.rng.random() < 0.8,
+                    date_joined=joined, created_at=joined, updated_at=joined,
+                ))
+        users = self._bulk(User, users)
+
+        cities = [city for city, *_ in CITIES]
+        homes = {user.pk: self.rng.choices(cities, weights=[c[3] for c in CITIES])[0] for user in users}
+        self._bulk(UserProfile, [
+            UserProfile(user=user, city=homes[user.pk], created_at=user.created_at, updated_at=user.created_at)
+            for user in users
+        ])
+
+        # Drivers book in their home city, always with the same vehicle
+        plates = {city: prefix for city, *_, prefix in CITIES}
+        owners = users[:self.options['owners']]
+        drivers = {city: [] for city in cities}
+        for user in users[self.options['owners']:]:
+            city = homes[user.pk]
+            plate = (
+                f'{plates[city]}{self.rng.randint(1, 99):02d}'
+                f'{chr(65 + self.rng.randrange(26))}{chr(65 + self.rng.randrange(26))}'
+                f'{self.rng.randint(1, 9999):04d}'
+            )
+            drivers[city].append((user.pk, plate))
+        # Every city needs at least one driver to book its slots
+        for city in cities:
+            if not drivers[city]:
+                drivers[city] = [self.rng.choice([d for pool in drivers.values() for d in pool])]
+        return owners, drivers
+
+    def create_spaces(self, owners):
+        spaces = []
+        for index in range(self.options['spaces']):
+            city, lat, lng, _, _ = self.rng.choices(CITIES, weights=[c[3] for c in CITIES])[0]
+            latitude = round(self.rng.gauss(lat, CITY_SPREAD_DEGREES), 6)
+            longitude = round(self.rng.gauss(lng, CITY_SPREAD_DEGREES), 6)
+            # Central spaces charge more
+            distance = geo.haversine_km(lat, lng, latitude, longitude)
+            hourly_rate = Decimal(max(10, round(80 - distance * 5 + self.rng.gauss(0, 10))))
+            created = self.history_start - timedelta(days=self.rng.uniform(0, 365))
+
+            space = ParkingSpace(
+                name=f'{city} {self.rng.choice(STREETS)} Parking {index}',
+                address=f'{self.rng.randint(1, 400)} {self.rng.choice(STREETS)}, {city}',
+                owner=self.rng.choice(owners),
+                latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude)),
+                geohash=geo.encode(latitude, longitude),
+                hourly_rate=hourly_rate,
+                daily_rate=hourly_rate * 8 if self.rng.random() < 0.4 else None,
+                is_active=self.rng.random() < 0.95,
+                has_security=self.rng.random() < 0.6,
+                has_covered_parking=self.rng.random() < 0.4,
+                has_ev_charging=self.rng.random() < 0.15,
+                has_disability_access=self.rng.random() < 0.3,
+                created_at=created, updated_at=created,
+            )
+            space.city = city
+            spaces.append(space)
+
+        # bulk_create returns the same instances, so the city tag survives
+        return self._bulk(ParkingSpace, spaces)
+
+    def create_slots(self, spaces):
+        average = self.options['slots_per_space']
+        slots = []
+        for space in spaces:
+            count = self.rng.randint(max(1, average // 2), max(1, average * 3 // 2))
+            for number in range(1, count + 1):
+                slot_type = _weighted(self.rng, SLOT_TYPE_WEIGHTS)
+                slot = ParkingSlot(
+                    parking_space=space, slot_number=f'{number:03d}', slot_type=slot_type,
+                    is_available=self.rng.random() < 0.97,
+                    created_at=space.created_at, updated_at=space.created_at,
+                )
+                slots.append(slot)
+        # ParkingSlotQuerySet.bulk_create keeps the space counters in step
+        return self._bulk(ParkingSlot, slots)
+
+    def _slot_bookings(self, slot, quota, drivers, counter):
+        """
+        Booking rows (tuples in BOOKING_COLUMNS order) for one slot: its
+        timeline is cut into quota equal segments with one booking in each.
+        """
+        first = self.history_start
+        horizon = self.now + timedelta(days=self.options['future_days'])
+        segment = int((horizon - first).total_seconds() // 60) // quota
+        if segment < 30:
+            raise CommandError('Too many bookings for the history length; raise --years or the slot count')
+
+        # This runs once per booking, so it sticks to random() and plain ints
+        random = self.rng.random
+        null = self.null
+        longest = segment - segment % 15 or 15
+        rate = slot.parking_space.hourly_rate
+        rate_paise = int(rate * 100)
+        vehicle_type = VEHICLE_TYPES.get(slot.slot_type, 'car')
+        prefix = f'{self.tag.upper()}-'
+
+        rows = []
+        for index in range(quota):
+            minutes = min(DURATIONS[int(random() * len(DURATIONS))], longest)
+            offset = int(random() * (segment - minutes + 1)) // 5 * 5
+            start = first + timedelta(minutes=index * segment + offset)
+            end = start + timedelta(minutes=minutes)
+
+            roll = random()
+            if end <= self.now:
+                status = 'completed' if roll < 0.82 else 'cancelled' if roll < 0.96 else 'no_show'
+            elif start <= self.now:
+                status = 'active' if roll < 0.95 else 'cancelled'
+            else:
+                status = 'confirmed' if roll < 0.7 else 'pending' if roll < 0.9 else 'cancelled'
+
+            total = rate_paise * minutes // 60
+            total_amount = f'{total // 100}.{total % 100:02d}'
+            paid_amount = total_amount if status in ('completed', 'active', 'confirmed') else '0.00'
+            actual_start = actual_end = null
+            if status == 'completed' or status == 'active':
+                actual_start = start + timedelta(minutes=int(random() * 30) - 10)
+            if status == 'completed':
+                actual_end = end + timedelta(minutes=int(random() * 50) - 20)
+            # Booked on average two days ahead
+            created = start - timedelta(minutes=10 + int(-2880 * math.log(1.0 - random())))
+
+            driver_id, plate = drivers[int(random() * len(drivers))]
+            rows.append((
+                driver_id, slot.pk, plate, vehicle_type, start, end, actual_start, actual_end,
+                rate, total_amount, paid_amount, status, f'{prefix}{counter + index:X}', '',
+                created, end if status == 'completed' else created,
+            ))
+        return rows
+
+    def create_bookings(self, slots, drivers):
+        """
+        Generate and insert the booking history.
+        
+        Rows are generated in a producer thread while the main thread loads
+        the previous chunk, so row building overlaps with the database
+        work. Only the producer touches the random generator, so the output
+        stays deterministic.
+        """
+        copy = connection.vendor == 'postgresql'
+        # COPY text format spells NULL as \N; bulk_create wants None
+        self.null = '\\N' if copy else None
+        if copy:
+            with connection.cursor() as cursor:
+                # Seed data can be regenerated, so skip the WAL flush per chunk
+                cursor.execute('SET synchronous_commit TO off')
+
+        chunks = queue.Queue(maxsize=2)
+        producer = threading.Thread(
+            target=self._produce_bookings, args=(slots, drivers, copy, chunks), daemon=True
+        )
+        producer.start()
+
+        total = self.options['bookings']
+        inserted = 0
+        next_report = total // 10
+        started = time.perf_counter()
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            count, payload = chunk
+            with transaction.atomic():
+                if copy:
+                    with connection.cursor() as cursor:
+                        cursor.copy_expert(
+                            f'COPY {Booking._meta.db_table} ({", ".join(BOOKING_COLUMNS)}) FROM STDIN',
+                            payload, COPY_BUFFER_SIZE
+                        )
+                else:
+                    Booking.objects.bulk_create(payload, batch_size=1000)
+            inserted += count
+            if inserted >= next_report:
+                next_report += total // 10
+                rate = inserted / (time.perf_counter() - started)
+                self.stdout.write(f'  {inserted}/{total} bookings ({rate:.0f}/s)')
+        producer.join()
+        return inserted
+
+    def _produce_bookings(self, slots, drivers, copy, chunks):
+        """Queue (row count, payload) chunks: COPY text on PostgreSQL, Booking instances elsewhere"""
+        try:
+            total = self.options['bookings']
+            base, extra = divmod(total, len(slots))
+            rows = []
+            generated = 0
+            for position, slot in enumerate(slots):
+                quota = base + (1 if position < extra else 0)
+                if quota:
+                    rows.extend(self._slot_bookings(slot, quota, drivers[slot.parking_space.city], generated))
+                    generated += quota
+                if len(rows) >= self.chunk_size or (rows and position == len(slots) - 1):
+                    if copy:
+                        payload = io.StringIO(''.join('\t'.join(map(str, row)) + '\n' for row in rows))
+                    else:
+                        payload = [Booking(**dict(zip(BOOKING_COLUMNS, row))) for row in rows]
+                    chunks.put((len(rows), payload))
+                    rows = []
+            chunks.put(None)
+        except BaseException as exc:
+            chunks.put(exc)
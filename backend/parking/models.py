@@ -1,10 +1,147 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeBoundary, RangeOperators
+from django.db.models import Count, Exists, F, Func, OuterRef, Q, Subquery
+from django.db.models.signals import post_migrate, pre_migrate, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.db.models.functions import Coalesce, TruncDate
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
+from . import geo
+
 User = get_user_model()
 
+class TsTzRange(Func):
+    """PostgreSQL tstzrange(start, end, bounds)"""
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+def is_overlap_violation(error):
+    """True if an IntegrityError came from the booking_no_overlap exclusion constraint"""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == 'booking_no_overlap'
+
+def _slot_count(slots):
+    """Correlated COUNT subquery over a ParkingSlot queryset filtered on OuterRef('pk')"""
+    counts = slots.order_by().values('parking_space').annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+class ParkingSpaceQuerySet(models.QuerySet):
+    """QuerySet helpers for parking space lookups"""
+    
+    def with_slot_counts(self):
+        """Join the owner for list serialization (slot counts are stored counter columns)"""
+        return self.select_related('owner')
+    
+    def refresh_slot_counters(self):
+        """Recompute the stored slot counters of these spaces from their slots in one UPDATE"""
+        slots = ParkingSlot.objects.filter(parking_space=OuterRef('pk'))
+        counters = {
+            'total_slots': _slot_count(slots),
+            'available_slots': _slot_count(slots.filter(is_available=True)),
+        }
+        for slot_type, _ in ParkingSlot.SLOT_TYPES:
+            counters[ParkingSlot.counter_field(slot_type)] = _slot_count(slots.filter(slot_type=slot_type))
+        return self.order_by().update(**counters)
+    
+    def lock_rollups(self):
+        """
+        Lock these spaces' rows until the end of the transaction. Rollup
+        recomputes hold it while they read bookings and rewrite the rollups,
+        and booking deletes and moves take it before flagging rollups stale,
+        so a booking cannot leave a day between a recompute's read and write.
+        FOR NO KEY UPDATE, so slot inserts (FOR KEY SHARE) are not blocked.
+        """
+        return list(self.select_for_update(no_key=True).order_by('pk').values_list('pk', flat=True))
+    
+    def with_free_slot_count(self, start_time, end_time, slot_type=None):
+        """Annotate ``free_slot_count``: available slots with no blocking booking in the window"""
+        free_slots = ParkingSlot.objects.filter(
+            parking_space=OuterRef('pk')
+        ).free_during(start_time, end_time)
+        if slot_type:
+            free_slots = free_slots.filter(slot_type=slot_type)
+        
+        return self.annotate(free_slot_count=_slot_count(free_slots))
+    
+    def _in_cells(self, cells):
+        """Restrict to rows whose geohash starts with one of the given prefixes"""
+        condition = Q()
+        for cell in cells:
+            condition |= Q(geohash__startswith=cell)
+        return self.filter(condition)
+    
+    def with_distance(self, latitude, longitude):
+        """Annotate ``distance_km`` from the given point"""
+        return self.annotate(distance_km=geo.distance_expression(latitude, longitude))
+    
+    def within_radius(self, latitude, longitude, radius_km):
+        """Spaces within radius_km of a point, nearest first"""
+        queryset = self
+        cells = geo.cells_for_radius(latitude, longitude, radius_km)
+        if cells is not None:
+            queryset = queryset._in_cells(cells)
+        return queryset.with_distance(latitude, longitude).filter(
+            distance_km__lte=radius_km
+        ).order_by('distance_km', 'id')
+    
+    def within_bounds(self, south, west, north, east):
+        """Spaces inside a latitude/longitude bounding box"""
+        queryset = self
+        cells = geo.cells_for_bounds(south, west, north, east)
+        if cells is not None:
+            queryset = queryset._in_cells(cells)
+        return queryset.filter(
+            latitude__range=[south, north],
+            longitude__range=[west, east]
+        )
+    
+    def nearest(self, latitude, longitude, k):
+        """
+        The k spaces nearest to a point.
+        
+        Widens the geohash neighbourhood until it holds at least k candidates,
+        then re-queries with the k-th candidate's distance as the radius so
+        closer spaces just outside the neighbourhood are not missed.
+        """
+        for precision in range(geo.GEOHASH_PRECISION, 0, -1):
+            cells = geo.neighbours(geo.encode(latitude, longitude, precision))
+            candidates = self._in_cells(cells).with_distance(latitude, longitude)
+            distances = list(
+                candidates.order_by('distance_km').values_list('distance_km', flat=True)[:k]
+            )
+            if len(distances) >= k:
+                radius_km = distances[-1]
+                break
+        else:
+            return self.with_distance(latitude, longitude).order_by('distance_km', 'id')[:k]
+        
+        return self.within_radius(latitude, longitude, radius_km)[:k]
+    
+    async def anearest(self, latitude, longitude, k):
+        """Async version of nearest(); returns the (unevaluated) queryset"""
+        for precision in range(geo.GEOHASH_PRECISION, 0, -1):
+            cells = geo.neighbours(geo.encode(latitude, longitude, precision))
+            candidates = self._in_cells(cells).with_distance(latitude, longitude)
+            distances = [
+                distance async for distance in
+                candidates.order_by('distance_km').values_list('distance_km', flat=True)[:k]
+            ]
+            if len(distances) >= k:
+                radius_km = distances[-1]
+                break
+        else:
+            return self.with_distance(latitude, longitude).order_by('distance_km', 'id')[:k]
+        
+        return self.within_radius(latitude, longitude, radius_km)[:k]
+
 class ParkingSpace(models.Model):
     """Model for parking spaces/lots"""
     name = models.CharField(max_length=200)
@@ -25,19 +162,147 @@ class ParkingSpace(models.Model):
     has_ev_charging = models.BooleanField(default=False)
     has_disability_access = models.BooleanField(default=False)
     
+    # Slot counters, maintained by ParkingSlot writes (see apply_slot_counter_deltas)
+    total_slots = models.IntegerField(default=0, editable=False)
+    available_slots = models.IntegerField(default=0, editable=False)
+    standard_slots = models.IntegerField(default=0, editable=False)
+    compact_slots = models.IntegerField(default=0, editable=False)
+    large_slots = models.IntegerField(default=0, editable=False)
+    motorcycle_slots = models.IntegerField(default=0, editable=False)
+    disabled_slots = models.IntegerField(default=0, editable=False)
+    ev_slots = models.IntegerField(default=0, editable=False)
+    
+    # Spatial index: geohash of (latitude, longitude), kept in sync on save
+    geohash = models.CharField(max_length=12, db_index=True, blank=True, editable=False)
+    
+    SLOT_COUNTER_FIELDS = [
+        'total_slots', 'available_slots', 'standard_slots', 'compact_slots',
+        'large_slots', 'motorcycle_slots', 'disabled_slots', 'ev_slots',
+    ]
+    
+    objects = ParkingSpaceQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Geohash prefix scans (LIKE 'prefix%') over active spaces
+            models.Index(
+                fields=['geohash'], name='space_active_geohash',
+                opclasses=['varchar_pattern_ops'], condition=Q(is_active=True)
+            ),
+            models.Index(
+                fields=['latitude', 'longitude'], name='space_active_lat_lng',
+                condition=Q(is_active=True)
+            ),
+            models.Index(fields=['owner', 'is_active'], name='space_owner_active'),
+            # Keyset pagination of the active space list
+            models.Index(
+                fields=['created_at', 'id'], name='space_active_created',
+                condition=Q(is_active=True)
+            ),
+        ]
         
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        # Keep the stored geohash so map tiles at the old location are invalidated too
+        self._previous_geohash = self.geohash
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(float(self.latitude), float(self.longitude))
         
+        # Never write back slot counters loaded with the instance; they are
+        # only changed through F() updates so concurrent slot writes aren't lost
+        if not self._state.adding and kwargs.get('update_fields') is None and not args:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SLOT_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     @property
-    def total_slots(self):
-        return self.parking_slots.count()
-        
-    @property
-    def available_slots(self):
-        return self.parking_slots.filter(is_available=True).count()
+    def slot_type_counts(self):
+        return {
+            slot_type: getattr(self, ParkingSlot.counter_field(slot_type))
+            for slot_type, _ in ParkingSlot.SLOT_TYPES
+        }
+
+def apply_slot_counter_deltas(deltas):
+    """
+    Apply counter changes to parking spaces with F() expressions.
+    
+    deltas maps parking_space_id -> {counter field: change}; one UPDATE is
+    issued per space with a non-zero change.
+    """
+    for space_id, changes in deltas.items():
+        changes = {field: delta for field, delta in changes.items() if delta}
+        if changes:
+            ParkingSpace.objects.filter(pk=space_id).update(**{
+                field: F(field) + delta for field, delta in changes.items()
+            })
+
+def _slot_counter_changes(counted, sign):
+    """Counter deltas for adding (sign=1) or removing (sign=-1) one counted slot"""
+    space_id, slot_type, is_available = counted
+    changes = defaultdict(int)
+    changes['total_slots'] += sign
+    changes[ParkingSlot.counter_field(slot_type)] += sign
+    if is_available:
+        changes['available_slots'] += sign
+    return space_id, changes
+
+class ParkingSlotQuerySet(models.QuerySet):
+    """QuerySet that keeps ParkingSpace slot counters in step with bulk writes"""
+    
+    COUNTED_FIELDS = {'parking_space', 'parking_space_id', 'slot_type', 'is_available'}
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # Rows may have been skipped or merged, so recount instead of adding
+                ParkingSpace.objects.filter(
+                    pk__in={obj.parking_space_id for obj in objs}
+                ).refresh_slot_counters()
+            else:
+                deltas = defaultdict(lambda: defaultdict(int))
+                for obj in created:
+                    obj._counted = obj.counted_state()
+                    space_id, changes = _slot_counter_changes(obj._counted, 1)
+                    for field, delta in changes.items():
+                        deltas[space_id][field] += delta
+                apply_slot_counter_deltas(deltas)
+            _invalidate_space_caches({obj.parking_space_id for obj in objs})
+        return created
+    
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            slots = list(self.order_by().values_list('pk', 'parking_space_id'))
+            rows = super().update(**kwargs)
+            _bump_slot_responses(slots)
+            if not self.COUNTED_FIELDS.intersection(kwargs):
+                return rows
+            
+            space_ids = {space_id for _, space_id in slots}
+            new_space = kwargs.get('parking_space', kwargs.get('parking_space_id'))
+            if new_space is not None:
+                space_ids.add(getattr(new_space, 'pk', new_space))
+            ParkingSpace.objects.filter(pk__in=space_ids).refresh_slot_counters()
+            _invalidate_space_caches(space_ids)
+            if 'is_available' in kwargs:
+                _publish_slot_changes([slot_id for slot_id, _ in slots])
+        return rows
+    
+    def free_during(self, start_time, end_time):
+        """Available slots with no blocking booking overlapping [start_time, end_time)"""
+        blocking = Booking.objects.filter(
+            parking_slot=OuterRef('pk'),
+            status__in=Booking.BLOCKING_STATUSES,
+            start_time__lt=end_time,
+            end_time__gt=start_time
+        )
+        return self.filter(is_available=True).filter(~Exists(blocking))
 
 class ParkingSlot(models.Model):
     """Model for individual parking slots within a parking space"""
@@ -59,12 +324,123 @@ class ParkingSlot(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ParkingSlotQuerySet.as_manager()
+    
     class Meta:
         ordering = ['slot_number']
         unique_together = ['parking_space', 'slot_number']
+        indexes = [
+            # Keyset pagination, per space and across all slots
+            models.Index(fields=['parking_space', 'created_at', 'id'], name='slot_space_created'),
+            models.Index(fields=['created_at', 'id'], name='slot_created'),
+        ]
         
     def __str__(self):
         return f"{self.parking_space.name} - Slot {self.slot_number}"
+    
+    @staticmethod
+    def counter_field(slot_type):
+        """Name of the ParkingSpace counter column for a slot type"""
+        return f'{slot_type}_slots'
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'parking_space_id', 'slot_type', 'is_available'}.issubset(field_names):
+            instance._counted = instance.counted_state()
+        return instance
+    
+    def counted_state(self):
+        """The values that ParkingSpace slot counters depend on"""
+        return (self.parking_space_id, self.slot_type, self.is_available)
+    
+    def _lock_counted_state(self, using):
+        """
+        Lock the stored row and count from its current values rather than
+        the ones this instance was loaded with: two requests that loaded
+        the same slot and both toggle it must not both apply the delta.
+        Leaves _counted None when the row does not exist.
+        """
+        self._counted = ParkingSlot.objects.using(using or self._state.db).select_for_update().filter(
+            pk=self.pk
+        ).values_list('parking_space_id', 'slot_type', 'is_available').first()
+    
+    def save(self, *args, **kwargs):
+        # The counter update in post_save must commit or roll back with the row
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk is not None and not self._state.adding:
+                self._lock_counted_state(kwargs.get('using'))
+            super().save(*args, **kwargs)
+    
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using):
+            if self.pk is not None:
+                self._lock_counted_state(using)
+                if self._counted is None:
+                    # Already deleted, and removed from the counters, by someone else
+                    return 0, {}
+            return super().delete(using=using, keep_parents=keep_parents)
+
+class BookingQuerySet(models.QuerySet):
+    """QuerySet whose bulk_create and update do the work of the Booking save signals"""
+    
+    # Fields that place a booking on a slot and a day
+    PLACEMENT_FIELDS = {'parking_slot', 'parking_slot_id', 'start_time', 'end_time'}
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        from .references import next_reference
+        objs = list(objs)
+        for obj in objs:
+            if not obj.booking_reference:
+                obj.booking_reference = next_reference()
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            slot_ids = {obj.parking_slot_id for obj in objs}
+            blocking = {obj.parking_slot_id for obj in objs if obj.status in Booking.BLOCKING_STATUSES}
+            if blocking:
+                _refresh_occupancy(*blocking)
+            _invalidate_booked_spaces(slot_ids)
+            _publish_booking_changes(created)
+        return created
+    
+    def update(self, **kwargs):
+        # auto_now is not applied by update(); the rollups find changes by updated_at
+        kwargs.setdefault('updated_at', timezone.now())
+        with transaction.atomic(using=self.db):
+            bookings = list(self.order_by().values_list(
+                'pk', 'parking_slot_id', 'status', 'start_time', 'end_time'
+            ))
+            rows = super().update(**kwargs)
+            if not self.PLACEMENT_FIELDS.union(['status']).intersection(kwargs):
+                return rows
+            
+            slot_ids = {slot_id for _, slot_id, _, _, _ in bookings}
+            new_slot = kwargs.get('parking_slot', kwargs.get('parking_slot_id'))
+            if new_slot is not None:
+                slot_ids.add(getattr(new_slot, 'pk', new_slot))
+            _refresh_occupancy(*slot_ids)
+            _invalidate_booked_spaces(slot_ids)
+            if self.PLACEMENT_FIELDS.intersection(kwargs):
+                previous_starts = defaultdict(set)
+                for _, slot_id, _, start_time, _ in bookings:
+                    previous_starts[slot_id].add(start_time)
+                for slot_id, start_times in previous_starts.items():
+                    _mark_rollups_stale(slot_id, *start_times)
+            if isinstance(kwargs.get('status'), str):
+                _publish_booking_changes([
+                    Booking(
+                        pk=pk, parking_slot_id=slot_id, status=kwargs['status'],
+                        start_time=start_time, end_time=end_time
+                    )
+                    for pk, slot_id, status, start_time, end_time in bookings
+                    if status != kwargs['status']
+                ])
+        return rows
+    
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            _on_bookings_delete(self)
+            return super().delete()
 
 class Booking(models.Model):
     """Model for parking bookings"""
@@ -77,6 +453,9 @@ class Booking(models.Model):
         ('no_show', 'No Show'),
     ]
     
+    # Statuses that hold a slot and block overlapping bookings
+    BLOCKING_STATUSES = ['confirmed', 'active']
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
     parking_slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='bookings')
     vehicle_number = models.CharField(max_length=20)
@@ -101,16 +480,54 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookingQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Overlap checks: slot + window over bookings that hold the slot
+            models.Index(
+                fields=['parking_slot', 'start_time', 'end_time'], name='booking_slot_window_blocking',
+                condition=Q(status__in=['confirmed', 'active'])
+            ),
+            models.Index(fields=['parking_slot', 'status', 'start_time'], name='booking_slot_status_start'),
+            # Revenue and history stats
+            models.Index(fields=['status', 'created_at'], name='booking_status_created'),
+            models.Index(fields=['start_time'], name='booking_start_time'),
+            # Incremental rollup watermark scans
+            models.Index(fields=['updated_at'], name='booking_updated_at'),
+            # Keyset pagination: a driver's bookings, and newest-first walks for
+            # owners whose spaces hold most of the bookings
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created'),
+            models.Index(fields=['created_at', 'id'], name='booking_created'),
+            # Lifecycle transitions (lifecycle.py): only bookings still to be moved on
+            models.Index(
+                fields=['status', 'end_time'], name='booking_lifecycle_end',
+                condition=Q(status__in=['confirmed', 'active'])
+            ),
+            models.Index(
+                fields=['start_time'], name='booking_lifecycle_start', condition=Q(status='confirmed')
+            ),
+        ]
+        constraints = [
+            # A slot can hold only one confirmed/active booking at any instant
+            ExclusionConstraint(
+                name='booking_no_overlap',
+                expressions=[
+                    ('parking_slot', RangeOperators.EQUAL),
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+                condition=Q(status__in=['confirmed', 'active']),
+            ),
+        ]
         
     def __str__(self):
         return f"Booking {self.booking_reference} - {self.user.username}"
         
     def save(self, *args, **kwargs):
         if not self.booking_reference:
-            import uuid
-            self.booking_reference = str(uuid.uuid4())[:8].upper()
+            from .references import next_reference
+            self.booking_reference = next_reference()
         super().save(*args, **kwargs)
         
     @property
@@ -122,7 +539,332 @@ class Booking(models.Model):
     @property
     def is_active(self):
         """Check if booking is currently active"""
-        from django.utils import timezone
         now = timezone.now()
         return (self.status in ['confirmed', 'active'] and 
                 self.start_time <= now <= self.end_time)
+
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using):
+            _on_bookings_delete(Booking.objects.using(using or self._state.db).filter(pk=self.pk))
+            return super().delete(using=using, keep_parents=keep_parents)
+
+class DailySpaceStats(models.Model):
+    """Per-space, per-day booking rollup maintained by the rollup_stats command"""
+    parking_space = models.ForeignKey(ParkingSpace, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    
+    # Bookings starting on this day (any status)
+    bookings = models.PositiveIntegerField(default=0)
+    # Paid amount of completed bookings created on this day
+    completed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    # Booked hours of confirmed/active/completed bookings starting on this day
+    occupied_slot_hours = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    
+    # Set when a booking leaves this day (deleted or moved) so the next run recomputes it
+    is_stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['parking_space', 'day']
+        verbose_name_plural = 'Daily space stats'
+        
+    def __str__(self):
+        return f"{self.parking_space_id} - {self.day}"
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has processed Booking.updated_at"""
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name} @ {self.processed_until}"
+
+
+# Signals to keep ParkingSpace slot counters in sync with slot writes
+@receiver(post_save, sender=ParkingSlot)
+def update_slot_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    """Move the slot's contribution from its previous counted state to the current one"""
+    if raw:
+        return
+    previous = getattr(instance, '_counted', None)
+    current = instance.counted_state()
+    if previous != current:
+        _invalidate_availability({current[0], previous[0] if previous else None} - {None})
+    if not created and previous is None:
+        # Deferred load without the counted fields: recount the space
+        ParkingSpace.objects.filter(pk=instance.parking_space_id).refresh_slot_counters()
+    elif previous != current:
+        deltas = defaultdict(lambda: defaultdict(int))
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is not None:
+                space_id, changes = _slot_counter_changes(state, sign)
+                for field, delta in changes.items():
+                    deltas[space_id][field] += delta
+        apply_slot_counter_deltas(deltas)
+    if not created and (previous is None or previous[2] != current[2]):
+        _publish_slot_changes([instance.pk])
+    instance._counted = current
+
+@receiver(post_delete, sender=ParkingSlot)
+def update_slot_counters_on_delete(sender, instance, **kwargs):
+    """Remove a deleted slot from its space's counters"""
+    state = getattr(instance, '_counted', None) or instance.counted_state()
+    space_id, changes = _slot_counter_changes(state, -1)
+    apply_slot_counter_deltas({space_id: changes})
+    _invalidate_availability([space_id])
+
+
+# Signals to keep the slot occupancy index in sync with booking writes
+
+def _refresh_occupancy(*slot_ids):
+    """Refresh the slots' occupancy entries, and their availability bitmaps from the changes"""
+    from . import availability, occupancy
+    transaction.on_commit(lambda: availability.apply_changes(occupancy.refresh_slots(slot_ids)))
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_placement(sender, instance, **kwargs):
+    """
+    Remember the previous slot and start time so derived data at the old
+    placement is updated, and the previous status for the live feed.
+    """
+    instance._previous_placement = instance._previous_status = None
+    if instance.pk:
+        previous = Booking.objects.filter(
+            pk=instance.pk
+        ).values_list('parking_slot_id', 'start_time', 'status').first()
+        if previous:
+            instance._previous_placement = previous[:2]
+            instance._previous_status = previous[2]
+
+@receiver(post_save, sender=Booking)
+def update_occupancy_on_booking_save(sender, instance, **kwargs):
+    """Refresh the occupancy index for the booked slot"""
+    previous = getattr(instance, '_previous_placement', None)
+    _refresh_occupancy(instance.parking_slot_id, previous[0] if previous else None)
+
+@receiver(post_delete, sender=ParkingSlot)
+def forget_slot_occupancy(sender, instance, **kwargs):
+    """Remove a deleted slot from the occupancy index"""
+    from . import occupancy
+    slot_id = instance.pk
+    transaction.on_commit(lambda: occupancy.forget_slot(slot_id))
+
+
+# Signals to invalidate cached map tiles when spaces or slots change
+def _invalidate_map_tiles(*geohashes):
+    from . import clustering
+    transaction.on_commit(lambda: clustering.invalidate_tiles(*geohashes))
+
+@receiver(post_save, sender=ParkingSpace)
+@receiver(post_delete, sender=ParkingSpace)
+def invalidate_caches_on_space_change(sender, instance, **kwargs):
+    """Invalidate the map tiles and cached responses covering a changed parking space"""
+    geohashes = (instance.geohash, getattr(instance, '_previous_geohash', None))
+    _invalidate_map_tiles(*geohashes)
+    _bump_space_responses(instance.pk, *geohashes)
+
+@receiver(post_save, sender=ParkingSlot)
+@receiver(post_delete, sender=ParkingSlot)
+def invalidate_caches_on_slot_change(sender, instance, **kwargs):
+    """Invalidate map tiles, owner stats and cached responses covering a changed slot's parking space"""
+    space = ParkingSpace.objects.filter(
+        pk=instance.parking_space_id
+    ).values_list('geohash', 'owner_id').first()
+    if space:
+        geohash, owner_id = space
+        _invalidate_map_tiles(geohash)
+        _invalidate_stats(instance.parking_space_id, owner_id)
+        _bump_space_responses(instance.parking_space_id, geohash)
+    _bump_slot_responses([(instance.pk, instance.parking_space_id)])
+
+
+def _invalidate_space_caches(space_ids):
+    """Invalidate map tiles, owner stats and cached responses for spaces changed by a bulk slot write"""
+    rows = ParkingSpace.objects.filter(pk__in=space_ids).values_list('pk', 'geohash', 'owner_id')
+    for space_id, geohash, owner_id in rows:
+        _invalidate_map_tiles(geohash)
+        _invalidate_stats(space_id, owner_id)
+        _bump_space_responses(space_id, geohash)
+    _invalidate_availability(space_ids)
+
+
+# Availability bitmaps hold each space's available slots (see availability.py)
+def _invalidate_availability(space_ids):
+    from . import availability
+    space_ids = set(space_ids)
+    transaction.on_commit(lambda: availability.invalidate_spaces(space_ids))
+
+
+# Version bumps for the response cache (see response_cache.py)
+def _bump_responses(scopes):
+    from . import response_cache
+    transaction.on_commit(lambda: response_cache.bump(scopes))
+
+def _bump_space_responses(space_id, *geohashes):
+    """A space or its slots changed: its detail, the listings and its regions are stale"""
+    from . import response_cache
+    _bump_responses([
+        response_cache.space_scope(space_id), response_cache.CATALOG,
+        *response_cache.containing_regions(*geohashes)
+    ])
+
+def _bump_slot_responses(slots):
+    """Slots changed: their detail and their spaces' slot listings are stale"""
+    from . import response_cache
+    scopes = {response_cache.CATALOG}
+    for slot_id, space_id in slots:
+        scopes.update((response_cache.slot_scope(slot_id), response_cache.space_scope(space_id)))
+    _bump_responses(scopes)
+
+
+# Signals to invalidate cached owner statistics on booking writes
+def _invalidate_stats(space_id, owner_id):
+    from . import stats
+    transaction.on_commit(lambda: stats.invalidate(space_id, owner_id))
+
+@receiver(post_save, sender=Booking)
+def invalidate_caches_on_booking_change(sender, instance, **kwargs):
+    """
+    Invalidate the stats of the booked space and its owner, and the cached
+    search and map responses of its regions (window availability changed).
+    A booking moved off another slot invalidates that slot's space as well.
+    """
+    previous = getattr(instance, '_previous_placement', None)
+    _invalidate_booked_spaces({instance.parking_slot_id, previous[0] if previous else None} - {None})
+
+def _invalidate_booked_spaces(slot_ids):
+    """Invalidate the stats and regional responses of the spaces holding the given slots"""
+    from . import response_cache
+    spaces = ParkingSlot.objects.filter(pk__in=slot_ids).order_by().values_list(
+        'parking_space_id', 'parking_space__owner_id', 'parking_space__geohash'
+    ).distinct()
+    geohashes = []
+    for space_id, owner_id, geohash in spaces:
+        _invalidate_stats(space_id, owner_id)
+        geohashes.append(geohash)
+    if geohashes:
+        _bump_responses(response_cache.containing_regions(*geohashes))
+
+
+# Signals to flag daily rollups that lose a booking (deletes and moves)
+def _mark_rollups_stale(slot_id, *moments):
+    days = {timezone.localtime(moment).date() for moment in moments if moment}
+    # Joins the caller's transaction; an autocommit save gets a short one of its own
+    with transaction.atomic(savepoint=False):
+        ParkingSpace.objects.filter(parking_slots=slot_id).lock_rollups()
+        DailySpaceStats.objects.filter(
+            parking_space__parking_slots=slot_id, day__in=days
+        ).update(is_stale=True)
+
+@receiver(post_save, sender=Booking)
+def mark_rollups_on_booking_move(sender, instance, created, **kwargs):
+    """Flag the previous day's rollup when a booking moves to another slot or day"""
+    previous = getattr(instance, '_previous_placement', None)
+    if previous and previous != (instance.parking_slot_id, instance.start_time):
+        _mark_rollups_stale(*previous)
+
+
+
+# Booking deletes, direct or cascaded, are handled per delete rather than per
+# booking: Booking has no delete receivers, so cascades stay fast deletes
+def _on_bookings_delete(bookings):
+    """
+    Before a set of bookings is deleted: flag the rollups they were counted
+    in, and refresh the occupancy index and caches of their slots.
+    """
+    rows = bookings.order_by().annotate(
+        start_day=TruncDate('start_time'), created_day=TruncDate('created_at')
+    ).values_list('parking_slot_id', 'parking_slot__parking_space_id', 'start_day', 'created_day').distinct()
+    slot_ids = set()
+    days = defaultdict(set)
+    for slot_id, space_id, start_day, created_day in rows:
+        slot_ids.add(slot_id)
+        days[space_id].update((start_day, created_day))
+    if not slot_ids:
+        return
+    stale = Q(pk__in=[])
+    for space_id, space_days in days.items():
+        stale |= Q(parking_space_id=space_id, day__in=space_days)
+    ParkingSpace.objects.filter(pk__in=days).lock_rollups()
+    DailySpaceStats.objects.filter(stale).update(is_stale=True)
+    _refresh_occupancy(*slot_ids)
+    _invalidate_booked_spaces(slot_ids)
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=ParkingSpace)
+@receiver(pre_delete, sender=ParkingSlot)
+def handle_cascaded_booking_deletes(sender, instance, origin=None, **kwargs):
+    """
+    Handle every booking a user, space or slot delete cascades to, once
+    for the whole delete (origin is the instance or queryset being deleted).
+    """
+    if origin is None or getattr(origin, '_bookings_handled', False):
+        return
+    model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    scope = origin if isinstance(origin, models.QuerySet) else [origin.pk]
+    if model is ParkingSlot:
+        bookings = Booking.objects.filter(parking_slot__in=scope)
+    elif model is ParkingSpace:
+        bookings = Booking.objects.filter(parking_slot__parking_space__in=scope)
+    elif model is User:
+        bookings = Booking.objects.filter(
+            Q(user__in=scope) | Q(parking_slot__parking_space__owner__in=scope)
+        )
+    else:
+        return
+    _on_bookings_delete(bookings)
+    origin._bookings_handled = True
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ParkingSpace)
+@receiver(post_delete, sender=ParkingSlot)
+def reset_cascaded_booking_deletes(sender, instance, origin=None, **kwargs):
+    """Every pre_delete has run by now; a queryset deleted again is handled again"""
+    if origin is not None:
+        origin._bookings_handled = False
+
+
+# Signals to publish availability changes to the live feed (see live.py)
+LIVE_BOOKING_STATUSES = {'confirmed', 'cancelled', 'completed', 'no_show'}
+
+def _publish_slot_changes(slot_ids):
+    from . import live
+    transaction.on_commit(lambda: live.publish_slot_changes(slot_ids))
+
+def _publish_booking_changes(bookings):
+    from . import live
+    events = [
+        (booking.pk, booking.parking_slot_id, booking.status, booking.start_time,
+         booking.end_time, booking.status in Booking.BLOCKING_STATUSES)
+        for booking in bookings if booking.status in LIVE_BOOKING_STATUSES
+    ]
+    if events:
+        transaction.on_commit(lambda: live.publish_booking_changes(events))
+
+@receiver(post_save, sender=Booking)
+def publish_booking_status_change(sender, instance, **kwargs):
+    """Publish a booking that was confirmed, cancelled, completed or marked a no-show"""
+    if instance.status != getattr(instance, '_previous_status', None):
+        _publish_booking_changes([instance])
+
+
+# The booking_no_overlap exclusion constraint needs btree_gist for the slot equality
+@receiver(pre_migrate)
+def create_btree_gist_extension(sender, using, **kwargs):
+    """Ensure the btree_gist extension exists before parking migrations run"""
+    from django.db import connections
+    connection = connections[using]
+    if sender.name == 'parking' and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+
+# Booking references are drawn from a sequence (see references.py)
+@receiver(post_migrate)
+def create_booking_reference_sequence(sender, using, **kwargs):
+    """Ensure the booking reference sequence exists after parking migrations run"""
+    from django.db import connections
+    from .references import create_sequence
+    if sender.name == 'parking' and connections[using].vendor == 'postgresql':
+        create_sequence(connections[using])
@@ -0,0 +1,192 @@
+"""
+occupancy.py
+
+Per-slot occupancy index used for booking conflict checks.
+
+Each slot's confirmed/active booking intervals are kept in the Django cache
+as two sorted lists (start and end timestamps). A window [a, b) overlaps
+``#(starts < b) - #(ends <= a)`` intervals, so both questions below are
+answered with two bisections per slot:
+
+- is this slot free in [a, b)?   -> is_slot_free()
+- which of these slots are free? -> free_slot_ids()
+
+Entries are refreshed per slot from the database after each booking write
+(see the signal receivers in models.py). Entries missing from the cache are
+loaded on demand and stored with cache.add(), so a reader that loaded its
+rows before a booking committed never overwrites the entry refreshed by
+that commit.
+
+Entries expire after cache_timeout(): SHARED_CACHE_TIMEOUT when the cache is
+shared between processes (REDIS_URL), LOCAL_CACHE_TIMEOUT otherwise. With a
+per-process cache a booking only refreshes the entries of the process that
+committed it, so the short timeout bounds how long other processes keep
+answering from their older copy.
+
+Because of that lag the index is not authoritative: booking validation uses
+it to reject conflicts without a query and confirms a free answer against
+the database (see BookingSerializer.validate).
+
+``python manage.py rebuild_occupancy_index`` fills every slot's entry ahead
+of traffic; it only helps when the cache is shared.
+"""
+
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Booking, ParkingSlot
+
+CACHE_KEY = 'occupancy:slot:{}'
+REBUILD_BATCH_SIZE = 1000
+# Writes refresh entries in place, so the timeout only bounds rare races
+SHARED_CACHE_TIMEOUT = 24 * 60 * 60
+LOCAL_CACHE_TIMEOUT = 60
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache():
+    """Whether the default cache is visible to every process"""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def cache_timeout():
+    """Timeout for entries derived from bookings (see the module docstring)"""
+    return SHARED_CACHE_TIMEOUT if is_shared_cache() else LOCAL_CACHE_TIMEOUT
+
+
+class SlotOccupancy:
+    """Sorted blocking intervals for a single parking slot"""
+
+    def __init__(self, intervals=()):
+        # intervals: iterable of (start_ts, end_ts, booking_id)
+        self.intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in self.intervals]
+        self.ends = sorted(end for _, end, _ in self.intervals)
+
+    def overlap_count(self, start_ts, end_ts):
+        """Number of intervals overlapping [start_ts, end_ts)"""
+        return bisect_left(self.starts, end_ts) - bisect_right(self.ends, start_ts)
+
+    def overlapping_ids(self, start_ts, end_ts):
+        """Booking ids overlapping [start_ts, end_ts)"""
+        if not self.overlap_count(start_ts, end_ts):
+            return []
+        candidates = self.intervals[:bisect_left(self.starts, end_ts)]
+        return [booking_id for _, end, booking_id in candidates if end > start_ts]
+
+    def is_free(self, start_ts, end_ts, exclude_booking_id=None):
+        if exclude_booking_id is None:
+            return self.overlap_count(start_ts, end_ts) == 0
+        return not [
+            booking_id for booking_id in self.overlapping_ids(start_ts, end_ts)
+            if booking_id != exclude_booking_id
+        ]
+
+
+def _load_intervals(slot_ids):
+    """Read blocking intervals for the given slots from the database"""
+    intervals = {slot_id: [] for slot_id in slot_ids}
+    rows = Booking.objects.filter(
+        parking_slot_id__in=slot_ids,
+        status__in=Booking.BLOCKING_STATUSES
+    ).order_by().values_list('parking_slot_id', 'start_time', 'end_time', 'id')
+
+    for slot_id, start_time, end_time, booking_id in rows:
+        intervals[slot_id].append((start_time.timestamp(), end_time.timestamp(), booking_id))
+    return intervals
+
+
+def _store(intervals):
+    """Overwrite the entries; only for rows loaded after the bookings' last commit"""
+    cache.set_many(
+        {CACHE_KEY.format(slot_id): sorted(rows) for slot_id, rows in intervals.items()},
+        timeout=cache_timeout()
+    )
+
+
+def _fill(intervals):
+    """Store entries that are still missing, leaving any refreshed since the load alone"""
+    timeout = cache_timeout()
+    for slot_id, rows in intervals.items():
+        cache.add(CACHE_KEY.format(slot_id), sorted(rows), timeout=timeout)
+
+
+def get_occupancy(slot_ids):
+    """Return {slot_id: SlotOccupancy}, loading any missing entries from the database"""
+    slot_ids = list(slot_ids)
+    cached = cache.get_many([CACHE_KEY.format(slot_id) for slot_id in slot_ids])
+
+    result = {}
+    missing = []
+    for slot_id in slot_ids:
+        rows = cached.get(CACHE_KEY.format(slot_id))
+        if rows is None:
+            missing.append(slot_id)
+        else:
+            result[slot_id] = SlotOccupancy(rows)
+
+    if missing:
+        loaded = _load_intervals(missing)
+        _fill(loaded)
+        for slot_id, rows in loaded.items():
+            result[slot_id] = SlotOccupancy(rows)
+    return result
+
+
+def is_slot_free(slot_id, start_time, end_time, exclude_booking_id=None):
+    """Check whether a slot has no blocking booking overlapping [start_time, end_time)"""
+    occupancy = get_occupancy([slot_id])[slot_id]
+    return occupancy.is_free(start_time.timestamp(), end_time.timestamp(), exclude_booking_id)
+
+
+def free_slot_ids(slot_ids, start_time, end_time):
+    """Return the subset of slot_ids with no blocking booking in [start_time, end_time)"""
+    start_ts, end_ts = start_time.timestamp(), end_time.timestamp()
+    return [
+        slot_id for slot_id, occupancy in get_occupancy(slot_ids).items()
+        if occupancy.is_free(start_ts, end_ts)
+    ]
+
+
+def refresh_slots(slot_ids):
+    """
+    Reload the index entries for the given slots from the database.
+    
+    Returns {slot_id: (previous intervals or None if not indexed, current intervals)}.
+    """
+    slot_ids = [slot_id for slot_id in set(slot_ids) if slot_id is not None]
+    if not slot_ids:
+        return {}
+    previous = cache.get_many([CACHE_KEY.format(slot_id) for slot_id in slot_ids])
+    intervals = _load_intervals(slot_ids)
+    _store(intervals)
+    return {
+        slot_id: (previous.get(CACHE_KEY.format(slot_id)), sorted(rows))
+        for slot_id, rows in intervals.items()
+    }
+
+
+def forget_slot(slot_id):
+    cache.delete(CACHE_KEY.format(slot_id))
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Fill the index for every slot; returns the number of slots indexed"""
+    slot_ids = ParkingSlot.objects.order_by('pk').values_list('pk', flat=True)
+    total = 0
+    batch = []
+    for slot_id in slot_ids.iterator(chunk_size=batch_size):
+        batch.append(slot_id)
+        if len(batch) >= batch_size:
+            _fill(_load_intervals(batch))
+            total += len(batch)
+            batch = []
+    if batch:
+        _fill(_load_intervals(batch))
+        total += len(batch)
+    return total
@@ -0,0 +1,137 @@
+"""
+query_plans.py
+
+EXPLAIN-based plan regression checks for the hot Booking and ParkingSpace
+queries, shared by the QueryPlanTests test case and the check_query_plans
+command.
+
+seed() creates synthetic data and checks() lists the ORM queries to
+EXPLAIN. Run them after ANALYZE and with sequential scans disabled
+(disable_seqscan), so a Seq Scan over a parking table in a plan means no
+index can serve the query at all, independent of how much data was seeded.
+"""
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import geo, lifecycle
+from .models import Booking, ParkingSlot, ParkingSpace
+
+User = get_user_model()
+
+SEQ_SCAN = re.compile(r'Seq Scan on (parking_booking|parking_parkingspace|parking_parkingslot)\b')
+
+
+def seed(spaces_count=500, slots_per_space=10, bookings_count=50000):
+    """Deterministic spaces, slots and a year of bookings; returns (owner, slots)"""
+    rng = random.Random(42)
+    now = timezone.now()
+    owner = User.objects.create_user(
+        username='plan-check', email='plan-check@example.com', password=None
+    )
+
+    spaces = []
+    for index in range(spaces_count):
+        latitude = round(12.9 + rng.uniform(-0.5, 0.5), 6)
+        longitude = round(77.6 + rng.uniform(-0.5, 0.5), 6)
+        spaces.append(ParkingSpace(
+            name=f'Plan check {index}', address='Seeded', owner=owner,
+            latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude)),
+            geohash=geo.encode(latitude, longitude), hourly_rate=Decimal('2.00'),
+            is_active=rng.random() < 0.9,
+        ))
+    spaces = ParkingSpace.objects.bulk_create(spaces)
+
+    slots = ParkingSlot.objects.bulk_create([
+        ParkingSlot(parking_space=space, slot_number=str(number))
+        for space in spaces for number in range(slots_per_space)
+    ])
+
+    # Bookings are spread round-robin over the slots, each slot's windows
+    # laid end to end across the last year so booking_no_overlap holds
+    per_slot = -(-bookings_count // len(slots))
+    step = max(2, (24 * 395) // per_slot)
+    first_start = now - timedelta(days=365)
+    statuses = ['pending', 'confirmed', 'active', 'completed', 'completed', 'cancelled']
+    bookings = []
+    for index in range(bookings_count):
+        start = first_start + timedelta(hours=(index // len(slots)) * step)
+        bookings.append(Booking(
+            user=owner, parking_slot=slots[index % len(slots)], vehicle_number='PLAN',
+            start_time=start, end_time=start + timedelta(hours=rng.randint(1, min(8, step - 1))),
+            hourly_rate=Decimal('2.00'), total_amount=Decimal('4.00'),
+            paid_amount=Decimal('4.00'), status=rng.choice(statuses),
+            booking_reference=f'PLAN{index:012d}',
+        ))
+    Booking.objects.bulk_create(bookings, batch_size=5000)
+    return owner, slots
+
+
+def checks(owner, slots):
+    """(name, queryset) for each checked query"""
+    now = timezone.now()
+    slot = slots[len(slots) // 2]
+    window = (now + timedelta(days=1), now + timedelta(days=1, hours=2))
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    return [
+        ('slot overlap check', Booking.objects.filter(
+            parking_slot=slot, status__in=Booking.BLOCKING_STATUSES,
+            start_time__lt=window[1], end_time__gt=window[0]
+        )),
+        ('occupancy index load', Booking.objects.filter(
+            parking_slot_id__in=[s.pk for s in slots[:50]],
+            status__in=Booking.BLOCKING_STATUSES
+        ).order_by()),
+        ('window search', ParkingSpace.objects.filter(is_active=True).within_radius(
+            12.9, 77.6, 2.0
+        ).with_free_slot_count(*window).filter(free_slot_count__gt=0)),
+        ('map bounds', ParkingSpace.objects.filter(is_active=True).within_bounds(
+            12.85, 77.55, 12.95, 77.65
+        )),
+        ('monthly revenue', Booking.objects.filter(
+            status='completed', created_at__gte=day_start.replace(day=1)
+        ).order_by()),
+        ('today bookings', Booking.objects.filter(
+            start_time__gte=day_start, start_time__lt=day_start + timedelta(days=1)
+        ).order_by()),
+        ('rollup watermark', Booking.objects.filter(
+            updated_at__gte=now - timedelta(minutes=5)
+        ).order_by()),
+        ('owner spaces', ParkingSpace.objects.filter(owner=owner, is_active=True)),
+        # Due scans of the lifecycle transitions, one batch each
+        *[
+            (f'lifecycle {transition[0]} -> {transition[1]}', lifecycle.due(transition, now)[:lifecycle.BATCH_SIZE])
+            for transition in lifecycle.TRANSITIONS
+        ],
+        # Keyset pages as built by backend.pagination.KeysetPagination
+        ('booking keyset page', Booking.objects.filter(user=owner).filter(
+            created_at__lte=now
+        ).filter(Q(created_at__lt=now) | Q(pk__lt=slot.pk)).order_by('-created_at', '-pk')[:21]),
+        ('space keyset page', ParkingSpace.objects.filter(is_active=True).order_by(
+            '-created_at', '-pk'
+        )[:21]),
+        ('slot keyset page', ParkingSlot.objects.filter(
+            parking_space_id=slot.parking_space_id
+        ).order_by('-created_at', '-pk')[:21]),
+    ]
+
+
+def analyze(disable_seqscan=True):
+    """Refresh planner statistics and, for the rest of the transaction, disable sequential scans"""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE parking_parkingspace, parking_parkingslot, parking_booking')
+        if disable_seqscan:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+
+def sequential_scan(plan):
+    """The first sequential scan over a parking table in an EXPLAIN plan, or None"""
+    match = SEQ_SCAN.search(plan)
+    return match.group(0) if match else None
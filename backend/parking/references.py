@@ -0,0 +1,116 @@
+"""
+references.py
+
+Booking references: short, unique by construction and self-checking.
+
+A reference is a number drawn from a PostgreSQL sequence, scrambled by a
+fixed bijection of 40-bit integers (so consecutive bookings do not get
+consecutive references) and written as 8 Crockford base32 characters plus
+the Crockford mod-37 check symbol, e.g. ``4KX9T2QM7``. The sequence never
+repeats a value and the scramble is one-to-one, so references cannot
+collide and need no retry; 2**40 of them are available.
+
+Sequence values are taken in blocks of BLOCK_SIZE (the sequence's
+increment), so a process issues one nextval() per BLOCK_SIZE bookings.
+Gate kiosks can validate a typed reference with parse_reference() without
+touching the database: it accepts lower case, hyphens and the usual
+misreadings (O for 0, I/L for 1) and rejects any single wrong character or
+swapped pair of adjacent characters through the check symbol.
+"""
+
+import threading
+
+from django.db import connection
+
+SEQUENCE = 'parking_booking_reference_seq'
+# Must match the sequence's INCREMENT BY (see create_sequence)
+BLOCK_SIZE = 64
+BITS = 40
+LENGTH = BITS // 5
+
+SYMBOLS = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CHECK_SYMBOLS = SYMBOLS + '*~$=U'
+_VALUES = {symbol: value for value, symbol in enumerate(CHECK_SYMBOLS)}
+_VALUES.update({'O': 0, 'I': 1, 'L': 1})
+_MASK = (1 << BITS) - 1
+
+
+def create_sequence(using_connection):
+    """Create the reference sequence if it does not exist (run after migrate)"""
+    with using_connection.cursor() as cursor:
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} INCREMENT BY {BLOCK_SIZE}')
+
+
+def _scramble(number):
+    """One-to-one mix of 40-bit integers (odd multipliers and xorshifts are invertible)"""
+    number = (number * 0x9E3779B97) & _MASK
+    number ^= number >> 20
+    number = (number * 0x5DEECE66D) & _MASK
+    return number ^ (number >> 20)
+
+
+def _format(value):
+    chars = [SYMBOLS[(value >> shift) & 31] for shift in range(BITS - 5, -1, -5)]
+    return ''.join(chars) + CHECK_SYMBOLS[value % 37]
+
+
+def encode(number):
+    """Reference for a sequence number"""
+    return _format(_scramble(number))
+
+
+def parse_reference(text):
+    """
+    The canonical form of a typed reference.
+
+    Raises ValueError when it is not a well-formed reference or its check
+    symbol does not match.
+    """
+    text = text.strip().upper().replace('-', '')
+    if len(text) != LENGTH + 1:
+        raise ValueError('A booking reference has 9 characters')
+    value = 0
+    for char in text[:LENGTH]:
+        digit = _VALUES.get(char)
+        if digit is None or digit > 31:
+            raise ValueError(f'Invalid character {char!r} in booking reference')
+        value = (value << 5) | digit
+    if _VALUES.get(text[LENGTH]) != value % 37:
+        raise ValueError('Booking reference check character does not match')
+    return _format(value)
+
+
+def is_valid_reference(text):
+    try:
+        parse_reference(text)
+    except ValueError:
+        return False
+    return True
+
+
+class _Allocator:
+    """Hands out sequence numbers from blocks reserved with one nextval() each"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = self.end = 0
+
+    def take(self):
+        with self.lock:
+            if self.next >= self.end:
+                # nextval() is not transactional: a rolled-back block is skipped, never reused
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT nextval(%s)', [SEQUENCE])
+                    start = cursor.fetchone()[0]
+                self.next, self.end = start, start + BLOCK_SIZE
+            number = self.next
+            self.next += 1
+        return number
+
+
+_allocator = _Allocator()
+
+
+def next_reference():
+    """A new booking reference, unique across processes"""
+    return encode(_allocator.take())
@@ -0,0 +1,253 @@
+"""
+response_cache.py
+
+Versioned response cache and conditional GET for the read-heavy parking
+endpoints.
+
+Cached responses are keyed by the endpoint, its normalized query parameters
+and the current value of every version counter the response depends on:
+
+- ``catalog``          any space or slot change (space and slot listings)
+- ``space:<id>``       one space and its slots (space detail, slot list)
+- ``slot:<id>``        one slot (slot detail)
+- ``region:<prefix>``  spaces, slots and bookings inside a geohash cell
+                       (search and map responses for that area)
+- ``tile:<geohash>``   spaces and slots inside a map cluster tile (the
+                       tiles cached by clustering.py)
+
+Writes bump the counters through the signal receivers in models.py, so a
+changed space only invalidates the entries that can contain it; entries
+built against an old version are never read again and simply age out.
+Region counters are kept for every geohash prefix up to REGION_PRECISION,
+including the empty prefix, so a query can depend on a few coarse or
+fine cells (or on everything) and still see every bump beneath it.
+
+With a per-process cache (no REDIS_URL) a bump only reaches the process
+that made the write, so both entries and counters then expire after
+occupancy.LOCAL_CACHE_TIMEOUT: a counter that expires restarts from the
+current time, which retires every entry and validator built against it.
+
+Each counter holds the time of the last change to its scope (see bump),
+which also gives the responses their ETag and Last-Modified validators.
+Missing counters start from the current time rather than zero, so a
+counter evicted from the cache can never come back at a value that old
+entries were stored under.
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import geo, occupancy
+
+CATALOG = 'catalog'
+# Region counters cover geohash cells down to ~4.9 km x 4.9 km
+REGION_PRECISION = 5
+VERSION_KEY = 'rc:version:{}'
+ENTRY_KEY = 'rc:{}:{}'
+# Only bounds memory; invalidation is done by the version counters
+ENTRY_TIMEOUT = 60 * 60
+
+
+def entry_timeout():
+    """ENTRY_TIMEOUT, or the short local timeout when bumps do not reach other processes"""
+    return ENTRY_TIMEOUT if occupancy.is_shared_cache() else occupancy.LOCAL_CACHE_TIMEOUT
+
+
+def version_timeout():
+    """Counters never expire in a shared cache; locally they age out like the entries"""
+    return None if occupancy.is_shared_cache() else occupancy.LOCAL_CACHE_TIMEOUT
+
+
+def space_scope(space_id):
+    return f'space:{space_id}'
+
+
+def slot_scope(slot_id):
+    return f'slot:{slot_id}'
+
+
+def region_scope(prefix):
+    return f'region:{prefix}'
+
+
+def region_scopes(cells):
+    """Region scopes a query over geohash cells depends on (the root region when cells is None)"""
+    if cells is None:
+        return [region_scope('')]
+    return sorted({region_scope(cell[:REGION_PRECISION]) for cell in cells})
+
+
+def containing_regions(*geohashes):
+    """Every region scope containing one of the given geohashes, down to the root"""
+    scopes = {region_scope('')}
+    for geohash in geohashes:
+        if geohash:
+            scopes.update(
+                region_scope(geohash[:precision]) for precision in range(1, REGION_PRECISION + 1)
+            )
+    return scopes
+
+
+def scopes_for_radius(latitude, longitude, radius_km):
+    return region_scopes(geo.cells_for_radius(latitude, longitude, radius_km))
+
+
+def scopes_for_bounds(south, west, north, east):
+    return region_scopes(geo.cells_for_bounds(south, west, north, east))
+
+
+def _normalize(value):
+    if isinstance(value, Decimal):
+        return format(value.normalize(), 'f')
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).isoformat()
+    if isinstance(value, tuple):
+        return [_normalize(item) for item in value]
+    if isinstance(value, (list, set)):
+        return sorted(_normalize(item) for item in value)
+    return value
+
+
+def normalize_params(params):
+    """
+    Canonical form of request parameters: a QueryDict or validated serializer
+    data with blank values dropped and list values sorted (tuples keep their
+    order).
+    """
+    if hasattr(params, 'lists'):
+        params = {
+            key: values[0] if len(values) == 1 else values
+            for key, values in ((key, [value for value in values if value != ''])
+                                for key, values in params.lists())
+            if values
+        }
+    return {key: _normalize(value) for key, value in params.items() if value not in (None, '', [])}
+
+
+def versions(scopes):
+    """Current version of each scope, initialising missing counters"""
+    keys = {scope: VERSION_KEY.format(scope) for scope in scopes}
+    current = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in current]
+    if missing:
+        timeout = version_timeout()
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=timeout)
+        # Another process may have won the add, so read back what was stored
+        current.update(cache.get_many(missing))
+    return [current.get(keys[scope]) for scope in scopes]
+
+
+class CachedResponse:
+    """
+    The cache entry and HTTP validators for one response.
+
+    The strong ETag is the digest the entry is stored under, and
+    Last-Modified is the newest of its versions, so both change exactly
+    when the cached data would be rebuilt. The versions are read before
+    anything is computed, so a write that commits while the response is
+    being built bumps past the key it is stored under.
+
+    Last-Modified only has whole seconds, so it is left out while the
+    newest version's second is still running: a later change in that
+    second would carry the same Last-Modified and If-Modified-Since alone
+    would wrongly get a 304. The ETag is always sent.
+    """
+
+    def __init__(self, namespace, params, scopes):
+        scopes = sorted(set(scopes))
+        current = versions(scopes)
+        fingerprint = json.dumps(
+            [namespace, normalize_params(params), scopes, current], sort_keys=True, default=str
+        )
+        digest = hashlib.sha1(fingerprint.encode()).hexdigest()
+        self.key = ENTRY_KEY.format(namespace, digest)
+        self.etag = f'"{digest}"'
+        # A racing bump can push a version past the clock (see bump); that
+        # counts as the current second too
+        second = max(current) // 10 ** 9
+        self.last_modified = second if second < time.time_ns() // 10 ** 9 else None
+
+    def _set_validators(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+
+    @classmethod
+    async def acreate(cls, namespace, params, scopes):
+        """Async constructor: the version lookups run in one thread hop"""
+        return await sync_to_async(cls)(namespace, params, scopes)
+
+    def data(self, compute):
+        """Return compute() through the cache"""
+        data = cache.get(self.key)
+        if data is None:
+            data = compute()
+            cache.set(self.key, data, entry_timeout())
+        return data
+
+    def respond(self, request, compute):
+        """
+        A 304 when the client's If-None-Match / If-Modified-Since still
+        match, otherwise the (cached) data; compute() only runs on a miss.
+        """
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        if response is None:
+            response = Response(self.data(compute))
+        self._set_validators(response)
+        return response
+
+    async def adata(self, compute):
+        """Return await compute() through the cache"""
+        data = await cache.aget(self.key)
+        if data is None:
+            data = await compute()
+            await cache.aset(self.key, data, entry_timeout())
+        return data
+
+    async def arespond(self, request, compute):
+        """respond() for async views, with the data rendered as plain JSON"""
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                JSONRenderer().render(await self.adata(compute)), content_type='application/json'
+            )
+        self._set_validators(response)
+        return response
+
+
+def bump(scopes):
+    """
+    Move the given scopes to a new version.
+
+    Versions are nanosecond timestamps of the last change, advanced with
+    atomic increments so concurrent bumps can never land on the same value.
+    Two bumps racing from the same reading can overshoot the clock, which
+    CachedResponse allows for when it reports Last-Modified.
+    """
+    keys = [VERSION_KEY.format(scope) for scope in set(scopes)]
+    current = cache.get_many(keys)
+    for key in keys:
+        now = time.time_ns()
+        if key in current:
+            try:
+                cache.incr(key, max(1, now - current[key]))
+                continue
+            except ValueError:
+                pass  # evicted since it was read
+        cache.set(key, now, timeout=version_timeout())
@@ -0,0 +1,148 @@
+"""
+rollups.py
+
+Incremental maintenance of the DailySpaceStats rollup table.
+
+Each run finds the (space, day) pairs touched since the stored watermark:
+bookings whose updated_at moved past it, plus rollup rows flagged stale
+by booking deletes and moves. Only those pairs are recomputed from raw
+bookings, so the cost tracks recent activity rather than total history.
+
+A batch is read and rewritten in one transaction holding its spaces'
+rollup lock (ParkingSpaceQuerySet.lock_rollups), which booking deletes and
+moves also take before flagging rollups stale. A booking that leaves a day
+during a recompute is therefore either gone before the read, or flags the
+rewritten rows stale after the write; its mark is never wiped.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailySpaceStats, ParkingSpace, RollupWatermark
+
+WATERMARK_NAME = 'daily_space_stats'
+# Re-scan this much before the watermark to catch transactions that
+# committed after a previous run started but carry an earlier updated_at
+WATERMARK_OVERLAP = timedelta(minutes=5)
+OCCUPYING_STATUSES = ['confirmed', 'active', 'completed']
+DAYS_PER_BATCH = 31
+SPACES_PER_BATCH = 500
+
+
+def day_start(day):
+    """Aware start of a local day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def in_days(field, days):
+    """
+    Q for field falling on one of the local days, as half-open ranges
+    (consecutive days merged) rather than __date lookups so the time
+    indexes apply; matches nothing when days is empty.
+    """
+    condition = Q(pk__in=[])
+    days = sorted(days)
+    index = 0
+    while index < len(days):
+        last = index
+        while last + 1 < len(days) and days[last + 1] == days[last] + timedelta(days=1):
+            last += 1
+        condition |= Q(**{
+            f'{field}__gte': day_start(days[index]),
+            f'{field}__lt': day_start(days[last] + timedelta(days=1)),
+        })
+        index = last + 1
+    return condition
+
+
+def _touched_pairs(since):
+    """(space_id, day) pairs whose rollups may have changed since a moment"""
+    pairs = set()
+    if since is None:
+        bookings = Booking.objects.all()
+    else:
+        bookings = Booking.objects.filter(updated_at__gte=since)
+
+    rows = bookings.order_by().annotate(
+        start_day=TruncDate('start_time'),
+        created_day=TruncDate('created_at'),
+    ).values_list('parking_slot__parking_space_id', 'start_day', 'created_day').distinct()
+    for space_id, start_day, created_day in rows.iterator():
+        pairs.add((space_id, start_day))
+        pairs.add((space_id, created_day))
+
+    pairs.update(DailySpaceStats.objects.filter(is_stale=True).values_list('parking_space_id', 'day'))
+    return pairs
+
+
+def _recompute(spaces, days):
+    """Rebuild the rollup rows for every (space, day) combination of a batch"""
+    with transaction.atomic():
+        ParkingSpace.objects.filter(pk__in=spaces).lock_rollups()
+        bookings = Booking.objects.filter(parking_slot__parking_space_id__in=spaces).order_by()
+
+        values = defaultdict(lambda: {
+            'bookings': 0,
+            'completed_revenue': Decimal('0.00'),
+            'occupied_slot_hours': Decimal('0.00'),
+        })
+
+        by_start = bookings.filter(in_days('start_time', days)).annotate(
+            space_id=F('parking_slot__parking_space_id'),
+            day=TruncDate('start_time'),
+        ).values('space_id', 'day').annotate(
+            count=Count('id'),
+            occupied=Sum(
+                ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField()),
+                filter=Q(status__in=OCCUPYING_STATUSES)
+            ),
+        )
+        for row in by_start:
+            key = (row['space_id'], row['day'])
+            values[key]['bookings'] = row['count']
+            hours = (row['occupied'] or timedelta()).total_seconds() / 3600
+            values[key]['occupied_slot_hours'] = Decimal(str(round(hours, 2)))
+
+        by_created = bookings.filter(in_days('created_at', days), status='completed').annotate(
+            space_id=F('parking_slot__parking_space_id'),
+            day=TruncDate('created_at'),
+        ).values('space_id', 'day').annotate(revenue=Sum('paid_amount'))
+        for row in by_created:
+            values[(row['space_id'], row['day'])]['completed_revenue'] = row['revenue'] or Decimal('0.00')
+
+        DailySpaceStats.objects.filter(parking_space_id__in=spaces, day__in=days).delete()
+        DailySpaceStats.objects.bulk_create([
+            DailySpaceStats(parking_space_id=space_id, day=day, **row)
+            for (space_id, day), row in values.items()
+        ])
+
+
+def run(full=False):
+    """Process everything touched since the watermark; returns the number of touched (space, day) pairs"""
+    started = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    since = None if full or watermark is None else watermark.processed_until - WATERMARK_OVERLAP
+
+    pairs = _touched_pairs(since)
+    by_day = defaultdict(set)
+    for space_id, day in pairs:
+        by_day[day].add(space_id)
+
+    # Bound each recompute to a window of days and a chunk of spaces
+    ordered_days = sorted(by_day)
+    for index in range(0, len(ordered_days), DAYS_PER_BATCH):
+        days = ordered_days[index:index + DAYS_PER_BATCH]
+        spaces = sorted(set().union(*(by_day[day] for day in days)))
+        for start in range(0, len(spaces), SPACES_PER_BATCH):
+            _recompute(spaces[start:start + SPACES_PER_BATCH], days)
+
+    RollupWatermark.objects.update_or_create(
+        name=WATERMARK_NAME, defaults={'processed_until': started}
+    )
+    return len(pairs)
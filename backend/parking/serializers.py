@@ -1,11 +1,112 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
 from rest_framework import serializers
-from .models import ParkingSpace, ParkingSlot, Booking
+from .models import ParkingSpace, ParkingSlot, Booking, is_overlap_violation
+from . import occupancy, tariffs
 from django.contrib.auth import get_user_model
-from decimal import Decimal
 from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 
 User = get_user_model()
 
+class SlotRangeSerializer(serializers.Serializer):
+    """Compact spec for a run of slots, e.g. {"prefix": "B", "from": 1, "to": 500}"""
+    prefix = serializers.CharField(max_length=10, allow_blank=True, default='')
+    start = serializers.IntegerField(min_value=0)
+    end = serializers.IntegerField(min_value=0)
+    pad = serializers.IntegerField(min_value=0, max_value=6, default=0)
+    slot_type = serializers.ChoiceField(choices=ParkingSlot.SLOT_TYPES, default='standard')
+    is_available = serializers.BooleanField(default=True)
+    is_reserved = serializers.BooleanField(default=False)
+    notes = serializers.CharField(allow_blank=True, default='')
+    
+    def to_internal_value(self, data):
+        # "from" is a Python keyword, so map the public names onto start/end
+        data = dict(data)
+        if 'from' in data:
+            data['start'] = data.pop('from')
+        if 'to' in data:
+            data['end'] = data.pop('to')
+        return super().to_internal_value(data)
+    
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError('"from" must not be greater than "to"')
+        if data['end'] - data['start'] + 1 > ParkingSlotListSerializer.MAX_SLOTS:
+            raise serializers.ValidationError(
+                f"A range may not create more than {ParkingSlotListSerializer.MAX_SLOTS} slots"
+            )
+        return data
+    
+    def expand(self):
+        """Individual slot payloads for the validated range"""
+        data = dict(self.validated_data)
+        prefix, start, end, pad = data.pop('prefix'), data.pop('start'), data.pop('end'), data.pop('pad')
+        return [
+            dict(data, slot_number=f'{prefix}{number:0{pad}d}')
+            for number in range(start, end + 1)
+        ]
+
+class ParkingSlotListSerializer(serializers.ListSerializer):
+    """Validates a batch of slots up front and inserts them with one bulk_create"""
+    MAX_SLOTS = 5000
+    
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            # Count every item and range first so an oversized request is
+            # rejected before anything is expanded
+            specs = {}
+            count = 0
+            for index, item in enumerate(data):
+                if isinstance(item, dict) and ('from' in item or 'to' in item):
+                    spec = SlotRangeSerializer(data=item)
+                    if not spec.is_valid():
+                        raise serializers.ValidationError({index: spec.errors})
+                    specs[index] = spec
+                    count += spec.validated_data['end'] - spec.validated_data['start'] + 1
+                else:
+                    count += 1
+                if count > self.MAX_SLOTS:
+                    raise serializers.ValidationError(
+                        f"Cannot create more than {self.MAX_SLOTS} slots in one request"
+                    )
+            expanded = []
+            for index, item in enumerate(data):
+                if index in specs:
+                    expanded.extend(specs[index].expand())
+                else:
+                    expanded.append(item)
+            data = expanded
+        return super().to_internal_value(data)
+    
+    def validate(self, attrs):
+        """Reject slot numbers repeated in the batch or already used in the space"""
+        numbers = [item['slot_number'] for item in attrs]
+        duplicates = sorted(number for number, count in Counter(numbers).items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(
+                f"Duplicate slot numbers in request: {', '.join(duplicates[:20])}"
+            )
+        
+        existing = sorted(ParkingSlot.objects.filter(
+            parking_space=self.context['parking_space'],
+            slot_number__in=numbers
+        ).values_list('slot_number', flat=True))
+        if existing:
+            raise serializers.ValidationError(
+                f"Slot numbers already exist in this parking space: {', '.join(existing[:20])}"
+            )
+        return attrs
+    
+    def create(self, validated_data):
+        parking_space = self.context['parking_space']
+        with transaction.atomic():
+            return ParkingSlot.objects.bulk_create([
+                ParkingSlot(parking_space=parking_space, **item) for item in validated_data
+            ])
+
 class ParkingSlotSerializer(serializers.ModelSerializer):
     """Serializer for ParkingSlot model"""
     
@@ -13,12 +114,14 @@ class ParkingSlotSerializer(serializers.ModelSerializer):
         model = ParkingSlot
         fields = ['id', 'slot_number', 'slot_type', 'is_available', 'is_reserved', 'notes']
         read_only_fields = ['id']
+        list_serializer_class = ParkingSlotListSerializer
 
 class ParkingSpaceSerializer(serializers.ModelSerializer):
     """Serializer for ParkingSpace model with basic information"""
     owner_name = serializers.CharField(source='owner.username', read_only=True)
     total_slots = serializers.ReadOnlyField()
     available_slots = serializers.ReadOnlyField()
+    slot_type_counts = serializers.ReadOnlyField()
     
     class Meta:
         model = ParkingSpace
@@ -26,7 +129,7 @@ class ParkingSpaceSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'address', 'latitude', 'longitude',
             'owner', 'owner_name', 'hourly_rate', 'daily_rate', 'is_active',
             'has_security', 'has_covered_parking', 'has_ev_charging', 'has_disability_access',
-            'total_slots', 'available_slots', 'created_at', 'updated_at'
+            'total_slots', 'available_slots', 'slot_type_counts', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'owner', 'created_at', 'updated_at']
         
@@ -34,6 +137,15 @@ class ParkingSpaceSerializer(serializers.ModelSerializer):
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
 
+class ParkingSpaceSearchResultSerializer(ParkingSpaceSerializer):
+    """Serializer for search results, with window availability and price when requested"""
+    free_slot_count = serializers.IntegerField(read_only=True)
+    distance_km = serializers.FloatField(read_only=True)
+    quoted_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    
+    class Meta(ParkingSpaceSerializer.Meta):
+        fields = ParkingSpaceSerializer.Meta.fields + ['free_slot_count', 'distance_km', 'quoted_total']
+
 class ParkingSpaceDetailSerializer(ParkingSpaceSerializer):
     """Detailed serializer for ParkingSpace with parking slots"""
     parking_slots = ParkingSlotSerializer(many=True, read_only=True)
@@ -43,6 +155,8 @@ class ParkingSpaceDetailSerializer(ParkingSpaceSerializer):
 
 class BookingSerializer(serializers.ModelSerializer):
     """Serializer for Booking model"""
+    OVERLAP_ERROR = "Parking slot is already booked for the selected time period"
+    
     user_name = serializers.CharField(source='user.username', read_only=True)
     parking_space_name = serializers.CharField(source='parking_slot.parking_space.name', read_only=True)
     slot_number = serializers.CharField(source='parking_slot.slot_number', read_only=True)
@@ -81,21 +195,23 @@ class BookingSerializer(serializers.ModelSerializer):
             if not parking_slot.is_available:
                 raise serializers.ValidationError("Selected parking slot is not available")
             
-            # Check for overlapping bookings
-            overlapping_bookings = Booking.objects.filter(
-                parking_slot=parking_slot,
-                status__in=['confirmed', 'active'],
-                start_time__lt=end_time,
-                end_time__gt=start_time
-            )
-            
-            if self.instance:
-                overlapping_bookings = overlapping_bookings.exclude(pk=self.instance.pk)
-            
-            if overlapping_bookings.exists():
-                raise serializers.ValidationError(
-                    "Parking slot is already booked for the selected time period"
+            # Check for overlapping bookings: the occupancy index rejects most
+            # conflicts without a query, but it can lag writes made by other
+            # processes, so a free answer is confirmed against the database
+            exclude_id = self.instance.pk if self.instance else None
+            if start_time and end_time:
+                overlapping_bookings = Booking.objects.filter(
+                    parking_slot=parking_slot,
+                    status__in=Booking.BLOCKING_STATUSES,
+                    start_time__lt=end_time,
+                    end_time__gt=start_time
                 )
+                if exclude_id:
+                    overlapping_bookings = overlapping_bookings.exclude(pk=exclude_id)
+                if not occupancy.is_slot_free(
+                    parking_slot.id, start_time, end_time, exclude_booking_id=exclude_id
+                ) or overlapping_bookings.exists():
+                    raise serializers.ValidationError(self.OVERLAP_ERROR)
         
         return data
         
@@ -104,20 +220,33 @@ class BookingSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         
         # Calculate pricing
-        start_time = validated_data['start_time']
-        end_time = validated_data['end_time']
-        parking_slot = validated_data['parking_slot']
+        validated_data['hourly_rate'], validated_data['total_amount'] = self.price(
+            validated_data['parking_slot'], validated_data['start_time'], validated_data['end_time']
+        )
         
-        duration = end_time - start_time
-        hours = duration.total_seconds() / 3600
-        
-        hourly_rate = parking_slot.parking_space.hourly_rate
-        total_amount = Decimal(str(hours)) * hourly_rate
-        
-        validated_data['hourly_rate'] = hourly_rate
-        validated_data['total_amount'] = total_amount
-        
-        return super().create(validated_data)
+        with self.overlap_errors():
+            return super().create(validated_data)
+    
+    @staticmethod
+    def price(parking_slot, start_time, end_time):
+        """(hourly_rate, total_amount) for booking the slot over the window (see tariffs.py)"""
+        quote = tariffs.quote_space(parking_slot.parking_space, start_time, end_time, parking_slot.slot_type)
+        return quote.hourly_rate, quote.total_amount
+    
+    def update(self, instance, validated_data):
+        with self.overlap_errors():
+            return super().update(instance, validated_data)
+    
+    @contextmanager
+    def overlap_errors(self):
+        """Turn a booking_no_overlap constraint violation into the usual validation error"""
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError as exc:
+            if not is_overlap_violation(exc):
+                raise
+            raise serializers.ValidationError(self.OVERLAP_ERROR)
 
 class BookingCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for booking creation"""
@@ -138,11 +267,256 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         serializer = BookingSerializer(context=self.context)
         return serializer.create(validated_data)
 
+class BookingBatchItemSerializer(serializers.Serializer):
+    """One booking of a batch; slots are checked together by BookingBatchSerializer"""
+    parking_slot = serializers.IntegerField()
+    vehicle_number = serializers.CharField(max_length=20)
+    vehicle_type = serializers.CharField(max_length=50, default='car')
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    special_instructions = serializers.CharField(allow_blank=True, default='')
+    
+    def validate(self, data):
+        """Validate the booking window"""
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError("End time must be after start time")
+        if data['start_time'] < timezone.now():
+            raise serializers.ValidationError("Start time cannot be in the past")
+        return data
+
+class BookingBatchSerializer(serializers.Serializer):
+    """
+    Fleet booking of many slots at once.
+    
+    Items are validated one by one (start_time/end_time at the top level
+    apply to items that leave them out), then checked together: one query
+    loads every slot with its space for pricing, one occupancy lookup
+    finds conflicts, including overlaps between items of the batch, and
+    one query confirms the remaining items against the database (the index
+    can lag other processes' writes). The bookings are inserted with one
+    bulk_create. In all_or_nothing mode any
+    invalid item fails the whole batch; in best_effort mode the valid
+    items are booked and the rest reported.
+    """
+    MAX_BOOKINGS = 200
+    SLOT_ERROR = "Selected parking slot is not available"
+    DUPLICATE_ERROR = "Parking slot is booked more than once in this request for overlapping times"
+    
+    mode = serializers.ChoiceField(choices=['all_or_nothing', 'best_effort'], default='all_or_nothing')
+    start_time = serializers.DateTimeField(required=False)
+    end_time = serializers.DateTimeField(required=False)
+    bookings = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_BOOKINGS
+    )
+    
+    def _validate_items(self):
+        """({index: validated item}, {index: errors}) for the raw items"""
+        shared = {
+            field: self.initial_data[field] for field in ('start_time', 'end_time')
+            if field in self.initial_data
+        }
+        items, errors = {}, {}
+        for index, item in enumerate(self.validated_data['bookings']):
+            serializer = BookingBatchItemSerializer(data={**shared, **item})
+            if serializer.is_valid():
+                items[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+        return items, errors
+    
+    def _check_slots(self, items, errors):
+        """Drop items whose slot is missing, unavailable or taken; returns {slot_id: slot}"""
+        slots = ParkingSlot.objects.select_related('parking_space').in_bulk(
+            {item['parking_slot'] for item in items.values()}
+        )
+        booked = occupancy.get_occupancy(
+            slot_id for slot_id, slot in slots.items() if slot.is_available
+        )
+        accepted = defaultdict(list)
+        for index, item in list(items.items()):
+            slot_id = item['parking_slot']
+            start_ts, end_ts = item['start_time'].timestamp(), item['end_time'].timestamp()
+            if slot_id not in slots:
+                error = {'parking_slot': [f'Invalid pk "{slot_id}" - object does not exist.']}
+            elif not slots[slot_id].is_available:
+                error = {'non_field_errors': [self.SLOT_ERROR]}
+            elif not booked[slot_id].is_free(start_ts, end_ts):
+                error = {'non_field_errors': [BookingSerializer.OVERLAP_ERROR]}
+            elif any(start < end_ts and start_ts < end for start, end in accepted[slot_id]):
+                error = {'non_field_errors': [self.DUPLICATE_ERROR]}
+            else:
+                accepted[slot_id].append((start_ts, end_ts))
+                continue
+            errors[index] = error
+            del items[index]
+        self._check_database(items, errors)
+        return slots
+    
+    @staticmethod
+    def _check_database(items, errors):
+        """Drop items that overlap a blocking booking the occupancy index has not seen yet"""
+        if not items:
+            return
+        windows = Q()
+        for item in items.values():
+            windows |= Q(
+                parking_slot_id=item['parking_slot'],
+                start_time__lt=item['end_time'],
+                end_time__gt=item['start_time']
+            )
+        booked = defaultdict(list)
+        for slot_id, start_time, end_time in Booking.objects.filter(
+            windows, status__in=Booking.BLOCKING_STATUSES
+        ).values_list('parking_slot_id', 'start_time', 'end_time'):
+            booked[slot_id].append((start_time, end_time))
+        for index, item in list(items.items()):
+            if any(
+                start_time < item['end_time'] and item['start_time'] < end_time
+                for start_time, end_time in booked[item['parking_slot']]
+            ):
+                errors[index] = {'non_field_errors': [BookingSerializer.OVERLAP_ERROR]}
+                del items[index]
+    
+    def create(self, validated_data):
+        """Book the valid items; returns (created bookings, {index: errors})"""
+        items, errors = self._validate_items()
+        slots = self._check_slots(items, errors) if items else {}
+        if errors and validated_data['mode'] == 'all_or_nothing':
+            return [], errors
+        
+        user = self.context['request'].user
+        bookings = []
+        for item in items.values():
+            slot = slots[item['parking_slot']]
+            hourly_rate, total_amount = BookingSerializer.price(slot, item['start_time'], item['end_time'])
+            bookings.append(Booking(
+                user=user, parking_slot=slot, hourly_rate=hourly_rate, total_amount=total_amount,
+                **{field: value for field, value in item.items() if field != 'parking_slot'}
+            ))
+        # One INSERT in one transaction (BookingQuerySet.bulk_create also does the signals' work)
+        return Booking.objects.bulk_create(bookings), errors
+
+class BookingAllocateSerializer(BookingBatchItemSerializer):
+    """
+    Book any free slot of a parking space for a window.
+    
+    The slot is picked and locked with SELECT ... FOR UPDATE SKIP LOCKED,
+    so concurrent requests for the same space each take a different slot
+    instead of racing for the first free one and failing validation. The
+    booking is created confirmed, as it holds the slot it was given.
+    """
+    NO_SLOT_ERROR = "No free parking slot in this space for the selected time period"
+    # A slot whose booking commits after the search started can still be
+    # picked; the exclusion constraint rejects the insert and the search runs again
+    ATTEMPTS = 3
+    
+    parking_slot = None
+    parking_space = serializers.PrimaryKeyRelatedField(queryset=ParkingSpace.objects.filter(is_active=True))
+    slot_type = serializers.ChoiceField(choices=ParkingSlot.SLOT_TYPES, required=False)
+    
+    def create(self, validated_data):
+        parking_space = validated_data.pop('parking_space')
+        slot_type = validated_data.pop('slot_type', None)
+        start_time, end_time = validated_data['start_time'], validated_data['end_time']
+        
+        slots = ParkingSlot.objects.filter(parking_space=parking_space).free_during(start_time, end_time)
+        if slot_type:
+            slots = slots.filter(slot_type=slot_type)
+        # Lock only the slot row, not the space joined for the relation
+        slots = slots.select_for_update(skip_locked=True, of=('self',)).order_by('pk')
+        
+        for _ in range(self.ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    # Slots locked by concurrent allocations are skipped until they commit
+                    slot = slots.first()
+                    if slot is None:
+                        break
+                    slot.parking_space = parking_space
+                    hourly_rate, total_amount = BookingSerializer.price(slot, start_time, end_time)
+                    return Booking.objects.create(
+                        user=self.context['request'].user, parking_slot=slot, status='confirmed',
+                        hourly_rate=hourly_rate, total_amount=total_amount, **validated_data
+                    )
+            except IntegrityError as exc:
+                if not is_overlap_violation(exc):
+                    raise
+        raise serializers.ValidationError(self.NO_SLOT_ERROR)
+
+class QuoteItemSerializer(serializers.Serializer):
+    """One (space, window) to price"""
+    parking_space = serializers.IntegerField()
+    slot_type = serializers.ChoiceField(choices=ParkingSlot.SLOT_TYPES, default='standard')
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+class QuoteSerializer(serializers.Serializer):
+    """
+    Price many (space, window) pairs at once.
+    
+    parking_space, slot_type, start_time and end_time at the top level
+    apply to windows that leave them out, so one space can be quoted for
+    many windows or one window across many spaces. Windows are priced with
+    tariffs.quote_many (one query for every space's rates); invalid ones
+    are reported by index.
+    """
+    MAX_WINDOWS = 200
+    SHARED_FIELDS = ('parking_space', 'slot_type', 'start_time', 'end_time')
+    
+    parking_space = serializers.IntegerField(required=False)
+    slot_type = serializers.ChoiceField(choices=ParkingSlot.SLOT_TYPES, required=False)
+    start_time = serializers.DateTimeField(required=False)
+    end_time = serializers.DateTimeField(required=False)
+    windows = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_WINDOWS
+    )
+    
+    def quotes(self):
+        """({index: quote data}, {index: errors}) for the windows"""
+        shared = {field: self.initial_data[field] for field in self.SHARED_FIELDS if field in self.initial_data}
+        items, errors = {}, {}
+        for index, window in enumerate(self.validated_data['windows']):
+            serializer = QuoteItemSerializer(data={**shared, **window})
+            if serializer.is_valid():
+                items[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+        
+        quotes = tariffs.quote_many(
+            (item['parking_space'], item['start_time'], item['end_time'], item['slot_type'])
+            for item in items.values()
+        )
+        results = {}
+        for (index, item), quote in zip(items.items(), quotes):
+            if quote is None:
+                errors[index] = {'parking_space': [f'Invalid pk "{item["parking_space"]}" - object does not exist.']}
+            else:
+                results[index] = {**item, **quote._asdict()}
+        return results, errors
+
+class QuoteResultSerializer(serializers.Serializer):
+    """A priced window"""
+    parking_space = serializers.IntegerField()
+    slot_type = serializers.CharField()
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    hourly_rate = serializers.DecimalField(max_digits=8, decimal_places=2)
+    daily_rate = serializers.DecimalField(max_digits=8, decimal_places=2, allow_null=True)
+    billed_hours = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    capped_days = serializers.IntegerField()
+
 class ParkingSearchSerializer(serializers.Serializer):
     """Serializer for parking search parameters"""
     latitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False)
     longitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False)
     radius = serializers.FloatField(default=5.0, min_value=0.1, max_value=50.0)
+    nearest = serializers.IntegerField(required=False, min_value=1, max_value=100)
     start_time = serializers.DateTimeField(required=False)
     end_time = serializers.DateTimeField(required=False)
     slot_type = serializers.CharField(required=False)
@@ -151,6 +525,8 @@ class ParkingSearchSerializer(serializers.Serializer):
         child=serializers.CharField(),
         required=False
     )
+    # Price each result for the window (and slot_type) with quoted_total
+    quote = serializers.BooleanField(default=False)
     
     def validate(self, data):
         """Validate search parameters"""
@@ -165,9 +541,37 @@ class ParkingSearchSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 "Both latitude and longitude must be provided for location-based search"
             )
+        
+        if data.get('nearest') and data.get('latitude') is None:
+            raise serializers.ValidationError(
+                "latitude and longitude are required for nearest search"
+            )
+        
+        if data['quote'] and not (start_time and end_time):
+            raise serializers.ValidationError("start_time and end_time are required for quotes")
             
         return data
 
+class BookingExportSerializer(serializers.Serializer):
+    """Serializer for booking export parameters"""
+    file_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=Booking.STATUS_CHOICES),
+        required=False
+    )
+
+    def validate(self, data):
+        """Validate export parameters"""
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+
+        if start_date and end_date and start_date > end_date:
+            raise serializers.ValidationError("End date must not be before start date")
+
+        return data
+
 class ParkingSpaceStatsSerializer(serializers.Serializer):
     """Serializer for parking space statistics"""
     total_bookings = serializers.IntegerField()
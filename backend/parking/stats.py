@@ -0,0 +1,164 @@
+"""
+stats.py
+
+Owner statistics for the parking space stats and dashboard endpoints.
+
+Booking totals are read from the DailySpaceStats rollups (kept current by
+the rollup_stats command) for the days no booking has touched since the
+rollup watermark; the days that were touched (by bookings updated since
+then, or rollup rows flagged stale by deletes and moves) are aggregated
+live from raw bookings instead, together with today's figures. Before the
+first rollup run everything is aggregated live. Results are cached per
+space and per owner for a short TTL. Booking and slot writes invalidate
+the affected entries through the signal receivers in models.py.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailySpaceStats, ParkingSpace, RollupWatermark
+from .rollups import WATERMARK_NAME, WATERMARK_OVERLAP, day_start, in_days
+
+STATS_CACHE_TIMEOUT = 60
+SPACE_STATS_KEY = 'stats:space:{}'
+OWNER_STATS_KEY = 'stats:owner:{}'
+
+
+def _touched_days(bookings, rollups):
+    """
+    (start days, created days) whose rollups may be out of date: days of
+    bookings updated since the watermark and of stale rollup rows, or None
+    before the first rollup run.
+    """
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list(
+        'processed_until', flat=True
+    ).first()
+    if watermark is None:
+        return None
+
+    touched = bookings.filter(updated_at__gte=watermark - WATERMARK_OVERLAP).order_by().annotate(
+        start_day=TruncDate('start_time'), created_day=TruncDate('created_at')
+    ).values_list('start_day', 'created_day')
+    stale = rollups.filter(is_stale=True).order_by().values_list('day', 'day')
+
+    start_days, created_days = set(), set()
+    for start_day, created_day in touched.union(stale):
+        start_days.add(start_day)
+        created_days.add(created_day)
+    return start_days, created_days
+
+
+def _booking_aggregates(bookings, rollups):
+    """
+    Booking counts and revenue: rollup totals for untouched days plus one
+    live conditional aggregate over raw bookings for the touched days and
+    today.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    month_start = day_start(today.replace(day=1))
+    today_range = Q(start_time__gte=day_start(today), start_time__lt=day_start(today + timedelta(days=1)))
+    completed = Q(status='completed')
+
+    touched = _touched_days(bookings, rollups)
+    if touched is None:
+        # No rollups yet: every booking is counted live
+        counted, revenue = Q(pk__isnull=False), completed
+        history = {}
+    else:
+        start_days, created_days = touched
+        counted = in_days('start_time', start_days)
+        revenue = completed & in_days('created_at', created_days)
+        untouched_start = ~Q(day__in=start_days) if start_days else Q(pk__isnull=False)
+        untouched_created = ~Q(day__in=created_days) if created_days else Q(pk__isnull=False)
+        history = rollups.order_by().aggregate(
+            bookings=Sum('bookings', filter=untouched_start),
+            revenue=Sum('completed_revenue', filter=untouched_created),
+            monthly_revenue=Sum(
+                'completed_revenue', filter=untouched_created & Q(day__gte=month_start.date())
+            ),
+        )
+
+    live = bookings.filter(
+        Q(status__in=Booking.BLOCKING_STATUSES) | today_range | counted | revenue
+    ).order_by().aggregate(
+        active_bookings=Count('id', filter=Q(status__in=Booking.BLOCKING_STATUSES)),
+        today_bookings=Count('id', filter=today_range),
+        counted_bookings=Count('id', filter=counted),
+        revenue=Sum('paid_amount', filter=revenue),
+        monthly_revenue=Sum('paid_amount', filter=revenue & Q(created_at__gte=month_start)),
+    )
+
+    zero = Decimal('0.00')
+    return {
+        'total_bookings': (history.get('bookings') or 0) + live['counted_bookings'],
+        'active_bookings': live['active_bookings'],
+        'today_bookings': live['today_bookings'],
+        'total_revenue': (history.get('revenue') or zero) + (live['revenue'] or zero),
+        'monthly_revenue': (history.get('monthly_revenue') or zero) + (live['monthly_revenue'] or zero),
+    }
+
+
+def space_stats(parking_space):
+    """Statistics for a single parking space"""
+    key = SPACE_STATS_KEY.format(parking_space.pk)
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    stats = _booking_aggregates(
+        Booking.objects.filter(parking_slot__parking_space=parking_space),
+        DailySpaceStats.objects.filter(parking_space=parking_space)
+    )
+    total_slots = parking_space.total_slots
+    occupancy_rate = (stats['active_bookings'] / total_slots * 100) if total_slots > 0 else 0
+    stats['occupancy_rate'] = round(occupancy_rate, 2)
+
+    cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def owner_dashboard_stats(user):
+    """Dashboard statistics across every parking space owned by a user"""
+    key = OWNER_STATS_KEY.format(user.pk)
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    # Slot figures come from the stored counters, so this stays one small query
+    spaces = ParkingSpace.objects.filter(owner=user).order_by().aggregate(
+        total_spaces=Count('id'),
+        total_slots=Sum('total_slots'),
+        available_slots=Sum('available_slots'),
+    )
+    bookings = _booking_aggregates(
+        Booking.objects.filter(parking_slot__parking_space__owner=user),
+        DailySpaceStats.objects.filter(parking_space__owner=user)
+    )
+
+    stats = {
+        'total_spaces': spaces['total_spaces'],
+        'total_slots': spaces['total_slots'] or 0,
+        'available_slots': spaces['available_slots'] or 0,
+        'active_bookings': bookings['active_bookings'],
+        'today_bookings': bookings['today_bookings'],
+        'total_revenue': bookings['total_revenue'],
+        'monthly_revenue': bookings['monthly_revenue'],
+    }
+    cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate(space_id=None, owner_id=None):
+    keys = []
+    if space_id is not None:
+        keys.append(SPACE_STATS_KEY.format(space_id))
+    if owner_id is not None:
+        keys.append(OWNER_STATS_KEY.format(owner_id))
+    if keys:
+        cache.delete_many(keys)
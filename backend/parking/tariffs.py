@@ -0,0 +1,94 @@
+"""
+tariffs.py
+
+Price quotes for parking a slot of a space over a window.
+
+A window is billed in BILLING_INCREMENT_MINUTES steps, rounded up, except
+that up to GRACE_MINUTES past the last started step are free. Billing runs
+in 24-hour periods from the start of the window and, when the space has a
+daily_rate, no period costs more than that rate. Both rates are scaled by
+the slot type's SLOT_TYPE_MULTIPLIERS entry.
+
+quote() is pure arithmetic on rates that are already loaded (booking
+creation, search results); quote_many() prices many (space, window) pairs
+with one query for the spaces' rates.
+"""
+
+import math
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+BILLING_INCREMENT_MINUTES = 15
+GRACE_MINUTES = 5
+INCREMENTS_PER_DAY = 24 * 60 // BILLING_INCREMENT_MINUTES
+SLOT_TYPE_MULTIPLIERS = {
+    'standard': Decimal('1.00'),
+    'compact': Decimal('0.90'),
+    'large': Decimal('1.25'),
+    'motorcycle': Decimal('0.50'),
+    'disabled': Decimal('1.00'),
+    'ev': Decimal('1.20'),
+}
+CENT = Decimal('0.01')
+
+# hourly_rate and daily_rate after the slot type multiplier; capped_days is
+# the number of 24-hour periods charged at the daily rate
+Quote = namedtuple('Quote', 'hourly_rate daily_rate billed_hours total_amount capped_days')
+
+
+def billed_increments(start_time, end_time):
+    """Billing increments charged for a window (at least one)"""
+    minutes = math.ceil((end_time - start_time).total_seconds() / 60)
+    return max(1, math.ceil((minutes - GRACE_MINUTES) / BILLING_INCREMENT_MINUTES))
+
+
+def quote(hourly_rate, daily_rate, start_time, end_time, slot_type='standard'):
+    """Quote for a window at the given space rates (daily_rate may be None)"""
+    multiplier = SLOT_TYPE_MULTIPLIERS.get(slot_type, Decimal('1.00'))
+    hourly_rate = (hourly_rate * multiplier).quantize(CENT, ROUND_HALF_UP)
+    daily_rate = daily_rate and (daily_rate * multiplier).quantize(CENT, ROUND_HALF_UP)
+
+    increments = billed_increments(start_time, end_time)
+    full_days, remainder = divmod(increments, INCREMENTS_PER_DAY)
+    increment_price = hourly_rate * BILLING_INCREMENT_MINUTES / 60
+
+    total = Decimal('0')
+    capped_days = 0
+    for count, periods in ((INCREMENTS_PER_DAY, full_days), (remainder, 1 if remainder else 0)):
+        charge = increment_price * count
+        if daily_rate and charge > daily_rate:
+            charge = daily_rate
+            capped_days += periods
+        total += charge * periods
+
+    return Quote(
+        hourly_rate=hourly_rate,
+        daily_rate=daily_rate,
+        billed_hours=Decimal(increments * BILLING_INCREMENT_MINUTES) / 60,
+        total_amount=total.quantize(CENT, ROUND_HALF_UP),
+        capped_days=capped_days,
+    )
+
+
+def quote_space(space, start_time, end_time, slot_type='standard'):
+    return quote(space.hourly_rate, space.daily_rate, start_time, end_time, slot_type)
+
+
+def quote_many(requests):
+    """
+    Quotes for (space_id, start_time, end_time, slot_type) requests, in
+    order; None for spaces that do not exist or are not active.
+    """
+    from .models import ParkingSpace
+
+    requests = list(requests)
+    rates = {
+        space_id: (hourly_rate, daily_rate)
+        for space_id, hourly_rate, daily_rate in ParkingSpace.objects.filter(
+            pk__in={space_id for space_id, _, _, _ in requests}, is_active=True
+        ).values_list('pk', 'hourly_rate', 'daily_rate')
+    }
+    return [
+        quote(*rates[space_id], start_time, end_time, slot_type) if space_id in rates else None
+        for space_id, start_time, end_time, slot_type in requests
+    ]
@@ -0,0 +1,232 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import geo, lifecycle, occupancy, query_plans
+from .models import Booking, ParkingSlot, ParkingSpace
+from .serializers import BookingSerializer
+
+User = get_user_model()
+
+
+def seed_spaces(owner, driver, count, slots_per_space=4, start=None, end=None):
+    """
+    count spaces around one point; when a window is given, the first slot of
+    every space and every slot of the even-numbered spaces are booked across it
+    """
+    first = ParkingSpace.objects.count()
+    spaces = []
+    for index in range(first, first + count):
+        latitude = 12.9 + (index % 10) * 0.001
+        longitude = 77.6 + (index // 10) * 0.001
+        spaces.append(ParkingSpace(
+            name=f'Space {index}', address=f'{index} Test Road', owner=owner,
+            latitude=Decimal(f'{latitude:.6f}'), longitude=Decimal(f'{longitude:.6f}'),
+            geohash=geo.encode(latitude, longitude), hourly_rate=Decimal('20.00'),
+        ))
+    spaces = ParkingSpace.objects.bulk_create(spaces)
+    slots = ParkingSlot.objects.bulk_create([
+        ParkingSlot(parking_space=space, slot_number=str(number))
+        for space in spaces for number in range(slots_per_space)
+    ])
+    if start and end:
+        booked_spaces = set(spaces[first % 2::2])
+        Booking.objects.bulk_create([
+            Booking(
+                user=driver, parking_slot=slot, vehicle_number='TEST',
+                start_time=start, end_time=end, hourly_rate=Decimal('20.00'),
+                total_amount=Decimal('40.00'), status='confirmed',
+                booking_reference=f'T{slot.pk}',
+            )
+            for slot in slots
+            if slot.slot_number == '0' or slot.parking_space in booked_spaces
+        ])
+    return spaces
+
+
+class QueryCountTests(TestCase):
+    """List and search endpoints issue the same number of queries whatever the data size"""
+
+    SIZES = (5, 50)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='Test-pass-0', user_type='owner'
+        )
+        cls.driver = User.objects.create_user(
+            username='driver', email='driver@example.com', password='Test-pass-0'
+        )
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+        cls.end = cls.start + timedelta(hours=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def assertQueriesAtEachSize(self, num, url, params=None, check=None):
+        """Grow the data through SIZES, expecting num queries for a cold request at each size"""
+        for size in self.SIZES:
+            seed_spaces(
+                self.owner, self.driver, size - ParkingSpace.objects.count(),
+                start=self.start, end=self.end
+            )
+            cache.clear()
+            with self.subTest(spaces=size), self.assertNumQueries(num):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, 200)
+            if check:
+                check(response.json(), size)
+
+    def window(self, **params):
+        return dict(params, start_time=self.start.isoformat(), end_time=self.end.isoformat())
+
+    def check_free_slots(self, results, size):
+        # Odd-numbered spaces keep three of their four slots; even ones are fully booked
+        odd = ParkingSpace.objects.order_by('pk').values_list('pk', flat=True)[1::2]
+        self.assertEqual({result['id'] for result in results}, set(odd))
+        for result in results:
+            self.assertEqual(result['free_slot_count'], 3)
+
+    def test_space_list(self):
+        self.assertQueriesAtEachSize(1, reverse('parking:parkingspace-list'))
+
+    def test_search(self):
+        self.assertQueriesAtEachSize(1, reverse('parking:space-search'))
+
+    def test_window_search(self):
+        # Without a location the free slots are counted in SQL, not from bitmaps
+        self.assertQueriesAtEachSize(
+            1, reverse('parking:space-search'), self.window(), check=self.check_free_slots
+        )
+
+    def test_window_search_by_location(self):
+        self.assertQueriesAtEachSize(
+            3, reverse('parking:space-search'),
+            self.window(latitude='12.9', longitude='77.6', radius=50),
+            check=self.check_free_slots
+        )
+
+    def test_nearest_window_search(self):
+        # The geohash neighbourhood widens with the distance to the k-th
+        # space, not with the number of spaces further out
+        self.assertQueriesAtEachSize(
+            4, reverse('parking:space-search'),
+            self.window(latitude='12.9', longitude='77.6', nearest=1),
+            check=lambda results, size: self.assertEqual(len(results), 1)
+        )
+
+
+class BookingOverlapTests(TestCase):
+    """The occupancy index is only a fast rejection: the database decides"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='Test-pass-0', user_type='owner'
+        )
+        cls.driver = User.objects.create_user(
+            username='driver', email='driver@example.com', password='Test-pass-0'
+        )
+        cls.slot = ParkingSlot.objects.get(parking_space=seed_spaces(cls.owner, cls.driver, 1, 1)[0])
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+        cls.end = cls.start + timedelta(hours=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+        # Book the slot behind the index's back, as another process with its
+        # own local cache would, while this process still holds an empty entry
+        Booking.objects.bulk_create([Booking(
+            user=self.driver, parking_slot=self.slot, vehicle_number='OTHER',
+            start_time=self.start, end_time=self.end, hourly_rate=Decimal('20.00'),
+            total_amount=Decimal('40.00'), status='confirmed', booking_reference='OTHER',
+        )])
+        cache.set(occupancy.CACHE_KEY.format(self.slot.pk), [])
+        self.assertTrue(occupancy.is_slot_free(self.slot.pk, self.start, self.end))
+
+    def test_create_rejects_overlap_missing_from_index(self):
+        response = self.client.post(reverse('parking:booking-list'), {
+            'parking_slot': self.slot.pk, 'vehicle_number': 'TEST',
+            'start_time': self.start.isoformat(), 'end_time': self.end.isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(BookingSerializer.OVERLAP_ERROR, response.json()['non_field_errors'])
+
+    def test_batch_rejects_overlap_missing_from_index(self):
+        response = self.client.post(reverse('parking:booking-batch'), {
+            'mode': 'best_effort',
+            'start_time': self.start.isoformat(), 'end_time': self.end.isoformat(),
+            'bookings': [{'parking_slot': self.slot.pk, 'vehicle_number': 'TEST'}],
+        }, format='json')
+        self.assertEqual(Booking.objects.filter(vehicle_number='TEST').count(), 0)
+        self.assertIn(BookingSerializer.OVERLAP_ERROR, str(response.json()))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plan checks need PostgreSQL')
+class QueryPlanTests(TestCase):
+    """The hot Booking and ParkingSpace queries are served by indexes (see query_plans.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.slots = query_plans.seed(spaces_count=100, bookings_count=10000)
+
+    def test_no_sequential_scans(self):
+        query_plans.analyze()
+        for name, queryset in query_plans.checks(self.owner, self.slots):
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(query_plans.sequential_scan(plan), f'{name}:\n{plan}')
+
+
+class LifecycleTests(TestCase):
+    """Bookings move through their statuses as their windows pass (see lifecycle.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='Test-pass-0', user_type='owner'
+        )
+        cls.driver = User.objects.create_user(
+            username='driver', email='driver@example.com', password='Test-pass-0'
+        )
+        cls.slot = ParkingSlot.objects.get(parking_space=seed_spaces(cls.owner, cls.driver, 1, 1)[0])
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+        cls.end = cls.start + timedelta(hours=2)
+
+    def book(self, **fields):
+        booking, = Booking.objects.bulk_create([Booking(
+            user=self.driver, parking_slot=self.slot, vehicle_number='TEST',
+            start_time=self.start, end_time=self.end, hourly_rate=Decimal('20.00'),
+            total_amount=Decimal('40.00'), status='confirmed', booking_reference='LIFECYCLE',
+            **fields
+        )])
+        return booking
+
+    def assertStatusesAt(self, booking, *expected):
+        """Run the lifecycle pass during and after the window, checking the status after each"""
+        for now, status in zip((self.start + timedelta(hours=1), self.end), expected):
+            lifecycle.run(now=now)
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, status)
+
+    def test_no_show(self):
+        self.assertStatusesAt(self.book(), 'confirmed', 'no_show')
+
+    def test_checked_in(self):
+        booking = self.book(actual_start_time=self.start)
+        self.assertStatusesAt(booking, 'active', 'completed')
+
+    def test_activated_without_check_in(self):
+        booking = self.book()
+        Booking.objects.filter(pk=booking.pk).update(status='active')
+        self.assertStatusesAt(booking, 'active', 'no_show')
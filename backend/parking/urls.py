@@ -12,17 +12,18 @@ router.register(r'bookings', views.BookingViewSet, basename='booking')
 app_name = 'parking'
 
 urlpatterns = [
-    # Include router URLs
-    path('', include(router.urls)),
-    
-    # Search and filter endpoints
-    path('spaces/search/', views.ParkingSpaceSearchView.as_view(), name='space-search'),
-    path('spaces/nearby/', views.NearbyParkingSpacesView.as_view(), name='spaces-nearby'),
-    
-    # Booking management
-    path('bookings/my/', views.MyBookingsView.as_view(), name='my-bookings'),
-    path('bookings/active/', views.ActiveBookingsView.as_view(), name='active-bookings'),
+    # Search, map and analytics endpoints (before the router so
+    # spaces/search/ is not taken for a space detail route)
+    path('spaces/search/', views.search_parking, name='space-search'),
+    path('map/', views.map_data, name='map-data'),
+    path('live/', views.live_feed, name='live-feed'),
+    path('quotes/', views.quote_prices, name='quotes'),
+    # Async view in place of a viewset action (DRF viewsets are sync only)
+    path('slots/<int:pk>/availability/', views.slot_availability, name='parkingslot-availability'),
     
     # Analytics and management (for owners)
-    path('my-spaces/', views.MyParkingSpacesView.as_view(), name='my-spaces'),
+    path('dashboard/', views.dashboard_stats, name='dashboard-stats'),
+    
+    # Include router URLs
+    path('', include(router.urls)),
 ]
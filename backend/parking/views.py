@@ -1,22 +1,34 @@
-from django.shortcuts import render
-from rest_framework import viewsets, status, permissions
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Count, Sum, Avg
+from django.db.models import Q
 from django.utils import timezone
-from decimal import Decimal
-from datetime import datetime, timedelta
-import math
+from datetime import datetime
+import asyncio
 
 from .models import ParkingSpace, ParkingSlot, Booking
 from .serializers import (
     ParkingSpaceSerializer, ParkingSpaceDetailSerializer,
-    ParkingSlotSerializer, BookingSerializer, BookingCreateSerializer,
-    ParkingSearchSerializer, ParkingSpaceStatsSerializer,
-    DashboardStatsSerializer
+    ParkingSlotSerializer, BookingSerializer,
+    ParkingSearchSerializer, ParkingSpaceSearchResultSerializer, ParkingSpaceStatsSerializer,
+    DashboardStatsSerializer, BookingExportSerializer, BookingBatchSerializer,
+    BookingAllocateSerializer, QuoteSerializer, QuoteResultSerializer
 )
 from .permissions import IsOwnerOrReadOnly, IsBookingOwnerOrParkingOwner
+from backend.async_api import async_api_view, json_response
+from . import availability, clustering, exports, live, occupancy, response_cache, tariffs
+from . import stats as parking_stats
+
+def _list_params(request):
+    """Cache key parameters of a paginated list (its links are absolute, so the host counts)"""
+    return dict(
+        response_cache.normalize_params(request.query_params),
+        _url=request.build_absolute_uri(request.path)
+    )
 
 class ParkingSpaceViewSet(viewsets.ModelViewSet):
     """ViewSet for managing parking spaces"""
@@ -25,9 +37,12 @@ class ParkingSpaceViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Return parking spaces based on user permissions"""
+        queryset = ParkingSpace.objects.with_slot_counts()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('parking_slots')
         if self.action in ['list', 'retrieve']:
-            return ParkingSpace.objects.filter(is_active=True)
-        return ParkingSpace.objects.filter(owner=self.request.user)
+            return queryset.filter(is_active=True)
+        return queryset.filter(owner=self.request.user)
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
@@ -35,51 +50,33 @@ class ParkingSpaceViewSet(viewsets.ModelViewSet):
             return ParkingSpaceDetailSerializer
         return ParkingSpaceSerializer
     
+    def list(self, request, *args, **kwargs):
+        """Active parking spaces, cached (and conditional) until any space or slot changes"""
+        entry = response_cache.CachedResponse(
+            'spaces:list', _list_params(request), [response_cache.CATALOG]
+        )
+        return entry.respond(
+            request, lambda: super(ParkingSpaceViewSet, self).list(request, *args, **kwargs).data
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        """A parking space with its slots, cached (and conditional) until the space or its slots change"""
+        try:
+            space_id = int(kwargs['pk'])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        entry = response_cache.CachedResponse(
+            'spaces:detail', {'id': space_id}, [response_cache.space_scope(space_id)]
+        )
+        return entry.respond(
+            request, lambda: super(ParkingSpaceViewSet, self).retrieve(request, *args, **kwargs).data
+        )
+    
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
         """Get statistics for a specific parking space"""
         parking_space = self.get_object()
-        
-        # Calculate stats
-        total_bookings = parking_space.parking_slots.aggregate(
-            count=Count('bookings')
-        )['count']
-        
-        active_bookings = Booking.objects.filter(
-            parking_slot__parking_space=parking_space,
-            status__in=['confirmed', 'active']
-        ).count()
-        
-        today = timezone.now().date()
-        today_bookings = Booking.objects.filter(
-            parking_slot__parking_space=parking_space,
-            start_time__date=today
-        ).count()
-        
-        total_revenue = Booking.objects.filter(
-            parking_slot__parking_space=parking_space,
-            status='completed'
-        ).aggregate(Sum('paid_amount'))['paid_amount__sum'] or Decimal('0.00')
-        
-        this_month = timezone.now().replace(day=1)
-        monthly_revenue = Booking.objects.filter(
-            parking_slot__parking_space=parking_space,
-            status='completed',
-            created_at__gte=this_month
-        ).aggregate(Sum('paid_amount'))['paid_amount__sum'] or Decimal('0.00')
-        
-        # Calculate occupancy rate
-        total_slots = parking_space.total_slots
-        occupancy_rate = (active_bookings / total_slots * 100) if total_slots > 0 else 0
-        
-        stats_data = {
-            'total_bookings': total_bookings,
-            'active_bookings': active_bookings,
-            'today_bookings': today_bookings,
-            'total_revenue': total_revenue,
-            'monthly_revenue': monthly_revenue,
-            'occupancy_rate': round(occupancy_rate, 2)
-        }
+        stats_data = parking_stats.space_stats(parking_space)
         
         serializer = ParkingSpaceStatsSerializer(stats_data)
         return Response(serializer.data)
@@ -90,16 +87,14 @@ class ParkingSpaceViewSet(viewsets.ModelViewSet):
         parking_space = self.get_object()
         slots_data = request.data.get('slots', [])
         
-        created_slots = []
-        for slot_data in slots_data:
-            slot_data['parking_space'] = parking_space.id
-            serializer = ParkingSlotSerializer(data=slot_data)
-            if serializer.is_valid():
-                slot = serializer.save()
-                created_slots.append(slot)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Validate every slot (and expand range specs) before inserting any
+        serializer = ParkingSlotSerializer(
+            data=slots_data, many=True, context={'parking_space': parking_space}
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+        created_slots = serializer.save()
         serializer = ParkingSlotSerializer(created_slots, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -118,67 +113,129 @@ class ParkingSlotViewSet(viewsets.ModelViewSet):
             
         return queryset
     
-    @action(detail=True, methods=['get'])
-    def availability(self, request, pk=None):
-        """Check availability of a parking slot"""
-        slot = self.get_object()
-        start_time = request.query_params.get('start_time')
-        end_time = request.query_params.get('end_time')
-        
-        if not start_time or not end_time:
-            return Response(
-                {'error': 'start_time and end_time parameters required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+    def list(self, request, *args, **kwargs):
+        """Slots of one parking space (or of all), cached and conditional on the space versions"""
         try:
-            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            scopes = [response_cache.space_scope(int(request.query_params['parking_space']))]
+        except (KeyError, ValueError):
+            scopes = [response_cache.CATALOG]
+        entry = response_cache.CachedResponse('slots:list', _list_params(request), scopes)
+        return entry.respond(
+            request, lambda: super(ParkingSlotViewSet, self).list(request, *args, **kwargs).data
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        """A parking slot, cached and conditional on its version"""
+        try:
+            slot_id = int(kwargs['pk'])
         except ValueError:
-            return Response(
-                {'error': 'Invalid datetime format'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return super().retrieve(request, *args, **kwargs)
+        entry = response_cache.CachedResponse(
+            'slots:detail', {'id': slot_id}, [response_cache.slot_scope(slot_id)]
+        )
+        return entry.respond(
+            request, lambda: super(ParkingSlotViewSet, self).retrieve(request, *args, **kwargs).data
+        )
+
+class BookingViewSet(viewsets.ModelViewSet):
+    """ViewSet for bookings made by the user or held on their parking spaces"""
+    serializer_class = BookingSerializer
+    permission_classes = [IsAuthenticated, IsBookingOwnerOrParkingOwner]
+    
+    def get_queryset(self):
+        """Return the user's own bookings and bookings on spaces they own"""
+        user = self.request.user
+        queryset = Booking.objects.select_related('user', 'parking_slot__parking_space__owner')
+        if self.action != 'list':
+            return queryset.filter(Q(user=user) | Q(parking_slot__parking_space__owner=user))
         
-        # Check for overlapping bookings
-        overlapping = Booking.objects.filter(
-            parking_slot=slot,
-            status__in=['confirmed', 'active'],
-            start_time__lt=end_dt,
-            end_time__gt=start_dt
-        ).exists()
+        # An OR across the slot/space join can only be answered by scanning every
+        # booking; with the owned slot ids inlined both sides are index lookups,
+        # and a driver who owns nothing pages straight off booking_user_created
+        owned_slots = list(ParkingSlot.objects.filter(
+            parking_space__owner=user
+        ).order_by().values_list('pk', flat=True))
+        condition = Q(user=user)
+        if owned_slots:
+            condition |= Q(parking_slot_id__in=owned_slots)
+        return queryset.filter(condition)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Book many slots in one request (fleet bookings)"""
+        serializer = BookingBatchSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+        created, errors = serializer.save()
         return Response({
-            'available': not overlapping and slot.is_available,
-            'slot_id': slot.id,
-            'slot_number': slot.slot_number
-        })
+            'created': BookingSerializer(created, many=True).data,
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """Book whichever slot of a parking space is free for the window"""
+        serializer = BookingAllocateSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        booking = serializer.save()
+        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the bookings on the user's parking spaces as CSV or NDJSON"""
+        serializer = BookingExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        file_format = data['file_format']
+        rows = exports.owner_bookings(
+            request.user,
+            start_date=data.get('start_date'),
+            end_date=data.get('end_date'),
+            statuses=data.get('status'),
+        )
+        content = exports.STREAMERS[file_format](rows)
+        if isinstance(request._request, ASGIRequest):
+            # Django would read a sync iterator into a list before sending it
+            content = exports.aiter_chunks(content)
+        response = StreamingHttpResponse(content, content_type=exports.CONTENT_TYPES[file_format])
+        filename = f"bookings-{timezone.localdate():%Y%m%d}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def search_parking(request):
+@async_api_view(['GET'])
+async def search_parking(request):
     """Search for available parking spaces"""
     serializer = ParkingSearchSerializer(data=request.GET)
     if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     data = serializer.validated_data
-    queryset = ParkingSpace.objects.filter(is_active=True)
     
-    # Location-based filtering
-    if data.get('latitude') and data.get('longitude'):
+    # Cached per region around the search point; nearest searches can reach
+    # any distance, so they depend on every region
+    scopes = response_cache.region_scopes(None)
+    if data.get('latitude') is not None and not data.get('nearest'):
+        scopes = response_cache.scopes_for_radius(
+            float(data['latitude']), float(data['longitude']), data.get('radius', 5.0)
+        )
+    entry = await response_cache.CachedResponse.acreate('search', data, scopes)
+    return await entry.arespond(request, lambda: _search_results(data))
+
+async def _search_results(data):
+    queryset = ParkingSpace.objects.with_slot_counts().filter(is_active=True)
+    
+    # Location-based filtering: geohash-indexed prefilter, exact haversine distance
+    lat = lng = None
+    if data.get('latitude') is not None and data.get('longitude') is not None:
         lat = float(data['latitude'])
         lng = float(data['longitude'])
-        radius = data.get('radius', 5.0)
-        
-        # Calculate distance using Haversine formula approximation
-        lat_range = radius / 111.0  # 1 degree latitude ≈ 111 km
-        lng_range = radius / (111.0 * math.cos(math.radians(lat)))
-        
-        queryset = queryset.filter(
-            latitude__range=[lat - lat_range, lat + lat_range],
-            longitude__range=[lng - lng_range, lng + lng_range]
-        )
+        if not data.get('nearest'):
+            queryset = queryset.within_radius(lat, lng, data.get('radius', 5.0))
     
     # Price filtering
     if data.get('max_hourly_rate'):
@@ -200,52 +257,76 @@ def search_parking(request):
     end_time = data.get('end_time')
     slot_type = data.get('slot_type')
     
-    if start_time and end_time:
-        # Find spaces with available slots during the requested time
-        available_spaces = []
-        for space in queryset:
-            slots_query = space.parking_slots.filter(is_available=True)
-            if slot_type:
-                slots_query = slots_query.filter(slot_type=slot_type)
-            
-            for slot in slots_query:
-                overlapping = Booking.objects.filter(
-                    parking_slot=slot,
-                    status__in=['confirmed', 'active'],
-                    start_time__lt=end_time,
-                    end_time__gt=start_time
-                ).exists()
-                
-                if not overlapping:
-                    available_spaces.append(space)
-                    break
-        
-        queryset = queryset.filter(id__in=[s.id for s in available_spaces])
+    nearest = lat is not None and data.get('nearest')
+    # The k nearest must be counted among spaces with a free slot, and a search
+    # without a location could build bitmaps for every active space, so both
+    # filter in SQL; radius searches answer from the availability bitmaps
+    bitmaps = lat is not None and not nearest
+    if start_time and end_time and not bitmaps:
+        queryset = queryset.with_free_slot_count(
+            start_time, end_time, slot_type=slot_type
+        ).filter(free_slot_count__gt=0)
     
-    serializer = ParkingSpaceSerializer(queryset, many=True)
-    return Response(serializer.data)
+    # k-nearest mode: the closest matches regardless of radius
+    if nearest:
+        queryset = await queryset.anearest(lat, lng, data['nearest'])
+    
+    spaces = [space async for space in queryset]
+    if start_time and end_time and bitmaps:
+        # Free slots per space from the availability bitmaps; keep spaces with at least one
+        counts = await sync_to_async(availability.free_slot_counts)(
+            [space.pk for space in spaces], start_time, end_time, slot_type=slot_type
+        )
+        spaces = [space for space in spaces if counts[space.pk]]
+        for space in spaces:
+            space.free_slot_count = counts[space.pk]
+    if data['quote']:
+        for space in spaces:
+            space.quoted_total = tariffs.quote_space(
+                space, start_time, end_time, slot_type or 'standard'
+            ).total_amount
+    return ParkingSpaceSearchResultSerializer(spaces, many=True).data
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def map_data(request):
+@async_api_view(['GET'])
+async def map_data(request):
     """Get parking spaces data for map display"""
-    bounds = request.GET.get('bounds', '').split(',')
-    
-    queryset = ParkingSpace.objects.filter(is_active=True)
+    try:
+        zoom = int(request.GET['zoom']) if 'zoom' in request.GET else None
+    except ValueError:
+        return json_response(
+            {'error': 'zoom must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
+    bounds = request.GET.get('bounds', '').split(',')
     if len(bounds) == 4:
         try:
-            south, west, north, east = map(float, bounds)
-            queryset = queryset.filter(
-                latitude__range=[south, north],
-                longitude__range=[west, east]
-            )
+            bounds = tuple(map(float, bounds))
         except ValueError:
-            pass
+            bounds = None
+    else:
+        bounds = None
+    
+    # Zoom only matters when it selects clusters, so leave it out of the key otherwise
+    if bounds is None or (zoom is not None and zoom > clustering.CLUSTER_MAX_ZOOM):
+        zoom = None
+    scopes = response_cache.scopes_for_bounds(*bounds) if bounds else response_cache.region_scopes(None)
+    entry = await response_cache.CachedResponse.acreate('map', {'bounds': bounds, 'zoom': zoom}, scopes)
+    return await entry.arespond(request, lambda: _map_markers(bounds, zoom))
+
+async def _map_markers(bounds, zoom):
+    queryset = ParkingSpace.objects.with_slot_counts().filter(is_active=True)
+    
+    if bounds:
+        queryset = queryset.within_bounds(*bounds)
+        # Zoomed-out views get cached tile clusters instead of one marker per space
+        # (tile cache reads and the grouped query together in one thread hop)
+        if zoom is not None:
+            return await sync_to_async(clustering.get_clusters)(*bounds, zoom)
     
     # Return simplified data for map markers
     map_data = []
-    for space in queryset:
+    async for space in queryset:
         map_data.append({
             'id': space.id,
             'name': space.name,
@@ -257,49 +338,121 @@ def map_data(request):
             'address': space.address
         })
     
-    return Response(map_data)
+    return map_data
+
+@async_api_view(['GET'])
+async def slot_availability(request, pk):
+    """Check availability of a parking slot"""
+    slot = await ParkingSlot.objects.only(
+        'id', 'slot_number', 'is_available', 'parking_space_id'
+    ).filter(pk=pk).afirst()
+    if slot is None:
+        return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    start_time = request.query_params.get('start_time')
+    end_time = request.query_params.get('end_time')
+    
+    if not start_time or not end_time:
+        return json_response(
+            {'error': 'start_time and end_time parameters required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+    except ValueError:
+        return json_response(
+            {'error': 'Invalid datetime format'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if start_dt >= end_dt:
+        return json_response(
+            {'error': 'end_time must be after start_time'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if timezone.is_naive(start_dt):
+        start_dt = timezone.make_aware(start_dt)
+    if timezone.is_naive(end_dt):
+        end_dt = timezone.make_aware(end_dt)
+    
+    # The slot's own occupancy intervals (two bisections); only available slots are ever free
+    is_free = slot.is_available and await sync_to_async(occupancy.is_slot_free)(
+        slot.id, start_dt, end_dt
+    )
+    
+    return json_response({
+        'available': is_free,
+        'slot_id': slot.id,
+        'slot_number': slot.slot_number
+    })
+
+@async_api_view(['GET'])
+async def live_feed(request):
+    """
+    Server-sent availability events for spaces (?space=<id>, repeatable)
+    and/or a map region (?bounds=south,west,north,east). Resumes after the
+    Last-Event-ID header (or ?last_event_id=) when the client reconnects.
+    """
+    if not isinstance(request._request, ASGIRequest):
+        # A WSGI worker would be held for the whole stream
+        return json_response(
+            {'error': 'The live feed is only served by the ASGI application'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    
+    try:
+        topics = {live.space_topic(int(space_id)) for space_id in request.GET.getlist('space')}
+    except ValueError:
+        return json_response({'error': 'space must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if request.GET.get('bounds'):
+        try:
+            south, west, north, east = map(float, request.GET['bounds'].split(','))
+        except ValueError:
+            return json_response(
+                {'error': 'bounds must be south,west,north,east'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        topics |= live.topics_for_bounds(south, west, north, east)
+    if not topics:
+        return json_response(
+            {'error': 'space or bounds parameter required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    # The broker may talk to Redis, so subscribe off the event loop
+    subscription, backlog = await sync_to_async(live.broker.subscribe)(
+        topics, last_event_id, asyncio.get_running_loop()
+    )
+    response = StreamingHttpResponse(subscription.stream(backlog), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def quote_prices(request):
+    """Price a list of (space, window) pairs"""
+    serializer = QuoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    quotes, errors = serializer.quotes()
+    return Response({
+        'quotes': [
+            {'index': index, **QuoteResultSerializer(quotes[index]).data} for index in sorted(quotes)
+        ],
+        'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+    }, status=status.HTTP_200_OK if quotes else status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get dashboard statistics for the current user"""
-    user = request.user
-    
-    # Owner stats
-    user_spaces = ParkingSpace.objects.filter(owner=user)
-    total_spaces = user_spaces.count()
-    total_slots = sum(space.total_slots for space in user_spaces)
-    available_slots = sum(space.available_slots for space in user_spaces)
-    
-    # Booking stats
-    user_bookings = Booking.objects.filter(
-        parking_slot__parking_space__owner=user
-    )
-    active_bookings = user_bookings.filter(status__in=['confirmed', 'active']).count()
-    
-    today = timezone.now().date()
-    today_bookings = user_bookings.filter(start_time__date=today).count()
-    
-    # Revenue stats
-    total_revenue = user_bookings.filter(
-        status='completed'
-    ).aggregate(Sum('paid_amount'))['paid_amount__sum'] or Decimal('0.00')
-    
-    this_month = timezone.now().replace(day=1)
-    monthly_revenue = user_bookings.filter(
-        status='completed',
-        created_at__gte=this_month
-    ).aggregate(Sum('paid_amount'))['paid_amount__sum'] or Decimal('0.00')
-    
-    stats_data = {
-        'total_spaces': total_spaces,
-        'total_slots': total_slots,
-        'available_slots': available_slots,
-        'active_bookings': active_bookings,
-        'today_bookings': today_bookings,
-        'total_revenue': total_revenue,
-        'monthly_revenue': monthly_revenue
-    }
+    stats_data = parking_stats.owner_dashboard_stats(request.user)
     
     serializer = DashboardStatsSerializer(stats_data)
     return Response(serializer.data)
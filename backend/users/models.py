@@ -37,6 +37,10 @@ class CustomUser(AbstractUser):
         db_table = 'custom_user'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(fields=['created_at', 'id'], name='user_created'),
+        ]
     
     def __str__(self):
         return f"{self.email} ({self.get_user_type_display()})"
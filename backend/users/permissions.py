@@ -0,0 +1,12 @@
+from rest_framework import permissions
+
+class IsOwnerOrReadOnly(permissions.BasePermission):
+    """Custom permission to only allow users to edit their own account or profile."""
+    
+    def has_object_permission(self, request, view, obj):
+        # Read permissions are allowed to authenticated users
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        
+        # Profiles belong to their user; users belong to themselves
+        return getattr(obj, 'user', obj) == request.user
@@ -75,10 +75,10 @@ class UserLoginSerializer(serializers.Serializer):
                 msg = 'Unable to log in with provided credentials.'
                 raise serializers.ValidationError(msg, code='authorization')
             
-            # Authenticate with username (since Django uses username field)
+            # Authenticate with the USERNAME_FIELD value (the email for CustomUser)
             user = authenticate(
                 request=self.context.get('request'),
-                username=user.username,
+                username=user.get_username(),
                 password=password
             )
             
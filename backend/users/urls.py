@@ -6,15 +6,17 @@ app_name = 'users'
 
 urlpatterns = [
     # User registration and authentication
-    path('register/', views.RegisterView.as_view(), name='register'),
-    path('login/', views.LoginView.as_view(), name='login'),
+    path('register/', views.UserRegistrationView.as_view(), name='register'),
+    path('login/', views.UserLoginView.as_view(), name='login'),
     path('logout/', views.LogoutView.as_view(), name='logout'),
     
     # User profile management
     path('profile/', views.UserProfileView.as_view(), name='profile'),
-    path('profile/update/', views.UpdateProfileView.as_view(), name='update_profile'),
+    path('profile/update/', views.UserProfileDetailView.as_view(), name='update_profile'),
     
     # User management endpoints
-    path('me/', views.CurrentUserView.as_view(), name='current_user'),
-    path('change-password/', views.ChangePasswordView.as_view(), name='change_password'),
+    path('', views.UserListView.as_view(), name='user_list'),
+    path('me/', views.user_profile_detail, name='current_user'),
+    path('dashboard/', views.dashboard, name='dashboard'),
+    path('change-password/', views.PasswordChangeView.as_view(), name='change_password'),
 ]
@@ -184,8 +184,10 @@ class UserListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
+        # The serializer nests the profile, so join it instead of a query per user
+        queryset = CustomUser.objects.select_related('profile')
         # Only admins can see all users
         if self.request.user.user_type == 'admin':
-            return CustomUser.objects.all()
+            return queryset
         # Regular users can only see their own profile
-        return CustomUser.objects.filter(id=self.request.user.id)
+        return queryset.filter(id=self.request.user.id)